@@ -5,6 +5,7 @@ Uses in-memory session cache for performance
 """
 
 import asyncio
+import hashlib
 import time
 import secrets
 import json
@@ -119,6 +120,20 @@ class SessionManager:
         self._save_sessions()
         return session
     
+    def get_active_sessions(self, active_within_minutes: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Return sessions used within the given window, keyed by token.
+        Read-only: does not touch last_accessed, so background jobs never keep sessions alive.
+        """
+        now = self._now()
+        window = min(timedelta(minutes=active_within_minutes), self.session_ttl)
+        active: Dict[str, Dict[str, Any]] = {}
+        for token, session in list(self.sessions.items()):
+            last_accessed = self._deserialize_datetime(session.get('last_accessed'))
+            if now - last_accessed <= window:
+                active[token] = dict(session)
+        return active
+
     def delete_session(self, session_token: str) -> bool:
         """Delete a session"""
         if session_token in self.sessions:
@@ -370,6 +385,57 @@ class AttendanceService:
             print(f"Exception fetching absence details: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    def _request_attendance(self, student_id: str, cookies: Dict) -> requests.Response:
+        """Blocking request for the absences list page"""
+        url = f"{self.ATTENDANCE_ENDPOINT}?studentId={student_id}"
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Referer": f"{self.BASE_URL}/Home",
+        }
+        return requests.get(
+            url,
+            cookies=cookies,
+            headers=headers,
+            timeout=self.REQUEST_TIMEOUT
+        )
+
+    def _is_login_page(self, html_content: str) -> bool:
+        """Portal answers expired sessions with its login/challenge page and HTTP 200."""
+        lowered_html = (html_content or '').lower()
+        return (
+            '__requestverificationtoken' in lowered_html
+            or '/account/login' in lowered_html
+            or 'tempids-su.awrosoft.com' in lowered_html
+            or 'identityserver' in lowered_html
+        )
+
+    def attendance_fingerprint(self, html_content: str) -> str:
+        """Stable digest of the visible attendance data (ignores scripts, tokens and markup churn)"""
+        soup = BeautifulSoup(html_content or '', 'html.parser')
+        for element in soup(['script', 'style', 'input', 'meta', 'link']):
+            element.decompose()
+        tables = soup.find_all('table')
+        if tables:
+            text = ' '.join(table.get_text(' ', strip=True) for table in tables)
+        else:
+            text = soup.get_text(' ', strip=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    async def fetch_attendance_html(self, student_id: str, cookies: Dict) -> Optional[str]:
+        """
+        Fetch attendance HTML for background jobs (no session token, no session side effects)
+        Returns None when the portal did not return real attendance data
+        """
+        try:
+            response = await asyncio.to_thread(self._request_attendance, student_id, cookies)
+        except Exception as e:
+            print(f"Exception fetching attendance in background: {str(e)}")
+            return None
+        if response.status_code != 200 or self._is_login_page(response.text):
+            return None
+        return response.text
+
     async def get_attendance(self, session_token: str) -> Dict[str, Any]:
         """
         Fetch attendance data using cached session
@@ -388,34 +454,13 @@ class AttendanceService:
         
         try:
             # Fast async HTTP request using requests library with asyncio.to_thread
-            def fetch_attendance():
-                url = f"{self.ATTENDANCE_ENDPOINT}?studentId={student_id}"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                    "Referer": f"{self.BASE_URL}/Home",
-                }
-                response = requests.get(
-                    url,
-                    cookies=cookies,
-                    headers=headers,
-                    timeout=self.REQUEST_TIMEOUT
-                )
-                return response
-            
-            response = await asyncio.to_thread(fetch_attendance)
+            response = await asyncio.to_thread(self._request_attendance, student_id, cookies)
             
             if response.status_code == 200:
                 html_content = response.text
 
                 # Guard against false-positive success where portal returns login/challenge HTML with HTTP 200.
-                lowered_html = html_content.lower()
-                if (
-                    '__requestverificationtoken' in lowered_html
-                    or '/account/login' in lowered_html
-                    or 'tempids-su.awrosoft.com' in lowered_html
-                    or 'identityserver' in lowered_html
-                ):
+                if self._is_login_page(html_content):
                     self.session_manager.delete_session(session_token)
                     return {
                         'success': False,
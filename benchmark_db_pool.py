@@ -0,0 +1,121 @@
+"""
+Benchmark: per-call sqlite3.connect (rollback journal) vs pooled WAL connections
+Simulates the security middleware's per-request database work from several threads:
+    is_ip_blocked + detect_rate_limit_abuse + has_threat_log (reads) and log_visitor (write)
+
+Usage:
+    python benchmark_db_pool.py                 # 4 threads x 2000 requests
+    python benchmark_db_pool.py 8 5000          # threads, requests per thread
+"""
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from db_pool import get_pool
+
+SCHEMA = [
+    """CREATE TABLE visitor_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip_address TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        action_performed TEXT NOT NULL,
+        user_agent TEXT,
+        path TEXT,
+        username TEXT
+    )""",
+    "CREATE TABLE blacklist (id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT UNIQUE NOT NULL, reason TEXT, blocked_at TEXT NOT NULL)",
+    "CREATE TABLE threat_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT NOT NULL, threat_type TEXT NOT NULL, details TEXT, detected_at TEXT NOT NULL, action_taken TEXT)",
+    "CREATE INDEX idx_visitor_logs_ip ON visitor_logs(ip_address)",
+    "CREATE INDEX idx_blacklist_ip ON blacklist(ip_address)",
+]
+
+READ_BLOCKED = "SELECT 1 FROM blacklist WHERE ip_address = ?"
+READ_RATE = "SELECT COUNT(*) FROM visitor_logs WHERE ip_address = ? AND datetime(timestamp) > datetime('now', '-1 minutes')"
+READ_THREAT = "SELECT 1 FROM threat_logs WHERE ip_address = ? LIMIT 1"
+WRITE_VISIT = "INSERT INTO visitor_logs (ip_address, timestamp, action_performed, user_agent, path) VALUES (?, ?, ?, ?, ?)"
+
+
+def create_db(path: Path) -> None:
+    with sqlite3.connect(path) as conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany(WRITE_VISIT, [
+            (f"10.0.{i % 250}.{i % 200}", datetime.now().isoformat(), "PAGE_VIEW", "Mozilla/5.0", "/")
+            for i in range(20000)
+        ])
+        conn.commit()
+
+
+def request_per_call_connect(path: Path, ip: str) -> None:
+    """Current pattern: a fresh connection for every helper call"""
+    with sqlite3.connect(path) as conn:
+        conn.execute(READ_BLOCKED, (ip,)).fetchone()
+    with sqlite3.connect(path) as conn:
+        conn.execute(READ_RATE, (ip,)).fetchone()
+    with sqlite3.connect(path) as conn:
+        conn.execute(READ_THREAT, (ip,)).fetchone()
+    with sqlite3.connect(path) as conn:
+        conn.execute(WRITE_VISIT, (ip, datetime.now().isoformat(), "PAGE_VIEW", "Mozilla/5.0", "/"))
+        conn.commit()
+
+
+def request_pooled(path: Path, ip: str) -> None:
+    """Pooled pattern: the thread's persistent WAL connection, writes via the writer lock"""
+    pool = get_pool(path)
+    with pool.read() as conn:
+        conn.execute(READ_BLOCKED, (ip,)).fetchone()
+    with pool.read() as conn:
+        conn.execute(READ_RATE, (ip,)).fetchone()
+    with pool.read() as conn:
+        conn.execute(READ_THREAT, (ip,)).fetchone()
+    with pool.write() as conn:
+        conn.execute(WRITE_VISIT, (ip, datetime.now().isoformat(), "PAGE_VIEW", "Mozilla/5.0", "/"))
+
+
+def run(label: str, handler, path: Path, threads: int, per_thread: int) -> float:
+    errors = []
+
+    def worker(worker_id: int) -> None:
+        for i in range(per_thread):
+            try:
+                handler(path, f"10.1.{worker_id}.{i % 200}")
+            except sqlite3.Error as exc:
+                errors.append(str(exc))
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total = threads * per_thread
+    rps = total / elapsed
+    print(f"{label:<28} {total:>7} requests in {elapsed:6.2f}s = {rps:8.0f} req/s  (errors: {len(errors)})")
+    return rps
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = Path(tmp) / "before.db"
+        after_path = Path(tmp) / "after.db"
+        create_db(before_path)
+        create_db(after_path)
+
+        print(f"Mixed load: {threads} threads, 3 reads + 1 write per request")
+        print("=" * 80)
+        before = run("per-call connect (DELETE)", request_per_call_connect, before_path, threads, per_thread)
+        after = run("pooled WAL connections", request_pooled, after_path, threads, per_thread)
+        print("=" * 80)
+        print(f"Speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
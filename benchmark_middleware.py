@@ -0,0 +1,152 @@
+"""
+Benchmark: per-request middleware overhead and download throughput,
+the old pair of @app.middleware("http") (BaseHTTPMiddleware) layers vs
+main.SecurityMiddleware (pure ASGI). Both stacks run the same checks
+(_screen_request) and headers (_apply_security_headers), so the difference
+is the middleware plumbing plus the second client IP resolution.
+Requests are driven straight through the ASGI interface (no HTTP client).
+
+Run from a scratch directory: importing main creates data/ and static/ in the cwd.
+
+Usage:
+    python benchmark_middleware.py              # 5,000 requests per path, 32 MiB download
+    python benchmark_middleware.py 20000 128
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("PORTAL_USERNAME", "benchmark")
+os.environ.setdefault("PORTAL_PASSWORD", "benchmark")
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import FileResponse, PlainTextResponse
+from starlette.routing import Route
+
+import main
+
+USER_AGENT = "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36"
+
+
+async def legacy_security_middleware(request, call_next):
+    """Old security_middleware: resolve IP, call through, add headers"""
+    main.get_real_client_ip(request)
+    response = await call_next(request)
+    main._apply_security_headers(request.url.path, response.status_code, response.headers)
+    return response
+
+
+async def legacy_visitor_tracking_middleware(request, call_next):
+    """Old visitor_tracking_middleware: resolve IP again, screen, call through"""
+    client_ip = main.get_real_client_ip(request)
+    early_response = await main._screen_request(request, client_ip)
+    if early_response is not None:
+        return early_response
+    return await call_next(request)
+
+
+def build_apps(payload: Path):
+    async def ping(request):
+        return PlainTextResponse("ok")
+
+    async def download(request):
+        return FileResponse(payload, media_type="application/pdf")
+
+    routes = [Route("/api/ping", ping), Route("/check-attendance", ping), Route("/api/download/payload.pdf", download)]
+    legacy = Starlette(routes=routes, middleware=[
+        # Same order as the decorators produced: visitor tracking outermost
+        Middleware(BaseHTTPMiddleware, dispatch=legacy_visitor_tracking_middleware),
+        Middleware(BaseHTTPMiddleware, dispatch=legacy_security_middleware),
+    ])
+    asgi = Starlette(routes=routes, middleware=[Middleware(main.SecurityMiddleware)])
+    return legacy, asgi
+
+
+async def request(app, path: str, client_ip: str) -> int:
+    """One GET through the ASGI app; returns the number of body bytes received"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench.local"), (b"user-agent", USER_AGENT.encode())],
+        "client": (client_ip, 50000), "server": ("bench.local", 80), "state": {},
+    }
+    request_sent = False
+    received = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return received
+
+
+async def per_request(app, path: str, count: int):
+    samples = []
+    for i in range(count):
+        client_ip = f"198.51.{(i >> 8) & 255}.{i & 255}"
+        start = time.perf_counter()
+        await request(app, path, client_ip)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], statistics.fmean(samples)
+
+
+async def throughput(app, size: int, rounds: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        received = await request(app, "/api/download/payload.pdf", "198.51.100.1")
+        if received != size:
+            raise RuntimeError(f"Download returned {received} of {size} bytes")
+    return size * rounds / (time.perf_counter() - start) / (1024 * 1024)
+
+
+async def run(count: int, megabytes: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        payload = Path(temp_dir) / "payload.pdf"
+        payload.write_bytes(os.urandom(1024 * 1024) * megabytes)
+        legacy, asgi = build_apps(payload)
+
+        print(f"{count:,} requests per path, latency in microseconds; {megabytes} MiB download x5")
+        print("=" * 78)
+        for path, label in (("/api/ping", "unmonitored path"), ("/check-attendance", "monitored path (logging + threat checks)")):
+            await per_request(legacy, path, 200)  # warm-up
+            await per_request(asgi, path, 200)
+            old = await per_request(legacy, path, count)
+            new = await per_request(asgi, path, count)
+            print(label)
+            print(f"  2x BaseHTTPMiddleware: p50 {old[0]:7.1f}  p99 {old[1]:7.1f}  mean {old[2]:7.1f}")
+            print(f"  SecurityMiddleware:    p50 {new[0]:7.1f}  p99 {new[1]:7.1f}  mean {new[2]:7.1f}")
+            print(f"  p50 speedup: {old[0] / max(new[0], 1e-6):.1f}x")
+        size = megabytes * 1024 * 1024
+        old_mbps = await throughput(legacy, size)
+        new_mbps = await throughput(asgi, size)
+        print("download throughput (FileResponse, 64 KiB chunks)")
+        print(f"  2x BaseHTTPMiddleware: {old_mbps:8.0f} MiB/s")
+        print(f"  SecurityMiddleware:    {new_mbps:8.0f} MiB/s   ({new_mbps / max(old_mbps, 1e-6):.1f}x)")
+        print("=" * 78)
+
+
+def main_cli():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    asyncio.run(run(count, megabytes))
+
+
+if __name__ == "__main__":
+    main_cli()
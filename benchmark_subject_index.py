@@ -0,0 +1,97 @@
+"""
+Benchmark: subject inference per lecture filename, legacy keyword scan + difflib loop
+vs subject_index.SubjectIndex (cold, then memoized), on a synthetic filename corpus.
+Also checks that both pick the same subject for every filename.
+
+Usage:
+    python benchmark_subject_index.py            # 5,000 filenames
+    python benchmark_subject_index.py 20000
+"""
+import difflib
+import random
+import re
+import sys
+import time
+
+from subject_index import SUBJECT_KEYWORDS, SubjectIndex
+
+WORDS = [
+    "lecture", "week", "chapter", "slides", "lab", "final", "midterm", "review", "notes",
+    "data", "database", "design", "software", "math", "graph", "intro", "structures",
+    "programming", "object", "analysis", "communication", "principles", "spring", "fall",
+]
+SUBJECT_LIKE = [
+    "Data Structures & Algorithms", "Numerical Analisys", "Object Orientd Programing",
+    "Softwar Desgin UML", "Combinatoric Graph", "Mathematics 3", "Data Comunication",
+    "Database Principals", "Software Engineering Principle", "Intro OOP",
+]
+
+
+def legacy_infer(filename: str):
+    """Copy of main._infer_subject_from_filename before subject_index.py"""
+    name = filename.lower()
+    for subject, keywords in SUBJECT_KEYWORDS.items():
+        for kw in keywords:
+            if kw in name:
+                return subject
+
+    normalized_name = re.sub(r'[^a-z0-9]+', ' ', name).strip()
+    if normalized_name:
+        best_match = None
+        best_score = 0.0
+        for candidate in SUBJECT_KEYWORDS:
+            candidate_norm = re.sub(r'[^a-z0-9]+', ' ', candidate.lower()).strip()
+            score = 0.0
+            if candidate_norm and normalized_name:
+                score = difflib.SequenceMatcher(None, normalized_name, candidate_norm).ratio()
+            if score > best_score:
+                best_score = score
+                best_match = candidate
+        if best_match and best_score >= 0.55:
+            return best_match
+    return None
+
+
+def build(count, rng):
+    names = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            base = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        elif kind < 0.8:
+            base = rng.choice(SUBJECT_LIKE) + " " + rng.choice(WORDS)
+        else:
+            base = rng.choice(list(SUBJECT_KEYWORDS)) + " lecture " + str(rng.randint(1, 14))
+        names.append(f"{base} {i}.pdf".replace(" ", rng.choice([" ", "_", "-"])))
+    return names
+
+
+def measure(fn, names):
+    start = time.perf_counter()
+    results = [fn(name) for name in names]
+    return (time.perf_counter() - start) / len(names) * 1e6, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    names = build(count, random.Random(7))
+    index = SubjectIndex(memo_size=count)
+
+    print(f"{count:,} filenames, inference cost per filename in microseconds")
+    print("=" * 70)
+    old_us, old_results = measure(legacy_infer, names)
+    cold_us, new_results = measure(lambda name: index.infer(name)[0], names)
+    warm_us, _ = measure(lambda name: index.infer(name)[0], names)
+    mismatches = sum(1 for a, b in zip(old_results, new_results) if a != b)
+    inferred = sum(1 for r in new_results if r)
+    print(f"{inferred:,} filenames matched a subject, {mismatches} mismatches vs legacy")
+    print(f"  legacy scan + difflib: {old_us:8.1f}")
+    print(f"  SubjectIndex (cold):   {cold_us:8.1f}   ({old_us / max(cold_us, 1e-6):.1f}x)")
+    print(f"  SubjectIndex (memo):   {warm_us:8.1f}   ({old_us / max(warm_us, 1e-6):.1f}x)")
+    print("=" * 70)
+    stats = index.stats()
+    print(f"SequenceMatcher calls: {stats['ratio_calls']:,}, pruned by character bounds: {stats['pruned']:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Benchmark: per-request cost of the middleware threat checks, legacy detect_* chain
+vs threat_rules.ThreatRuleEngine, on a benign and a malicious request corpus.
+Also checks that both report the same threat type for every request.
+
+Usage:
+    python benchmark_threat_rules.py            # 20,000 requests per corpus
+    python benchmark_threat_rules.py 5000
+"""
+import random
+import statistics
+import sys
+import time
+
+from threat_rules import HEADER_SCAN_SKIP, ThreatRuleEngine
+
+BROWSER_HEADERS = [
+    ("host", "swiftsync.example.com"),
+    ("user-agent", "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36"),
+    ("accept", "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8"),
+    ("accept-language", "ku,en-US;q=0.9,en;q=0.8"),
+    ("accept-encoding", "gzip, deflate, br"),
+    ("referer", "https://swiftsync.example.com/"),
+    ("cookie", "session_token=3f9a1c7e5b2d4f6a8c0e1b3d5f7a9c2e; theme=dark"),
+    ("sec-ch-ua-platform", "\"Android\""),
+    ("sec-fetch-site", "same-origin"),
+    ("x-forwarded-for", "203.0.113.24"),
+]
+
+BENIGN_PATHS = [
+    ("/", {}),
+    ("/", {"lang": "ku"}),
+    ("/check-attendance", {"username": "stu20231045"}),
+    ("/check-attendance", {"username": "stu20220311", "semester": "Spring Semester"}),
+    ("/admin-portal", {"admin_key": "k3y-9f8e7d6c5b4a"}),
+    ("/", {"q": "Data Structures and Algorithms week 5"}),
+]
+
+MALICIOUS = [
+    ("/", {"id": "1' OR '1'='1"}, None),
+    ("/", {"q": "1 UNION SELECT password FROM users"}, None),
+    ("/", {"q": "%2527%20or%201%3D1"}, None),
+    ("/", {"q": "<script>alert(1)</script>"}, None),
+    ("/", {"q": "&lt;img src=x onerror=alert(1)&gt;"}, None),
+    ("/", {"next": "javascript:alert(document.cookie)"}, None),
+    ("/check-attendance/..%252f..%252fetc/passwd", {}, None),
+    ("/check-attendance/../../etc/passwd", {}, None),
+    ("/", {"host": "127.0.0.1; cat /etc/passwd"}, None),
+    ("/", {"f": "$(whoami)"}, None),
+    ("/", {}, "sqlmap/1.7.2#stable (https://sqlmap.org)"),
+    ("/", {}, "curl/8.4.0"),
+    ("/", {}, None),  # header injection, see build()
+]
+
+
+# Legacy detectors, copied from database.py before threat_rules.py
+
+def legacy_detect_sql_injection(query_string: str) -> bool:
+    """
+    Detect potential SQL injection attempts with bypass prevention
+    Returns True if suspicious patterns found
+    """
+    import urllib.parse
+    
+    # Decode URL encoding to prevent bypass
+    try:
+        decoded = urllib.parse.unquote(query_string)
+        # Double decode to catch double encoding
+        decoded = urllib.parse.unquote(decoded)
+    except:
+        decoded = query_string
+    
+    # Remove spaces, tabs, newlines to prevent obfuscation
+    normalized = decoded.replace(' ', '').replace('\t', '').replace('\n', '').replace('\r', '')
+    
+    sql_patterns = [
+        "'or'1'='1",
+        "'or1=1",
+        "\"or\"1\"=\"1",
+        "or1=1",
+        "and1=1",
+        "and'1'='1",
+        "unionselect",
+        "droptable",
+        "';drop",
+        "insertinto",
+        "deletefrom",
+        "updateset",
+        "--",
+        "/*",
+        "*/",
+        "xp_cmdshell",
+        "exec(",
+        "execute(",
+        "sp_executesql",
+        "information_schema",
+        "sysobjects",
+        "syscolumns",
+        "benchmark(",
+        "sleep(",
+        "waitfor",
+        "pg_sleep",
+        "and1=1",
+        "admin'--",
+        "'=''",
+        "having1=1",
+        "groupby",
+    ]
+    query_lower = query_string.lower()
+    normalized_lower = normalized.lower()
+    return any(pattern.lower() in query_lower or pattern.lower() in normalized_lower for pattern in sql_patterns)
+
+
+def legacy_detect_xss_attack(input_string: str) -> bool:
+    """
+    Detect potential XSS (Cross-Site Scripting) attempts with encoding bypass prevention
+    Returns True if suspicious patterns found
+    """
+    import html
+    import urllib.parse
+    
+    # Decode HTML entities and URL encoding
+    try:
+        decoded = html.unescape(input_string)
+        decoded = urllib.parse.unquote(decoded)
+        decoded = urllib.parse.unquote(decoded)  # Double decode
+    except:
+        decoded = input_string
+    
+    # Remove common obfuscation characters
+    normalized = decoded.replace(' ', '').replace('\t', '').replace('\n', '').replace('\r', '').replace('\x00', '')
+    
+    xss_patterns = [
+        "<script",
+        "</script",
+        "javascript:",
+        "onerror=",
+        "onload=",
+        "onclick=",
+        "onmouseover=",
+        "onfocus=",
+        "<iframe",
+        "<embed",
+        "<object",
+        "eval(",
+        "alert(",
+        "confirm(",
+        "prompt(",
+        "document.cookie",
+        "window.location",
+        "fromcharcode",
+        "string.fromcharcode",
+        "<svg",
+        "<img",
+        "src=",
+        "href=",
+        "javascript",
+        "vbscript:",
+        "data:text/html",
+        "expression(",
+        "<base",
+        "<meta",
+    ]
+    input_lower = input_string.lower()
+    decoded_lower = decoded.lower()
+    normalized_lower = normalized.lower()
+    return any(pattern.lower() in input_lower or pattern.lower() in decoded_lower or pattern.lower() in normalized_lower for pattern in xss_patterns)
+
+
+def legacy_detect_suspicious_user_agent(user_agent: str) -> bool:
+    """
+    Detect known malicious or suspicious user agents (comprehensive bot detection)
+    Returns True if suspicious
+    """
+    if not user_agent or len(user_agent) < 10:
+        return True  # No or very short user agent is suspicious
+    
+    suspicious_agents = [
+        "sqlmap",
+        "nikto",
+        "masscan",
+        "nmap",
+        "acunetix",
+        "metasploit",
+        "dirbuster",
+        "havij",
+        "w3af",
+        "webscarab",
+        "arachni",
+        "burpsuite",
+        "burp suite",
+        "zap",
+        "owasp",
+        "scanner",
+        "python-requests",
+        "curl",
+        "wget",
+        "scrapy",
+        "bot",
+        "crawler",
+        "spider",
+        "scraper",
+        "http.rb",
+        "mechanize",
+        "attack",
+        "hack",
+        "exploit",
+        "injection",
+        "probe",
+        "test",
+        "scan",
+    ]
+    user_agent_lower = user_agent.lower()
+    return any(agent in user_agent_lower for agent in suspicious_agents)
+
+
+def legacy_detect_path_traversal(path: str) -> bool:
+    """
+    Detect path traversal attacks
+    Returns True if suspicious patterns found
+    """
+    import urllib.parse
+    
+    try:
+        decoded = urllib.parse.unquote(path)
+        decoded = urllib.parse.unquote(decoded)
+    except:
+        decoded = path
+    
+    traversal_patterns = [
+        "../",
+        "..\\",
+        "....//",
+        "....\\\\",
+        "%2e%2e/",
+        "%2e%2e\\",
+        "..%2f",
+        "..%5c",
+        "%252e%252e",
+        "..;",
+        "..//",
+    ]
+    
+    path_lower = path.lower()
+    decoded_lower = decoded.lower()
+    
+    return any(pattern in path_lower or pattern in decoded_lower for pattern in traversal_patterns)
+
+
+def legacy_detect_command_injection(input_string: str) -> bool:
+    """
+    Detect command injection attempts
+    Returns True if suspicious patterns found
+    """
+    import urllib.parse
+    
+    try:
+        decoded = urllib.parse.unquote(input_string)
+    except:
+        decoded = input_string
+    
+    cmd_patterns = [
+        "|",
+        "&",
+        ";",
+        "`",
+        "$(",
+        "%0a",  # newline URL encoded
+        "%0d",  # carriage return
+        "&&",
+        "||",
+        "<(",
+        ">(",
+        "${{",
+    ]
+    
+    # Check for shell commands
+    shell_commands = [
+        "bash",
+        "sh",
+        "cmd",
+        "powershell",
+        "nc ",
+        "netcat",
+        "wget ",
+        "curl ",
+        "rm ",
+        "del ",
+        "cat ",
+        "type ",
+        "ping ",
+        "whoami",
+        "chmod",
+        "chown",
+    ]
+    
+    input_lower = input_string.lower()
+    decoded_lower = decoded.lower()
+    
+    has_cmd_pattern = any(pattern in input_string or pattern in decoded for pattern in cmd_patterns)
+    has_shell_cmd = any(cmd in input_lower or cmd in decoded_lower for cmd in shell_commands)
+    
+    return has_cmd_pattern or has_shell_cmd
+
+
+def legacy_inspect(url, path, query_values, headers, user_agent):
+    """The middleware's former elif chain (rate limit excluded)"""
+    if legacy_detect_suspicious_user_agent(user_agent):
+        return "SUSPICIOUS_USER_AGENT"
+    if legacy_detect_sql_injection(url):
+        return "SQL_INJECTION_ATTEMPT"
+    if any(legacy_detect_xss_attack(str(value)) for value in query_values):
+        return "XSS_ATTACK_ATTEMPT"
+    if legacy_detect_path_traversal(path):
+        return "PATH_TRAVERSAL_ATTEMPT"
+    if any(legacy_detect_command_injection(str(value)) for value in query_values):
+        return "COMMAND_INJECTION_ATTEMPT"
+    if any(legacy_detect_xss_attack(str(value)) for key, value in headers if key.lower() not in HEADER_SCAN_SKIP):
+        return "HEADER_INJECTION_ATTEMPT"
+    return None
+
+
+def build(corpus, count, rng):
+    requests = []
+    for _ in range(count):
+        if corpus == "benign":
+            path, params = rng.choice(BENIGN_PATHS)
+            user_agent = None
+            headers = list(BROWSER_HEADERS)
+        else:
+            index = rng.randrange(len(MALICIOUS))
+            path, params, user_agent = MALICIOUS[index]
+            headers = list(BROWSER_HEADERS)
+            if index == len(MALICIOUS) - 1:
+                headers.append(("x-custom", "<svg/onload=alert(1)>"))
+        user_agent = user_agent or dict(headers)["user-agent"]
+        headers = [(k, user_agent if k == "user-agent" else v) for k, v in headers]
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        url = f"https://swiftsync.example.com{path}" + (f"?{query}" if query else "")
+        requests.append((url, path, list(params.values()), headers, user_agent))
+    return requests
+
+
+def measure(inspect, requests):
+    timings = []
+    results = []
+    for request in requests:
+        started = time.perf_counter_ns()
+        results.append(inspect(*request))
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    p50 = timings[len(timings) // 2] / 1000
+    p99 = timings[int(len(timings) * 0.99)] / 1000
+    return p50, p99, statistics.mean(timings) / 1000, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(11)
+    engine = ThreatRuleEngine()
+
+    def engine_inspect(*request):
+        match = engine.inspect_request(*request)
+        return match.threat_type if match else None
+
+    print(f"{count:,} requests per corpus, per-request threat check overhead in microseconds")
+    print("=" * 78)
+    for corpus in ("benign", "malicious"):
+        requests = build(corpus, count, rng)
+        old_p50, old_p99, old_mean, old_results = measure(legacy_inspect, requests)
+        new_p50, new_p99, new_mean, new_results = measure(engine_inspect, requests)
+        mismatches = sum(1 for a, b in zip(old_results, new_results) if a != b)
+        flagged = sum(1 for r in new_results if r)
+        print(f"{corpus} ({flagged:,} flagged, {mismatches} mismatches vs legacy)")
+        print(f"  legacy detect_* chain: p50 {old_p50:7.1f}  p99 {old_p99:7.1f}  mean {old_mean:7.1f}")
+        print(f"  ThreatRuleEngine:      p50 {new_p50:7.1f}  p99 {new_p99:7.1f}  mean {new_mean:7.1f}")
+        print(f"  p50 speedup: {old_p50 / max(new_p50, 1e-6):.1f}x")
+    print("=" * 78)
+    top = list(engine.stats()["rule_hits"].items())[:5]
+    print("Top rules:", ", ".join(f"{rule}={hits}" for rule, hits in top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: time-window queries on visitor_logs, datetime(timestamp) vs indexed ts_epoch
+Builds a visitor_logs table with 1,000,000 rows (default) spread over 30 days and
+2,000 IPs, plus one busy IP, then times the rate-limit check and the 24h stats count.
+
+Usage:
+    python benchmark_visitor_logs.py            # 1M rows
+    python benchmark_visitor_logs.py 200000     # custom row count
+"""
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytz
+
+TIMEZONE = pytz.timezone('Asia/Baghdad')
+BUSY_IP = "203.0.113.7"
+
+OLD_RATE_LIMIT = """
+    SELECT COUNT(*) FROM visitor_logs
+    WHERE ip_address = ?
+    AND datetime(timestamp) > datetime('now', '-' || ? || ' minutes')
+"""
+NEW_RATE_LIMIT = """
+    SELECT COUNT(*) FROM visitor_logs
+    WHERE ip_address = ?
+    AND ts_epoch > ?
+"""
+OLD_RECENT = "SELECT COUNT(*) FROM visitor_logs WHERE datetime(timestamp) > datetime('now', '-1 day')"
+NEW_RECENT = "SELECT COUNT(*) FROM visitor_logs WHERE ts_epoch > ?"
+
+
+def build(path: Path, count: int) -> None:
+    rng = random.Random(7)
+    now = datetime.now(TIMEZONE)
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE visitor_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ip_address TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                action_performed TEXT NOT NULL,
+                user_agent TEXT,
+                path TEXT,
+                username TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX idx_visitor_logs_ip ON visitor_logs(ip_address)")
+        batch = []
+        for i in range(count):
+            # 5% of traffic comes from one busy IP (a long-lived NAT or a scraper)
+            ip = BUSY_IP if rng.random() < 0.05 else f"10.{rng.randint(0, 7)}.{rng.randint(0, 15)}.{rng.randint(1, 15)}"
+            ts = now - timedelta(seconds=rng.randint(0, 30 * 86400))
+            batch.append((ip, ts.isoformat(), "Visit: /", "Mozilla/5.0", "/"))
+            if len(batch) >= 50000:
+                conn.executemany("INSERT INTO visitor_logs (ip_address, timestamp, action_performed, user_agent, path) VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO visitor_logs (ip_address, timestamp, action_performed, user_agent, path) VALUES (?, ?, ?, ?, ?)", batch)
+        conn.commit()
+
+
+def migrate(path: Path) -> float:
+    """Same steps as the visitor_logs_epoch migration (migrations.py) on an existing database"""
+    started = time.perf_counter()
+    with sqlite3.connect(path) as conn:
+        conn.execute("ALTER TABLE visitor_logs ADD COLUMN ts_epoch INTEGER")
+        conn.execute("UPDATE visitor_logs SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER) WHERE ts_epoch IS NULL")
+        conn.execute("CREATE INDEX idx_visitor_logs_ip_epoch ON visitor_logs(ip_address, ts_epoch)")
+        conn.execute("CREATE INDEX idx_visitor_logs_epoch ON visitor_logs(ts_epoch)")
+        conn.commit()
+    return time.perf_counter() - started
+
+
+def timed(conn, sql, params, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = conn.execute(sql, params).fetchone()[0]
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def plan(conn, sql, params):
+    return "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "visitor_logs.db"
+        print(f"Building visitor_logs with {count:,} rows...")
+        build(path, count)
+        print(f"Backfill + indexes took {migrate(path):.1f}s")
+
+        conn = sqlite3.connect(path)
+        cutoff_minute = int(time.time()) - 60
+        cutoff_day = int(time.time()) - 86400
+        cases = [
+            ("rate limit, busy IP", OLD_RATE_LIMIT, (BUSY_IP, 1), NEW_RATE_LIMIT, (BUSY_IP, cutoff_minute), 20),
+            ("rate limit, typical IP", OLD_RATE_LIMIT, ("10.1.1.1", 1), NEW_RATE_LIMIT, ("10.1.1.1", cutoff_minute), 200),
+            ("24h activity (admin stats)", OLD_RECENT, (), NEW_RECENT, (cutoff_day,), 5),
+        ]
+        print("=" * 78)
+        for label, old_sql, old_params, new_sql, new_params, repeat in cases:
+            old_ms, old_count = timed(conn, old_sql, old_params, repeat)
+            new_ms, new_count = timed(conn, new_sql, new_params, repeat)
+            print(f"{label}")
+            print(f"  datetime(timestamp): {old_ms:9.3f} ms  count={old_count:<7} plan: {plan(conn, old_sql, old_params)}")
+            print(f"  ts_epoch:            {new_ms:9.3f} ms  count={new_count:<7} plan: {plan(conn, new_sql, new_params)}")
+            print(f"  speedup: {old_ms / max(new_ms, 1e-6):.0f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,29 @@ Handles visitor logging and IP blacklist management
 """
 import sqlite3
 import os
+import hashlib
 import html
+import re
+import ipaddress
+import threading
+import time
+import zlib
 from datetime import datetime
 import pytz
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from db_pool import read_connection, write_connection
+from ip_trie import PrefixTrie, normalize_block_target, parse_ip
+from migrations import run_migrations
+from user_agents import UNKNOWN_DEVICE, decode_device, device_for_log, ua_cache
+from threat_rules import (
+    command_injection_rule,
+    path_traversal_rule,
+    sql_injection_rule,
+    user_agent_rule,
+    xss_rule,
+)
 
 # Database path
 DB_PATH = Path("data") / "lecture_sync.db"
@@ -16,6 +34,16 @@ DB_PATH = Path("data") / "lecture_sync.db"
 # Ensure data directory exists
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# Log retention: raw visitor rows -> hourly rollups -> daily rollups
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "14"))
+LOG_HOURLY_ROLLUP_DAYS = int(os.getenv("LOG_HOURLY_ROLLUP_DAYS", "90"))
+THREAT_LOG_RETENTION_DAYS = int(os.getenv("THREAT_LOG_RETENTION_DAYS", "90"))
+
+# Blocklist snapshot is reloaded at least this often (other workers may have written)
+BLOCKLIST_RECONCILE_SECONDS = int(os.getenv("BLOCKLIST_RECONCILE_SECONDS", "30"))
+# Same for the system_settings cache
+SETTINGS_RECONCILE_SECONDS = int(os.getenv("SETTINGS_RECONCILE_SECONDS", "30"))
+
 
 def _safe_text(value) -> str:
     """Return HTML-escaped text for safe rendering in admin templates."""
@@ -24,165 +52,219 @@ def _safe_text(value) -> str:
     return html.escape(str(value), quote=True)
 
 
-def init_security_tables():
-    """Initialize security tables for visitor logs and IP blacklist"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        # Create visitor_logs table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS visitor_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                action_performed TEXT NOT NULL,
-                user_agent TEXT,
-                path TEXT,
-                username TEXT
-            )
-        """)
-        
-        # Create blacklist table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS blacklist (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT UNIQUE NOT NULL,
-                reason TEXT,
-                blocked_at TEXT NOT NULL
-            )
-        """)
-        
-        # Create threat_logs table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS threat_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT NOT NULL,
-                threat_type TEXT NOT NULL,
-                details TEXT,
-                detected_at TEXT NOT NULL,
-                action_taken TEXT
-            )
-        """)
-
-        # Create identity blacklist table (username/device fingerprint)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS identity_blacklist (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                identity_type TEXT NOT NULL,
-                identity_value TEXT NOT NULL,
-                reason TEXT,
-                blocked_at TEXT NOT NULL,
-                UNIQUE(identity_type, identity_value)
-            )
-        """)
-
-        # Create system settings table (small key-value store for admin-managed flags/text).
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS system_settings (
-                setting_key TEXT PRIMARY KEY,
-                setting_value TEXT,
-                updated_at TEXT NOT NULL
-            )
-        """)
-        
-        # Create index for faster IP lookups
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_blacklist_ip 
-            ON blacklist(ip_address)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_visitor_logs_ip 
-            ON visitor_logs(ip_address)
-        """)
-
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_identity_blacklist_type_value
-            ON identity_blacklist(identity_type, identity_value)
-        """)
-
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_system_settings_updated_at
-            ON system_settings(updated_at)
-        """)
-        
-        conn.commit()
-
-
 def log_visitor(ip_address: str, action: str, user_agent: str = None, path: str = None, username: str = None):
     """Log a visitor action with optional username/student info"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        now = datetime.now(pytz.timezone('Asia/Baghdad'))
+        with write_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO visitor_logs (ip_address, timestamp, action_performed, user_agent, path, username)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (ip_address, datetime.now(pytz.timezone('Asia/Baghdad')).isoformat(), action, user_agent, path, username))
+                INSERT INTO visitor_logs (ip_address, timestamp, ts_epoch, action_performed, user_agent, path, username, device)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (ip_address, now.isoformat(), int(now.timestamp()), action, user_agent, path, username, device_for_log(user_agent)))
+            _add_visitor_totals(conn, [(ip_address, int(now.timestamp()))])
             conn.commit()
     except Exception as e:
         print(f"Error logging visitor: {e}")
 
 
-def is_ip_blocked(ip_address: str) -> bool:
-    """Check if an IP is in the blacklist (optimized for speed)"""
+def log_visitors_bulk(rows: List[tuple]) -> int:
+    """
+    Insert many visitor rows in one transaction (used by the log write-behind buffer).
+    rows: (ip_address, timestamp, ts_epoch, action, user_agent, path, username, device) tuples
+    """
+    if not rows:
+        return 0
+    with write_connection(DB_PATH) as conn:
+        conn.executemany("""
+            INSERT INTO visitor_logs (ip_address, timestamp, ts_epoch, action_performed, user_agent, path, username, device)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        _add_visitor_totals(conn, [(row[0], row[2]) for row in rows])
+    return len(rows)
+
+
+def _add_visitor_totals(conn, visits: List[tuple]) -> None:
+    """Fold (ip_address, ts_epoch) visits into visitor_ip_totals"""
+    per_ip: Dict[str, List[int]] = {}
+    for ip_address, ts_epoch in visits:
+        entry = per_ip.get(ip_address)
+        if entry is None:
+            per_ip[ip_address] = [1, ts_epoch, ts_epoch]
+        else:
+            entry[0] += 1
+            entry[1] = min(entry[1], ts_epoch)
+            entry[2] = max(entry[2], ts_epoch)
+    conn.executemany("""
+        INSERT INTO visitor_ip_totals (ip_address, requests, first_seen_epoch, last_seen_epoch)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(ip_address) DO UPDATE SET
+            requests = requests + excluded.requests,
+            first_seen_epoch = MIN(COALESCE(first_seen_epoch, excluded.first_seen_epoch), excluded.first_seen_epoch),
+            last_seen_epoch = MAX(COALESCE(last_seen_epoch, excluded.last_seen_epoch), excluded.last_seen_epoch)
+    """, [(ip, count, first, last) for ip, (count, first, last) in per_ip.items()])
+
+
+class _BlocklistSnapshot:
+    """Immutable view of blacklist + identity_blacklist; replaced as a whole, never mutated"""
+
+    __slots__ = ("ips", "ranges", "identities", "loaded_at")
+
+    def __init__(
+        self,
+        ips: Dict[str, Dict[str, str]],
+        ranges: PrefixTrie,
+        identities: Dict[tuple, Dict[str, str]],
+        loaded_at: float,
+    ):
+        self.ips = ips
+        self.ranges = ranges
+        self.identities = identities
+        self.loaded_at = loaded_at
+
+    def match_ip(self, ip_address: str) -> Optional[Dict[str, str]]:
+        """Exact entry first, then the most specific blocked range containing the IP"""
+        details = self.ips.get(ip_address)
+        if details is not None:
+            return details
+        address = parse_ip(ip_address)
+        if address is None:
+            return None
+        details = self.ips.get(str(address))
+        if details is not None or not self.ranges.size:
+            return details
+        return self.ranges.longest_match(address)
+
+
+_blocklist_snapshot: Optional[_BlocklistSnapshot] = None
+_blocklist_reload_lock = threading.Lock()
+# blacklist entry -> hits not yet written to blacklist.hit_count
+_block_hits: Dict[str, int] = {}
+_block_hits_lock = threading.Lock()
+
+
+def _load_blocklist_snapshot(max_age: Optional[float] = None) -> Optional[_BlocklistSnapshot]:
+    """
+    Read both block tables and swap in a fresh snapshot.
+    With max_age, a snapshot reloaded meanwhile by another thread is reused instead.
+    """
+    global _blocklist_snapshot
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 1 FROM blacklist WHERE ip_address = ? LIMIT 1
-            """, (ip_address,))
-            return cursor.fetchone() is not None
+        with _blocklist_reload_lock:
+            current = _blocklist_snapshot
+            if max_age is not None and current is not None and time.monotonic() - current.loaded_at <= max_age:
+                return current
+            ips: Dict[str, Dict[str, str]] = {}
+            ranges = PrefixTrie()
+            with read_connection(DB_PATH) as conn:
+                for entry, reason, blocked_at in conn.execute("SELECT ip_address, reason, blocked_at FROM blacklist"):
+                    details = {"entry": entry, "reason": str(reason or ""), "blocked_at": str(blocked_at or "")}
+                    try:
+                        canonical, is_range = normalize_block_target(entry)
+                    except ValueError:
+                        ips[entry] = details
+                        continue
+                    if is_range:
+                        ranges.insert(ipaddress.ip_network(canonical), details)
+                    else:
+                        ips[canonical] = details
+                identities = {
+                    (row[0], row[1]): {"reason": str(row[2] or ""), "blocked_at": str(row[3] or "")}
+                    for row in conn.execute(
+                        "SELECT identity_type, identity_value, reason, blocked_at FROM identity_blacklist"
+                    )
+                }
+            _blocklist_snapshot = _BlocklistSnapshot(ips, ranges, identities, time.monotonic())
+            return _blocklist_snapshot
     except Exception as e:
-        print(f"Error checking IP blacklist: {e}")
-        return False
+        print(f"Error loading blocklist: {e}")
+        return None
+
+
+def _get_blocklist_snapshot() -> _BlocklistSnapshot:
+    """
+    Current snapshot. Writes in this process refresh it immediately; it is also
+    reloaded every BLOCKLIST_RECONCILE_SECONDS to pick up writes by other workers.
+    """
+    snapshot = _blocklist_snapshot
+    if snapshot is None or time.monotonic() - snapshot.loaded_at > BLOCKLIST_RECONCILE_SECONDS:
+        snapshot = _load_blocklist_snapshot(max_age=BLOCKLIST_RECONCILE_SECONDS) or snapshot
+    return snapshot or _BlocklistSnapshot({}, PrefixTrie(), {}, 0.0)
+
+
+def invalidate_blocklist_cache() -> None:
+    """Reload the blocklist after a direct write to blacklist/identity_blacklist"""
+    _load_blocklist_snapshot()
+
+
+def is_ip_blocked(ip_address: str) -> bool:
+    """Check if an IP is blacklisted, directly or by range (in-memory snapshot, no query)"""
+    return _get_blocklist_snapshot().match_ip(ip_address) is not None
 
 
 def get_ip_block_details(ip_address: str) -> Optional[Dict[str, str]]:
-    """Return reason and timestamp for a blocked IP, or None if not blocked."""
+    """Return entry, reason and timestamp of the block covering an IP, or None if not blocked."""
     if not ip_address:
         return None
+    details = _get_blocklist_snapshot().match_ip(ip_address)
+    return dict(details) if details else None
 
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT reason, blocked_at
-                FROM blacklist
-                WHERE ip_address = ?
-                LIMIT 1
-                """,
-                (ip_address,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                return None
-            return {
-                "reason": str(row[0] or ""),
-                "blocked_at": str(row[1] or ""),
-            }
-    except Exception as e:
-        print(f"Error getting IP block details: {e}")
-        return None
+
+def match_ip_block(ip_address: str) -> Optional[Dict[str, str]]:
+    """
+    Like get_ip_block_details, for request enforcement: a match also counts as a
+    hit on the blacklist entry (written to hit_count by flush_block_hits).
+    """
+    details = get_ip_block_details(ip_address)
+    if details:
+        with _block_hits_lock:
+            _block_hits[details["entry"]] = _block_hits.get(details["entry"], 0) + 1
+    return details
+
+
+def flush_block_hits() -> int:
+    """Persist pending per-entry hit counts; returns number of entries updated"""
+    with _block_hits_lock:
+        if not _block_hits:
+            return 0
+        pending = list(_block_hits.items())
+        _block_hits.clear()
+    now = datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()
+    with write_connection(DB_PATH) as conn:
+        conn.executemany(
+            "UPDATE blacklist SET hit_count = hit_count + ?, last_hit_at = ? WHERE ip_address = ?",
+            [(hits, now, entry) for entry, hits in pending],
+        )
+    return len(pending)
 
 
 def block_ip(ip_address: str, reason: str = "Manual block"):
-    """Add an IP to the blacklist"""
-    with sqlite3.connect(DB_PATH) as conn:
+    """
+    Add an IP or a CIDR range (e.g. 203.0.113.0/24, 2001:db8::/32) to the blacklist.
+    Raises ValueError for anything else.
+    """
+    ip_address, _ = normalize_block_target(ip_address)
+    with write_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT OR IGNORE INTO blacklist (ip_address, reason, blocked_at)
             VALUES (?, ?, ?)
         """, (ip_address, reason, datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()))
         conn.commit()
+    _load_blocklist_snapshot()
 
 
 def unblock_ip(ip_address: str):
-    """Remove an IP from the blacklist"""
-    with sqlite3.connect(DB_PATH) as conn:
+    """Remove an IP or CIDR range from the blacklist"""
+    try:
+        ip_address, _ = normalize_block_target(ip_address)
+    except ValueError:
+        pass  # Legacy free-text entries are removed as stored
+    with write_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM blacklist WHERE ip_address = ?", (ip_address,))
         conn.commit()
+    _load_blocklist_snapshot()
 
 
 def block_identity(identity_type: str, identity_value: str, reason: str = "Security block"):
@@ -192,7 +274,7 @@ def block_identity(identity_type: str, identity_value: str, reason: str = "Secur
     if not normalized_type or not normalized_value:
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with write_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -207,6 +289,7 @@ def block_identity(identity_type: str, identity_value: str, reason: str = "Secur
             ),
         )
         conn.commit()
+    _load_blocklist_snapshot()
 
 
 def is_identity_blocked(identity_type: str, identity_value: str) -> bool:
@@ -215,23 +298,7 @@ def is_identity_blocked(identity_type: str, identity_value: str) -> bool:
     normalized_value = (identity_value or "").strip().lower()
     if not normalized_type or not normalized_value:
         return False
-
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT 1
-                FROM identity_blacklist
-                WHERE identity_type = ? AND identity_value = ?
-                LIMIT 1
-                """,
-                (normalized_type, normalized_value),
-            )
-            return cursor.fetchone() is not None
-    except Exception as e:
-        print(f"Error checking identity blacklist: {e}")
-        return False
+    return (normalized_type, normalized_value) in _get_blocklist_snapshot().identities
 
 
 def get_identity_block_details(identity_type: str, identity_value: str) -> Optional[Dict[str, str]]:
@@ -240,29 +307,8 @@ def get_identity_block_details(identity_type: str, identity_value: str) -> Optio
     normalized_value = (identity_value or "").strip().lower()
     if not normalized_type or not normalized_value:
         return None
-
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT reason, blocked_at
-                FROM identity_blacklist
-                WHERE identity_type = ? AND identity_value = ?
-                LIMIT 1
-                """,
-                (normalized_type, normalized_value),
-            )
-            row = cursor.fetchone()
-            if not row:
-                return None
-            return {
-                "reason": str(row[0] or ""),
-                "blocked_at": str(row[1] or ""),
-            }
-    except Exception as e:
-        print(f"Error getting identity block details: {e}")
-        return None
+    details = _get_blocklist_snapshot().identities.get((normalized_type, normalized_value))
+    return dict(details) if details else None
 
 
 def get_recent_usernames_by_ip(ip_address: str, limit: int = 10) -> List[str]:
@@ -270,7 +316,7 @@ def get_recent_usernames_by_ip(ip_address: str, limit: int = 10) -> List[str]:
     if not ip_address:
         return []
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -289,43 +335,81 @@ def get_recent_usernames_by_ip(ip_address: str, limit: int = 10) -> List[str]:
         return [str(row[0]).strip() for row in rows if row and row[0]]
 
 
-def get_system_setting(setting_key: str, default: Optional[str] = None) -> Optional[str]:
-    """Get a single system setting value by key."""
-    if not setting_key:
-        return default
+class _SettingsSnapshot:
+    """All system_settings rows plus a content version; replaced as a whole, never mutated"""
+
+    __slots__ = ("values", "version", "loaded_at")
+
+    def __init__(self, values: Dict[str, Optional[str]], loaded_at: float):
+        self.values = values
+        # Derived from content, so every worker computes the same stamp for the same settings
+        digest = hashlib.sha256()
+        for key in sorted(values):
+            digest.update(f"{key}\x00{values[key] or ''}\x01".encode("utf-8"))
+        self.version = digest.hexdigest()[:12]
+        self.loaded_at = loaded_at
+
 
+_settings_snapshot: Optional[_SettingsSnapshot] = None
+_settings_reload_lock = threading.Lock()
+
+
+def _load_settings_snapshot(max_age: Optional[float] = None) -> Optional[_SettingsSnapshot]:
+    """Read every system setting in one query and swap in a fresh snapshot"""
+    global _settings_snapshot
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT setting_value
-                FROM system_settings
-                WHERE setting_key = ?
-                LIMIT 1
-                """,
-                (setting_key,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                return default
-            return row[0] if row[0] is not None else default
+        with _settings_reload_lock:
+            current = _settings_snapshot
+            if max_age is not None and current is not None and time.monotonic() - current.loaded_at <= max_age:
+                return current
+            with read_connection(DB_PATH) as conn:
+                values = dict(conn.execute("SELECT setting_key, setting_value FROM system_settings"))
+            _settings_snapshot = _SettingsSnapshot(values, time.monotonic())
+            return _settings_snapshot
     except Exception as e:
-        print(f"Error reading system setting {setting_key}: {e}")
-        return default
+        print(f"Error loading system settings: {e}")
+        return None
 
 
-def set_system_setting(setting_key: str, setting_value: Optional[str]) -> None:
-    """Insert or update a system setting value."""
+def _get_settings_snapshot() -> _SettingsSnapshot:
+    """Current settings snapshot, reloaded every SETTINGS_RECONCILE_SECONDS for other workers' writes"""
+    snapshot = _settings_snapshot
+    if snapshot is None or time.monotonic() - snapshot.loaded_at > SETTINGS_RECONCILE_SECONDS:
+        snapshot = _load_settings_snapshot(max_age=SETTINGS_RECONCILE_SECONDS) or snapshot
+    return snapshot or _SettingsSnapshot({}, 0.0)
+
+
+def get_system_setting(setting_key: str, default: Optional[str] = None) -> Optional[str]:
+    """Get a single system setting value by key (served from the in-memory cache)."""
     if not setting_key:
-        return
+        return default
+    value = _get_settings_snapshot().values.get(setting_key)
+    return value if value is not None else default
 
-    normalized_value = "" if setting_value is None else str(setting_value)
+
+def get_system_settings() -> Dict[str, Optional[str]]:
+    """All system settings as a dict (copy of the cached snapshot)."""
+    return dict(_get_settings_snapshot().values)
+
+
+def get_system_settings_version() -> str:
+    """Short stamp that changes whenever any system setting changes; usable in ETags."""
+    return _get_settings_snapshot().version
+
+
+def set_system_settings(settings: Dict[str, Optional[str]]) -> None:
+    """Insert or update several system settings in one transaction."""
     now_iso = datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()
+    rows = [
+        (key, "" if value is None else str(value), now_iso)
+        for key, value in settings.items()
+        if key
+    ]
+    if not rows:
+        return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    with write_connection(DB_PATH) as conn:
+        conn.executemany(
             """
             INSERT INTO system_settings (setting_key, setting_value, updated_at)
             VALUES (?, ?, ?)
@@ -333,19 +417,24 @@ def set_system_setting(setting_key: str, setting_value: Optional[str]) -> None:
                 setting_value = excluded.setting_value,
                 updated_at = excluded.updated_at
             """,
-            (setting_key, normalized_value, now_iso),
+            rows,
         )
-        conn.commit()
+    _load_settings_snapshot()
+
+
+def set_system_setting(setting_key: str, setting_value: Optional[str]) -> None:
+    """Insert or update a system setting value."""
+    set_system_settings({setting_key: setting_value})
 
 
 def get_recent_visitors(limit: int = 100) -> List[Dict]:
     """Get recent visitor logs with username/student info"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT id, ip_address, timestamp, action_performed, user_agent, path, username
+            SELECT id, ip_address, timestamp, action_performed, user_agent, path, username, device
             FROM visitor_logs
-            ORDER BY timestamp DESC
+            ORDER BY id DESC
             LIMIT ?
         """, (limit,))
         
@@ -358,46 +447,52 @@ def get_recent_visitors(limit: int = 100) -> List[Dict]:
                 "action": _safe_text(row[3]),
                 "user_agent": _safe_text(row[4]),
                 "path": _safe_text(row[5]),
-                "username": _safe_text(row[6] if row[6] else "N/A")
+                "username": _safe_text(row[6] if row[6] else "N/A"),
+                # Classified at log time; rows without it fall back to the cached classifier
+                "device": {
+                    key: _safe_text(value)
+                    for key, value in (decode_device(row[7]) or detect_device_type(row[4])).items()
+                },
             }
             for row in rows
         ]
 
 
 def get_blocked_ips() -> List[Dict]:
-    """Get all blocked IPs"""
-    with sqlite3.connect(DB_PATH) as conn:
+    """Get all blocked IPs and ranges, with how many requests each has blocked"""
+    with read_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT id, ip_address, reason, blocked_at
+            SELECT id, ip_address, reason, blocked_at, hit_count, last_hit_at
             FROM blacklist
             ORDER BY blocked_at DESC
         """)
         
         rows = cursor.fetchall()
-        return [
-            {
-                "id": row[0],
-                "ip_address": _safe_text(row[1]),
-                "reason": _safe_text(row[2]),
-                "blocked_at": _safe_text(row[3])
-            }
-            for row in rows
-        ]
+    with _block_hits_lock:
+        pending_hits = dict(_block_hits)
+    return [
+        {
+            "id": row[0],
+            "ip_address": _safe_text(row[1]),
+            "reason": _safe_text(row[2]),
+            "blocked_at": _safe_text(row[3]),
+            "is_range": "/" in (row[1] or ""),
+            "hit_count": int(row[4] or 0) + pending_hits.get(row[1], 0),
+            "last_hit_at": _safe_text(row[5]),
+        }
+        for row in rows
+    ]
 
 
 def get_visitor_stats() -> Dict:
     """Get visitor statistics"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         
-        # Total visitors
-        cursor.execute("SELECT COUNT(DISTINCT ip_address) FROM visitor_logs")
-        total_unique_visitors = cursor.fetchone()[0]
-        
-        # Total requests
-        cursor.execute("SELECT COUNT(*) FROM visitor_logs")
-        total_requests = cursor.fetchone()[0]
+        # Total visitors and requests (all time, including rolled-up history)
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(requests), 0) FROM visitor_ip_totals")
+        total_unique_visitors, total_requests = cursor.fetchone()
         
         # Total blocked IPs
         cursor.execute("SELECT COUNT(*) FROM blacklist")
@@ -406,8 +501,8 @@ def get_visitor_stats() -> Dict:
         # Recent activity (last 24 hours)
         cursor.execute("""
             SELECT COUNT(*) FROM visitor_logs 
-            WHERE datetime(timestamp) > datetime('now', '-1 day')
-        """)
+            WHERE ts_epoch > ?
+        """, (int(time.time()) - 86400,))
         recent_activity = cursor.fetchone()[0]
         
         return {
@@ -418,208 +513,148 @@ def get_visitor_stats() -> Dict:
         }
 
 
-def detect_rate_limit_abuse(ip_address: str, time_window_minutes: int = 1, max_requests: int = 100) -> bool:
+def _device_type_for_rollup(device: str, user_agent: str) -> str:
+    info = decode_device(device)
+    if info is None:
+        info = detect_device_type(user_agent) if user_agent else UNKNOWN_DEVICE
+    return info["device"]
+
+
+def rollup_and_prune_logs(now_epoch: Optional[int] = None) -> Dict[str, int]:
     """
-    Detect if an IP is making too many requests (DDoS detection)
-    Returns True if abuse detected
+    Retention job: roll raw visitor rows older than LOG_RETENTION_DAYS into hourly
+    per (IP, path, device type) buckets, hourly buckets older than LOG_HOURLY_ROLLUP_DAYS
+    into daily ones, and threat rows older than THREAT_LOG_RETENTION_DAYS into daily
+    per (IP, threat type, action) buckets. Rolled-up rows are deleted.
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*) FROM visitor_logs 
-            WHERE ip_address = ? 
-            AND datetime(timestamp) > datetime('now', '-' || ? || ' minutes')
-        """, (ip_address, time_window_minutes))
-        count = cursor.fetchone()[0]
-        return count > max_requests
+    now_epoch = int(now_epoch if now_epoch is not None else time.time())
+    raw_cutoff = (now_epoch - LOG_RETENTION_DAYS * 86400) // 3600 * 3600
+    hourly_cutoff = (now_epoch - LOG_HOURLY_ROLLUP_DAYS * 86400) // 86400 * 86400
+    threat_cutoff = (now_epoch - THREAT_LOG_RETENTION_DAYS * 86400) // 86400 * 86400
+    summary = {"visitor_rows_rolled": 0, "hourly_rows_rolled": 0, "threat_rows_rolled": 0, "undated_rows_dropped": 0}
+    
+    # One day of raw rows per transaction keeps the writer lock short
+    while True:
+        with read_connection(DB_PATH) as conn:
+            oldest = conn.execute("SELECT MIN(ts_epoch) FROM visitor_logs").fetchone()[0]
+        if oldest is None or oldest >= raw_cutoff:
+            break
+        chunk_end = min(raw_cutoff, oldest // 3600 * 3600 + 86400)
+        
+        with write_connection(DB_PATH) as conn:
+            buckets: Dict[tuple, int] = {}
+            for bucket, ip_address, path, device, user_agent, requests in conn.execute("""
+                SELECT (ts_epoch / 3600) * 3600, ip_address, COALESCE(path, ''), device,
+                       CASE WHEN device IS NULL THEN COALESCE(user_agent, '') END, COUNT(*)
+                FROM visitor_logs
+                WHERE ts_epoch < ?
+                GROUP BY 1, 2, 3, 4, 5
+            """, (chunk_end,)):
+                key = (bucket, ip_address, path, _device_type_for_rollup(device, user_agent))
+                buckets[key] = buckets.get(key, 0) + requests
+            conn.executemany("""
+                INSERT INTO visitor_hourly_rollup (bucket_epoch, ip_address, path, device_type, requests)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(bucket_epoch, ip_address, path, device_type)
+                DO UPDATE SET requests = requests + excluded.requests
+            """, [(*key, requests) for key, requests in buckets.items()])
+            deleted = conn.execute("DELETE FROM visitor_logs WHERE ts_epoch < ?", (chunk_end,)).rowcount
+            summary["visitor_rows_rolled"] += deleted
+    
+    with write_connection(DB_PATH) as conn:
+        conn.execute("""
+            INSERT INTO visitor_daily_rollup (bucket_epoch, ip_address, path, device_type, requests)
+            SELECT (bucket_epoch / 86400) * 86400, ip_address, path, device_type, SUM(requests)
+            FROM visitor_hourly_rollup
+            WHERE bucket_epoch < ?
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(bucket_epoch, ip_address, path, device_type)
+            DO UPDATE SET requests = requests + excluded.requests
+        """, (hourly_cutoff,))
+        summary["hourly_rows_rolled"] = conn.execute(
+            "DELETE FROM visitor_hourly_rollup WHERE bucket_epoch < ?", (hourly_cutoff,)
+        ).rowcount
+    
+    with write_connection(DB_PATH) as conn:
+        conn.execute("""
+            INSERT INTO threat_daily_rollup (bucket_epoch, ip_address, threat_type, action_taken, detections)
+            SELECT (ts_epoch / 86400) * 86400,
+                   ip_address, threat_type, COALESCE(action_taken, ''), COUNT(*)
+            FROM threat_logs
+            WHERE ts_epoch < ?
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(bucket_epoch, ip_address, threat_type, action_taken)
+            DO UPDATE SET detections = detections + excluded.detections
+        """, (threat_cutoff,))
+        summary["threat_rows_rolled"] = conn.execute(
+            "DELETE FROM threat_logs WHERE ts_epoch < ?", (threat_cutoff,)
+        ).rowcount
+    
+    # Legacy rows whose timestamp the epoch backfills could not parse never age out by
+    # range; writers always set ts_epoch, so these only shrink
+    with write_connection(DB_PATH) as conn:
+        summary["undated_rows_dropped"] = (
+            conn.execute("DELETE FROM visitor_logs WHERE ts_epoch IS NULL").rowcount
+            + conn.execute("DELETE FROM threat_logs WHERE ts_epoch IS NULL").rowcount
+        )
+    
+    return summary
 
 
 def detect_sql_injection(query_string: str) -> bool:
     """
     Detect potential SQL injection attempts with bypass prevention
-    Returns True if suspicious patterns found
+    Returns True if suspicious patterns found (rules: threat_rules.SQL_PATTERNS)
     """
-    import urllib.parse
-    
-    # Decode URL encoding to prevent bypass
-    try:
-        decoded = urllib.parse.unquote(query_string)
-        # Double decode to catch double encoding
-        decoded = urllib.parse.unquote(decoded)
-    except:
-        decoded = query_string
-    
-    # Remove spaces, tabs, newlines to prevent obfuscation
-    normalized = decoded.replace(' ', '').replace('\t', '').replace('\n', '').replace('\r', '')
-    
-    sql_patterns = [
-        "'or'1'='1",
-        "'or1=1",
-        "\"or\"1\"=\"1",
-        "or1=1",
-        "and1=1",
-        "and'1'='1",
-        "unionselect",
-        "droptable",
-        "';drop",
-        "insertinto",
-        "deletefrom",
-        "updateset",
-        "--",
-        "/*",
-        "*/",
-        "xp_cmdshell",
-        "exec(",
-        "execute(",
-        "sp_executesql",
-        "information_schema",
-        "sysobjects",
-        "syscolumns",
-        "benchmark(",
-        "sleep(",
-        "waitfor",
-        "pg_sleep",
-        "and1=1",
-        "admin'--",
-        "'=''",
-        "having1=1",
-        "groupby",
-    ]
-    query_lower = query_string.lower()
-    normalized_lower = normalized.lower()
-    return any(pattern.lower() in query_lower or pattern.lower() in normalized_lower for pattern in sql_patterns)
+    return sql_injection_rule(query_string) is not None
 
 
 def detect_xss_attack(input_string: str) -> bool:
     """
     Detect potential XSS (Cross-Site Scripting) attempts with encoding bypass prevention
-    Returns True if suspicious patterns found
+    Returns True if suspicious patterns found (rules: threat_rules.XSS_PATTERNS)
     """
-    import html
-    import urllib.parse
-    
-    # Decode HTML entities and URL encoding
-    try:
-        decoded = html.unescape(input_string)
-        decoded = urllib.parse.unquote(decoded)
-        decoded = urllib.parse.unquote(decoded)  # Double decode
-    except:
-        decoded = input_string
-    
-    # Remove common obfuscation characters
-    normalized = decoded.replace(' ', '').replace('\t', '').replace('\n', '').replace('\r', '').replace('\x00', '')
-    
-    xss_patterns = [
-        "<script",
-        "</script",
-        "javascript:",
-        "onerror=",
-        "onload=",
-        "onclick=",
-        "onmouseover=",
-        "onfocus=",
-        "<iframe",
-        "<embed",
-        "<object",
-        "eval(",
-        "alert(",
-        "confirm(",
-        "prompt(",
-        "document.cookie",
-        "window.location",
-        "fromcharcode",
-        "string.fromcharcode",
-        "<svg",
-        "<img",
-        "src=",
-        "href=",
-        "javascript",
-        "vbscript:",
-        "data:text/html",
-        "expression(",
-        "<base",
-        "<meta",
-    ]
-    input_lower = input_string.lower()
-    decoded_lower = decoded.lower()
-    normalized_lower = normalized.lower()
-    return any(pattern.lower() in input_lower or pattern.lower() in decoded_lower or pattern.lower() in normalized_lower for pattern in xss_patterns)
+    return xss_rule(input_string) is not None
 
 
 def detect_suspicious_user_agent(user_agent: str) -> bool:
     """
     Detect known malicious or suspicious user agents (comprehensive bot detection)
-    Returns True if suspicious
+    Returns True if suspicious (rules: threat_rules.SUSPICIOUS_USER_AGENTS)
     """
-    if not user_agent or len(user_agent) < 10:
-        return True  # No or very short user agent is suspicious
-    
-    suspicious_agents = [
-        "sqlmap",
-        "nikto",
-        "masscan",
-        "nmap",
-        "acunetix",
-        "metasploit",
-        "dirbuster",
-        "havij",
-        "w3af",
-        "webscarab",
-        "arachni",
-        "burpsuite",
-        "burp suite",
-        "zap",
-        "owasp",
-        "scanner",
-        "python-requests",
-        "curl",
-        "wget",
-        "scrapy",
-        "bot",
-        "crawler",
-        "spider",
-        "scraper",
-        "http.rb",
-        "mechanize",
-        "attack",
-        "hack",
-        "exploit",
-        "injection",
-        "probe",
-        "test",
-        "scan",
-    ]
-    user_agent_lower = user_agent.lower()
-    return any(agent in user_agent_lower for agent in suspicious_agents)
+    return user_agent_rule(user_agent) is not None
 
 
 def log_threat_detection(ip_address: str, threat_type: str, details: str, action_taken: str = "DETECTED"):
     """Log a detected threat for monitoring"""
-    with sqlite3.connect(DB_PATH) as conn:
+    now = datetime.now(pytz.timezone('Asia/Baghdad'))
+    with write_connection(DB_PATH) as conn:
         cursor = conn.cursor()
-        
-        # Create threats table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS threat_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT NOT NULL,
-                threat_type TEXT NOT NULL,
-                details TEXT,
-                detected_at TEXT NOT NULL,
-                action_taken TEXT
-            )
-        """)
-        
         cursor.execute("""
-            INSERT INTO threat_logs (ip_address, threat_type, details, detected_at, action_taken)
-            VALUES (?, ?, ?, ?, ?)
-        """, (ip_address, threat_type, details, datetime.now(pytz.timezone('Asia/Baghdad')).isoformat(), action_taken))
+            INSERT INTO threat_logs (ip_address, threat_type, details, detected_at, ts_epoch, action_taken)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (ip_address, threat_type, details, now.isoformat(), int(now.timestamp()), action_taken))
         conn.commit()
 
 
+def log_threats_bulk(rows: List[tuple]) -> int:
+    """
+    Insert many threat rows in one transaction (used by the log write-behind buffer).
+    rows: (ip_address, threat_type, details, detected_at, ts_epoch, action_taken) tuples
+    """
+    if not rows:
+        return 0
+    with write_connection(DB_PATH) as conn:
+        conn.executemany("""
+            INSERT INTO threat_logs (ip_address, threat_type, details, detected_at, ts_epoch, action_taken)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+
 def get_threat_logs(limit: int = 50) -> List[Dict]:
     """Get recent threat detection logs"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         
         # Check if table exists
@@ -653,7 +688,7 @@ def get_threat_logs(limit: int = 50) -> List[Dict]:
 def has_threat_log(ip_address: str) -> bool:
     """Check if an IP address has any threat logs"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with read_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             
             # Check if table exists
@@ -680,47 +715,47 @@ def has_threat_log(ip_address: str) -> bool:
 # RESULTS STORAGE FUNCTIONS
 # ===================================
 
-def init_results_table():
-    """Initialize results table for storing student exam/quiz results"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        # Create results table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id TEXT NOT NULL,
-                notification_id TEXT UNIQUE NOT NULL,
-                subject TEXT,
-                exam_type TEXT,
-                score TEXT,
-                grade TEXT,
-                semester TEXT,
-                status TEXT,
-                raw_text TEXT NOT NULL,
-                exam_date TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            )
-        """)
-        
-        # Create indexes for faster lookups
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_results_student 
-            ON results(student_id)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_results_notification 
-            ON results(notification_id)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_results_created 
-            ON results(created_at DESC)
-        """)
-        
-        conn.commit()
+# Compact raw_text storage. raw_text (TEXT) holds the notification verbatim unless
+# raw_text_packed (BLOB) is set; then raw_text is '' and the packed value is
+# b"Z1" + raw deflate with a preset dictionary of notification boilerplate.
+RAW_TEXT_ZLIB_MARKER = b"Z1"
+RAW_TEXT_ZDICT = (
+    "Software_F_25-26 Software_S_25-26 Software_F_24-25 Software_S_24-25 "
+    "quiz1 quiz2 quiz3 quiz4 midterm mid final exam assignment report lab seminar "
+    "Computer Architecture Programming Database Operating Systems Networks Mathematics "
+    "Your result of quiz of  - Software_ class is "
+    "Your result of "
+).encode("utf-8")
+
+
+def encode_raw_text(raw_text: str) -> Tuple[str, Optional[bytes]]:
+    """(raw_text, raw_text_packed) column values: packed only when that is smaller"""
+    raw_text = raw_text or ''
+    raw_bytes = raw_text.encode("utf-8")
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, RAW_TEXT_ZDICT)
+    packed = RAW_TEXT_ZLIB_MARKER + compressor.compress(raw_bytes) + compressor.flush()
+    if len(packed) < len(raw_bytes):
+        return '', packed
+    return raw_text, None
+
+
+def decode_raw_text(raw_text: Optional[str], packed: Optional[bytes]) -> str:
+    """Inverse of encode_raw_text"""
+    if packed is None:
+        return raw_text or ''
+    packed = bytes(packed)
+    if not packed.startswith(RAW_TEXT_ZLIB_MARKER):
+        raise ValueError(f"Unknown raw_text_packed encoding {packed[:2]!r}")
+    decompressor = zlib.decompressobj(-15, RAW_TEXT_ZDICT)
+    return (decompressor.decompress(packed[len(RAW_TEXT_ZLIB_MARKER):]) + decompressor.flush()).decode("utf-8")
+
+
+def _result_row_to_dict(row) -> Dict:
+    """sqlite3.Row of the results table as a dict with raw_text decoded"""
+    item = dict(row)
+    if 'raw_text' in item:
+        item['raw_text'] = decode_raw_text(item['raw_text'], item.pop('raw_text_packed', None))
+    return item
 
 
 def save_result(student_id: str, notification_id: str, parsed_data: Dict) -> bool:
@@ -729,15 +764,16 @@ def save_result(student_id: str, notification_id: str, parsed_data: Dict) -> boo
     Returns True if saved, False if duplicate (already exists)
     """
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with write_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             now = datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()
             
             cursor.execute("""
                 INSERT OR IGNORE INTO results 
                 (student_id, notification_id, subject, exam_type, score, grade, 
-                 semester, status, raw_text, exam_date, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 semester, status, raw_text, raw_text_packed, exam_date, created_at, updated_at,
+                 academic_year, semester_display, dedupe_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 student_id,
                 notification_id,
@@ -747,14 +783,21 @@ def save_result(student_id: str, notification_id: str, parsed_data: Dict) -> boo
                 parsed_data.get('grade'),
                 parsed_data.get('semester'),
                 parsed_data.get('status'),
-                parsed_data.get('raw_text', ''),
+                *encode_raw_text(parsed_data.get('raw_text', '')),
                 parsed_data.get('exam_date'),
                 now,
-                now
+                now,
+                parsed_data.get('academic_year'),
+                parsed_data.get('semester_display'),
+                parsed_data.get('dedupe_key')
             ))
             
             # Check if row was actually inserted (not duplicate)
-            return cursor.rowcount > 0
+            if cursor.rowcount <= 0:
+                return False
+            
+            _apply_result_to_stats(cursor, student_id, cursor.lastrowid, parsed_data, now)
+            return True
     except Exception as e:
         print(f"Error saving result: {e}")
         return False
@@ -765,7 +808,7 @@ def get_student_results(student_id: str, limit: int = 100) -> List[Dict]:
     Get all results for a student, ordered by date (newest first)
     """
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with read_connection(DB_PATH) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -777,12 +820,281 @@ def get_student_results(student_id: str, limit: int = 100) -> List[Dict]:
             """, (student_id, limit))
             
             rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [_result_row_to_dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting student results: {e}")
         return []
 
 
+def get_normalized_student_results(student_id: str, academic_year: str, limit: int = 500) -> List[Dict]:
+    """
+    Get ready-to-serve results for one academic year, newest first.
+    One row per dedupe_key (the newest one); rows without a semester are skipped.
+    """
+    try:
+        with read_connection(DB_PATH) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            # SQLite returns the bare columns from the row holding MAX(created_at) in each group
+            cursor.execute("""
+                SELECT
+                    CASE WHEN instr(notification_id, ':') > 0
+                         THEN substr(notification_id, instr(notification_id, ':') + 1)
+                         ELSE notification_id END AS id,
+                    exam_date AS date,
+                    raw_text, raw_text_packed, subject, exam_type, score, grade,
+                    semester, semester_display, status,
+                    MAX(created_at) AS created_at
+                FROM results
+                WHERE student_id = ? AND academic_year = ? AND semester_display IS NOT NULL
+                GROUP BY dedupe_key
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (student_id, academic_year, limit))
+            
+            return [_result_row_to_dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting normalized student results: {e}")
+        return []
+
+
+def get_results_missing_normalization(limit: int = 1000) -> List[Dict]:
+    """Rows stored before the normalized columns existed"""
+    try:
+        with read_connection(DB_PATH) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, subject, exam_type, score, semester, raw_text, raw_text_packed, exam_date
+                FROM results
+                WHERE dedupe_key IS NULL
+                LIMIT ?
+            """, (limit,))
+            return [_result_row_to_dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting unnormalized results: {e}")
+        return []
+
+
+def update_result_normalization(updates: List[tuple]) -> int:
+    """
+    Store normalized values for existing rows.
+    updates: (academic_year, semester_display, dedupe_key, row_id) tuples
+    """
+    if not updates:
+        return 0
+    try:
+        with write_connection(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                UPDATE results
+                SET academic_year = ?, semester_display = ?, dedupe_key = ?
+                WHERE id = ?
+            """, updates)
+            conn.commit()
+            return cursor.rowcount
+    except Exception as e:
+        print(f"Error updating result normalization: {e}")
+        return 0
+
+
+# ===================================
+# RESULT STATISTICS FUNCTIONS
+# ===================================
+
+STATS_SCOPE_OVERALL = "overall"
+STATS_SCOPE_SEMESTER = "semester"
+STATS_SCOPE_SUBJECT = "subject"
+
+
+def _score_to_float(score) -> Optional[float]:
+    """
+    Stored score on a 0-100 scale, or None: "7/10" -> 70.0, "85 %" -> 85.0, "85" -> 85.0.
+    Fractions are converted so results graded out of 10, 20 or 50 average with percentages.
+    """
+    if score is None:
+        return None
+    text = str(score).strip().replace(",", ".")
+    numbers = re.findall(r"\d+(?:\.\d+)?", text)
+    if not numbers:
+        return None
+    value = float(numbers[0])
+    if "/" in text and len(numbers) >= 2:
+        out_of = float(numbers[1])
+        return value / out_of * 100 if out_of else None
+    return value
+
+
+def _apply_result_to_stats(cursor, student_id: str, row_id: int, parsed_data: Dict, now: str) -> None:
+    """
+    Fold one newly inserted result into the running aggregates.
+    Rows without a semester, or repeating an existing dedupe_key, are not counted
+    (they are not shown to the student either).
+    """
+    semester_display = parsed_data.get('semester_display')
+    dedupe_key = parsed_data.get('dedupe_key')
+    if not semester_display or not dedupe_key:
+        return
+    
+    cursor.execute("""
+        SELECT 1 FROM results
+        WHERE student_id = ? AND academic_year IS ? AND dedupe_key = ? AND id != ?
+        LIMIT 1
+    """, (student_id, parsed_data.get('academic_year'), dedupe_key, row_id))
+    if cursor.fetchone():
+        return
+    
+    _add_result_to_stats(cursor, student_id, parsed_data, now)
+
+
+def _add_result_to_stats(cursor, student_id: str, parsed_data: Dict, now: str) -> None:
+    """Upsert the overall, semester and subject aggregate rows for one result"""
+    semester_display = parsed_data.get('semester_display')
+    academic_year = parsed_data.get('academic_year') or ''
+    score = _score_to_float(parsed_data.get('score'))
+    result_date = str(parsed_data.get('exam_date') or now)
+    subject = str(parsed_data.get('subject') or '').strip() or 'Unknown'
+    
+    for scope, scope_key in (
+        (STATS_SCOPE_OVERALL, ''),
+        (STATS_SCOPE_SEMESTER, semester_display),
+        (STATS_SCOPE_SUBJECT, subject),
+    ):
+        # ON CONFLICT expressions see the stored row; excluded.* is the new result
+        cursor.execute("""
+            INSERT INTO result_stats
+            (student_id, academic_year, scope, scope_key, result_count, scored_count, score_sum,
+             best_score, latest_score, latest_date, updated_at)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(student_id, academic_year, scope, scope_key) DO UPDATE SET
+                result_count = result_count + 1,
+                scored_count = scored_count + excluded.scored_count,
+                score_sum = score_sum + excluded.score_sum,
+                best_score = CASE
+                    WHEN excluded.best_score IS NULL THEN best_score
+                    WHEN best_score IS NULL OR excluded.best_score > best_score THEN excluded.best_score
+                    ELSE best_score END,
+                latest_score = CASE
+                    WHEN excluded.latest_score IS NOT NULL
+                         AND (latest_date IS NULL OR excluded.latest_date >= latest_date)
+                    THEN excluded.latest_score ELSE latest_score END,
+                latest_date = CASE
+                    WHEN excluded.latest_score IS NOT NULL
+                         AND (latest_date IS NULL OR excluded.latest_date >= latest_date)
+                    THEN excluded.latest_date ELSE latest_date END,
+                updated_at = excluded.updated_at
+        """, (
+            student_id, academic_year, scope, scope_key,
+            1 if score is not None else 0,
+            score if score is not None else 0.0,
+            score,
+            score,
+            result_date if score is not None else None,
+            now,
+        ))
+
+
+def get_result_stats(student_id: str, academic_year: str) -> List[Dict]:
+    """All aggregate rows for a student in one academic year"""
+    try:
+        with read_connection(DB_PATH) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT scope, scope_key, result_count, scored_count, score_sum,
+                       best_score, latest_score, latest_date
+                FROM result_stats
+                WHERE student_id = ? AND academic_year = ?
+            """, (student_id, academic_year))
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting result stats: {e}")
+        return []
+
+
+def rebuild_result_stats(student_id: Optional[str] = None) -> int:
+    """
+    Recompute aggregates from the results table (all students when student_id is None).
+    Used once for databases that predate result_stats; returns number of results counted.
+    """
+    try:
+        with write_connection(DB_PATH) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            if student_id:
+                cursor.execute("DELETE FROM result_stats WHERE student_id = ?", (student_id,))
+                cursor.execute("""
+                    SELECT * FROM results WHERE student_id = ? ORDER BY id
+                """, (student_id,))
+            else:
+                cursor.execute("DELETE FROM result_stats")
+                cursor.execute("SELECT * FROM results ORDER BY id")
+            rows = [dict(row) for row in cursor.fetchall()]
+            
+            now = datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()
+            counted = 0
+            seen = set()
+            for row in rows:
+                key = (row['student_id'], row.get('academic_year'), row.get('dedupe_key'))
+                if not row.get('semester_display') or not row.get('dedupe_key') or key in seen:
+                    continue
+                seen.add(key)
+                _add_result_to_stats(cursor, row['student_id'], row, now)
+                counted += 1
+            conn.commit()
+            return counted
+    except Exception as e:
+        print(f"Error rebuilding result stats: {e}")
+        return 0
+
+
+def result_stats_missing() -> bool:
+    """True when results exist but no aggregates were ever built"""
+    try:
+        with read_connection(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM results WHERE dedupe_key IS NOT NULL)")
+            has_results = bool(cursor.fetchone()[0])
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM result_stats)")
+            has_stats = bool(cursor.fetchone()[0])
+            return has_results and not has_stats
+    except Exception as e:
+        print(f"Error checking result stats: {e}")
+        return False
+
+
+def compact_results_raw_text(batch_size: int = 1000) -> int:
+    """Pack raw_text of rows stored as plain text; returns number of rows made smaller"""
+    compacted = 0
+    last_id = 0
+    try:
+        while True:
+            # One short write transaction per batch so sync and logging are not held up
+            with write_connection(DB_PATH) as conn:
+                rows = conn.execute("""
+                    SELECT id, raw_text
+                    FROM results
+                    WHERE id > ? AND raw_text_packed IS NULL
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = []
+                for row_id, raw_text in rows:
+                    text, packed = encode_raw_text(raw_text)
+                    if packed is not None:
+                        updates.append((text, packed, row_id))
+                conn.executemany("UPDATE results SET raw_text = ?, raw_text_packed = ? WHERE id = ?", updates)
+            compacted += len(updates)
+        return compacted
+    except Exception as e:
+        print(f"Error compacting results raw_text: {e}")
+        return compacted
+
+
 def result_exists(notification_id: str, student_id: str = None) -> bool:
     """
     Check if a result with this notification_id already exists for this student
@@ -790,7 +1102,7 @@ def result_exists(notification_id: str, student_id: str = None) -> bool:
     If student_id is None, check globally (backwards compatibility)
     """
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with read_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             if student_id:
                 cursor.execute("""
@@ -811,12 +1123,13 @@ def result_exists(notification_id: str, student_id: str = None) -> bool:
 def clear_student_results(student_id: str) -> int:
     """Clear all results for a specific student and return count of deleted records"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with write_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             # Delete all results for this student
             cursor.execute("DELETE FROM results WHERE student_id = ?", (student_id,))
-            conn.commit()
             deleted_count = cursor.rowcount
+            cursor.execute("DELETE FROM result_stats WHERE student_id = ?", (student_id,))
+            conn.commit()
             print(f"Cleared {deleted_count} results for student {student_id}")
             return deleted_count
     except Exception as e:
@@ -827,7 +1140,7 @@ def clear_student_results(student_id: str) -> int:
 def get_all_results_count() -> int:
     """Get total number of results stored"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with read_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM results")
             return cursor.fetchone()[0]
@@ -836,107 +1149,26 @@ def get_all_results_count() -> int:
         return 0
 
 
-# Initialize tables on import
-try:
-    init_security_tables()
-    print("[OK] Security tables initialized successfully")
-except Exception as e:
-    print(f"Error initializing security tables: {e}")
-
-try:
-    init_results_table()
-    print("[OK] Results table initialized successfully")
-except Exception as e:
-    print(f"Error initializing results table: {e}")
+# Apply pending schema migrations on import (see migrations.py). No try/except: a worker
+# that cannot migrate must fail to start rather than serve against an old schema.
+applied_migrations = run_migrations(DB_PATH)
+print(f"[OK] Database schema up to date ({len(applied_migrations)} migration(s) applied)")
 
 
 def detect_path_traversal(path: str) -> bool:
     """
     Detect path traversal attacks
-    Returns True if suspicious patterns found
+    Returns True if suspicious patterns found (rules: threat_rules.PATH_TRAVERSAL_PATTERNS)
     """
-    import urllib.parse
-    
-    try:
-        decoded = urllib.parse.unquote(path)
-        decoded = urllib.parse.unquote(decoded)
-    except:
-        decoded = path
-    
-    traversal_patterns = [
-        "../",
-        "..\\",
-        "....//",
-        "....\\\\",
-        "%2e%2e/",
-        "%2e%2e\\",
-        "..%2f",
-        "..%5c",
-        "%252e%252e",
-        "..;",
-        "..//",
-    ]
-    
-    path_lower = path.lower()
-    decoded_lower = decoded.lower()
-    
-    return any(pattern in path_lower or pattern in decoded_lower for pattern in traversal_patterns)
+    return path_traversal_rule(path) is not None
 
 
 def detect_command_injection(input_string: str) -> bool:
     """
     Detect command injection attempts
-    Returns True if suspicious patterns found
+    Returns True if suspicious patterns found (rules: threat_rules.COMMAND_PATTERNS/SHELL_COMMANDS)
     """
-    import urllib.parse
-    
-    try:
-        decoded = urllib.parse.unquote(input_string)
-    except:
-        decoded = input_string
-    
-    cmd_patterns = [
-        "|",
-        "&",
-        ";",
-        "`",
-        "$(",
-        "%0a",  # newline URL encoded
-        "%0d",  # carriage return
-        "&&",
-        "||",
-        "<(",
-        ">(",
-        "${{",
-    ]
-    
-    # Check for shell commands
-    shell_commands = [
-        "bash",
-        "sh",
-        "cmd",
-        "powershell",
-        "nc ",
-        "netcat",
-        "wget ",
-        "curl ",
-        "rm ",
-        "del ",
-        "cat ",
-        "type ",
-        "ping ",
-        "whoami",
-        "chmod",
-        "chown",
-    ]
-    
-    input_lower = input_string.lower()
-    decoded_lower = decoded.lower()
-    
-    has_cmd_pattern = any(pattern in input_string or pattern in decoded for pattern in cmd_patterns)
-    has_shell_cmd = any(cmd in input_lower or cmd in decoded_lower for cmd in shell_commands)
-    
-    return has_cmd_pattern or has_shell_cmd
+    return command_injection_rule(input_string) is not None
 
 
 def is_ip_whitelisted(ip_address: str) -> bool:
@@ -955,87 +1187,10 @@ def is_ip_whitelisted(ip_address: str) -> bool:
 
 def detect_device_type(user_agent: str) -> Dict[str, str]:
     """
-    Detect device type, OS, and browser from user agent string
+    Detect device type, OS, and browser from user agent string (LRU-cached, see user_agents.py)
     Returns: {device: str, os: str, browser: str, icon: str}
     """
     if not user_agent:
-        return {"device": "Unknown", "os": "Unknown", "browser": "Unknown", "icon": "fa-question"}
-
-    import html as _html
-
+        return dict(UNKNOWN_DEVICE)
     # Values are escaped before admin rendering; unescape so detection works on raw UA.
-    ua_text = _html.unescape(str(user_agent))
-    ua_lower = ua_text.lower()
-    
-    # Detect Device Type
-    if any(token in ua_lower for token in ['bot', 'crawler', 'spider', 'scrapy', 'curl', 'wget', 'python-requests', 'postman']):
-        device = "Bot/Script"
-        icon = "fa-robot"
-    elif 'mobile' in ua_lower or 'android' in ua_lower or 'iphone' in ua_lower:
-        device = "Mobile"
-        icon = "fa-mobile-alt"
-    elif 'tablet' in ua_lower or 'ipad' in ua_lower:
-        device = "Tablet"
-        icon = "fa-tablet-alt"
-    else:
-        device = "Desktop"
-        icon = "fa-desktop"
-    
-    # Detect Operating System
-    if 'windows nt 10' in ua_lower or 'windows nt 11' in ua_lower:
-        os_name = "Windows 11"
-    elif 'windows nt 6.3' in ua_lower:
-        os_name = "Windows 8.1"
-    elif 'windows nt 6.2' in ua_lower:
-        os_name = "Windows 8"
-    elif 'windows nt 6.1' in ua_lower:
-        os_name = "Windows 7"
-    elif 'windows' in ua_lower:
-        os_name = "Windows"
-    elif 'android' in ua_lower:
-        # Extract Android version
-        import re
-        match = re.search(r'android\s+([\d.]+)', ua_lower)
-        version = match.group(1) if match else ''
-        os_name = f"Android {version}" if version else "Android"
-        icon = "fa-mobile-alt"
-    elif 'iphone' in ua_lower or 'ipad' in ua_lower:
-        # Extract iOS version
-        import re
-        match = re.search(r'os\s+([\d_]+)', ua_lower)
-        version = match.group(1).replace('_', '.') if match else ''
-        os_name = f"iOS {version}" if version else "iOS"
-        icon = "fa-apple"
-    elif 'mac os x' in ua_lower or 'macos' in ua_lower or 'macintosh' in ua_lower:
-        os_name = "macOS"
-        icon = "fa-apple"
-    elif 'linux' in ua_lower:
-        os_name = "Linux"
-    elif 'cros' in ua_lower:
-        os_name = "Chrome OS"
-    else:
-        os_name = "Unknown OS"
-    
-    # Detect Browser
-    if 'edg/' in ua_lower or 'edge' in ua_lower:
-        browser = "Edge"
-    elif 'chrome' in ua_lower and 'safari' in ua_lower:
-        browser = "Chrome"
-    elif 'firefox' in ua_lower:
-        browser = "Firefox"
-    elif 'safari' in ua_lower and 'chrome' not in ua_lower:
-        browser = "Safari"
-    elif 'opera' in ua_lower or 'opr/' in ua_lower:
-        browser = "Opera"
-    elif 'msie' in ua_lower or 'trident' in ua_lower:
-        browser = "Internet Explorer"
-    else:
-        browser = "Unknown Browser"
-    
-    return {
-        "device": device,
-        "os": os_name,
-        "browser": browser,
-        "icon": icon
-    }
-
+    return ua_cache.classify(html.unescape(str(user_agent)))
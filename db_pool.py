@@ -0,0 +1,113 @@
+"""
+SQLite Connection Layer for SwiftSync
+Persistent per-thread connections in WAL mode, shared by database.py and sync.py
+All writes for a database file go through one writer lock so they queue instead of
+fighting over SQLite's file lock (and failing with "database is locked")
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Union
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Negative cache_size is in KiB (here: 8 MiB page cache per connection)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "8192"))
+# Prepared statements kept per connection by the sqlite3 module
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+
+class ConnectionPool:
+    """One persistent connection per thread for a single database file"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        # RLock: a write helper may call another write helper on the same thread
+        self._write_lock = threading.RLock()
+        self.connections_opened = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power loss can drop the last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        self.connections_opened += 1
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use (and again after a fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # A connection inherited across fork() must not be used by the child
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connection()
+        try:
+            yield conn
+        finally:
+            # Helpers set row_factory per call; do not leak it to the next helper
+            conn.row_factory = None
+            if conn.in_transaction:
+                conn.rollback()
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Serialized write transaction: commits on success, rolls back on error"""
+        with self._write_lock:
+            conn = self.connection()
+            try:
+                yield conn
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                conn.row_factory = None
+
+    def close_thread_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Union[str, Path]) -> ConnectionPool:
+    """Pool for a database file; relative and absolute paths to the same file share one pool"""
+    key = str(Path(db_path).resolve())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(db_path))
+    return pool
+
+
+def read_connection(db_path: Union[str, Path]):
+    """Use as: with read_connection(DB_PATH) as conn: ..."""
+    return get_pool(db_path).read()
+
+
+def write_connection(db_path: Union[str, Path]):
+    """Use as: with write_connection(DB_PATH) as conn: ... (commit happens on exit)"""
+    return get_pool(db_path).write()
@@ -0,0 +1,165 @@
+"""
+Change Events Module for SwiftSync
+In-process publish/subscribe hub behind the /api/events SSE stream
+The sync worker and results prefetcher publish; each client only receives its own events
+"""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENTS_HISTORY_SIZE = int(os.getenv("EVENTS_HISTORY_SIZE", "200"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_MAX_STREAMS_PER_STUDENT = int(os.getenv("EVENTS_MAX_STREAMS_PER_STUDENT", "5"))
+
+# Event types pushed to clients
+EVENT_LECTURES = "lectures"
+EVENT_RESULTS = "results"
+EVENT_OFFICIAL_RESULTS = "official_results"
+EVENT_ATTENDANCE = "attendance"
+# Sent instead of a replay when the client's Last-Event-ID cannot be honoured: refetch everything
+EVENT_RESET = "reset"
+
+
+class Subscription(NamedTuple):
+    queue: asyncio.Queue
+    # Missed events to send first, or reset=True when they cannot be reconstructed
+    replay: List[Dict[str, Any]]
+    reset: bool
+    # Id of the newest event at subscribe time; queued events at or below it were already covered
+    cursor: str
+    cursor_seq: int
+
+
+class ChangeEventHub:
+    """Fan-out of change events to connected SSE streams with a short replay history"""
+
+    def __init__(self, history_size: int = EVENTS_HISTORY_SIZE, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        # student_id -> queues of connected streams
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # Ids are "<epoch>-<seq>"; an id from a previous boot fails the epoch check and
+        # gets a reset instead of a replay of unrelated events that reused its number
+        self.epoch = secrets.token_hex(4)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped_events = 0
+
+    def stream_count(self, student_id: str) -> int:
+        return len(self._subscribers.get(student_id, ()))
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def subscribe(self, student_id: str, last_event_id: str = "") -> Subscription:
+        """
+        Register a stream for a student and snapshot what it missed since last_event_id.
+        Both happen under the publish lock, so every event is either in the replay or
+        queued (possibly both; skip queued events with seq <= cursor_seq).
+        Must be called from the event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(student_id, set()).add(queue)
+            replay, reset = self._replay_locked(last_event_id, student_id)
+            cursor_seq = self._seq
+        return Subscription(queue, replay, reset, self.event_id(cursor_seq), cursor_seq)
+
+    def unsubscribe(self, student_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(student_id)
+            if not queues:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[student_id]
+
+    def publish(self, event_type: str, data: Dict[str, Any], student_id: Optional[str] = None) -> int:
+        """
+        Publish an event to one student (student_id) or to everyone (None).
+        Safe to call from worker threads; delivery always happens on the event loop.
+        Returns the event id.
+        """
+        with self._lock:
+            self._seq += 1
+            event = {
+                "id": self.event_id(self._seq),
+                "seq": self._seq,
+                "type": event_type,
+                "student_id": student_id,
+                "data": data,
+            }
+            self._history.append(event)
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is not None and running_loop is self._loop:
+            self._deliver(event)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, event)
+        return event["id"]
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if event["student_id"] is None:
+                targets = [queue for queues in self._subscribers.values() for queue in queues]
+            else:
+                targets = list(self._subscribers.get(event["student_id"], ()))
+
+        for queue in targets:
+            if queue.full():
+                # Slow client: drop its oldest pending event rather than growing without bound.
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+                self.dropped_events += 1
+            queue.put_nowait(event)
+
+    def _replay_locked(self, last_event_id: str, student_id: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """(events newer than Last-Event-ID this student may see, reset); caller holds _lock"""
+        if not last_event_id:
+            return [], False
+        epoch, _, seq_text = last_event_id.partition("-")
+        if epoch != self.epoch or not seq_text.isdigit() or int(seq_text) > self._seq:
+            return [], True
+        after = int(seq_text)
+        oldest = self._history[0]["seq"] if self._history else self._seq + 1
+        if after < oldest - 1:
+            # Events between the client's id and the oldest kept one are gone
+            return [], True
+        return [
+            event for event in self._history
+            if event["seq"] > after and event["student_id"] in (None, student_id)
+        ], False
+
+    @staticmethod
+    def format_sse(event: Dict[str, Any]) -> str:
+        payload = json.dumps(event["data"], ensure_ascii=False, separators=(",", ":"))
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    @staticmethod
+    def format_reset(cursor: str) -> str:
+        return f"id: {cursor}\nevent: {EVENT_RESET}\ndata: {{}}\n\n"
+
+    @staticmethod
+    def format_cursor(cursor: str) -> str:
+        # An id-only block sets the client's Last-Event-ID without dispatching an event
+        return f"id: {cursor}\n\n"
+
+
+# Global instance (similar to results_service)
+change_events = ChangeEventHub()
@@ -0,0 +1,81 @@
+"""
+IP Prefix Trie for SwiftSync
+Binary radix trie over IPv4/IPv6 network prefixes for CIDR blocklist matching
+Lookup walks at most one node per prefix bit (32 for IPv4, 128 for IPv6),
+independent of how many ranges are stored
+"""
+
+import ipaddress
+from typing import Any, Optional, Tuple, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# Node layout: [child_for_bit_0, child_for_bit_1, value_or_None]
+_ZERO, _ONE, _VALUE = 0, 1, 2
+
+
+def parse_ip(value: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    """Parse a client IP; IPv4-mapped IPv6 (::ffff:a.b.c.d) is treated as IPv4"""
+    try:
+        address = ipaddress.ip_address((value or "").strip())
+    except ValueError:
+        return None
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+def normalize_block_target(value: str) -> Tuple[str, bool]:
+    """
+    Canonical blacklist entry for an IP or CIDR string.
+    Returns (entry, is_range); a full-length prefix (/32, /128) becomes a plain IP.
+    Raises ValueError for anything that is neither.
+    """
+    text = (value or "").strip()
+    if "/" not in text:
+        address = parse_ip(text)
+        if address is None:
+            raise ValueError(f"Invalid IP address: {value}")
+        return str(address), False
+
+    network = ipaddress.ip_network(text, strict=False)
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address), False
+    return str(network), True
+
+
+class PrefixTrie:
+    """Longest-prefix-match table from IP networks to arbitrary values"""
+
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+
+    def insert(self, network: IPNetwork, value: Any) -> None:
+        node = self._roots[network.version]
+        bits = network.max_prefixlen
+        prefix = int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = (prefix >> (bits - 1 - depth)) & 1
+            child = node[bit]
+            if child is None:
+                child = [None, None, None]
+                node[bit] = child
+            node = child
+        if node[_VALUE] is None:
+            self.size += 1
+        node[_VALUE] = value
+
+    def longest_match(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Optional[Any]:
+        """Value of the most specific stored prefix containing address, or None"""
+        node = self._roots[address.version]
+        bits = address.max_prefixlen
+        number = int(address)
+        best = node[_VALUE]
+        for depth in range(bits):
+            node = node[(number >> (bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[_VALUE] is not None:
+                best = node[_VALUE]
+        return best
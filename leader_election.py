@@ -0,0 +1,139 @@
+"""
+Leader Election for SwiftSync
+Deduplicates the background jobs across overlapping processes, e.g. the old and new
+instance during a deploy or restart. It does not make several uvicorn workers safe:
+login sessions (attendance.SessionManager) and SSE subscribers (change_events) live in
+process memory, so a second worker would not see logins made on the first, and its
+students would get neither prefetched results nor change events. Run a single worker
+(`--workers 1`, as in the Procfile).
+
+Processes race for an exclusive flock on LEADER_LOCK_PATH: the winner runs the
+portal/Telegram jobs (sync, results prefetch) and database cleanup, the others keep
+serving HTTP and retry every LEADER_POLL_SECONDS. The kernel drops the lock when the
+leader exits or crashes, so another process takes over on its next poll without any
+heartbeat or lease bookkeeping. A job that raises is restarted with backoff, so
+leadership never ends silently.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "data/leader.lock")
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", "5"))
+LEADER_JOB_MAX_BACKOFF_SECONDS = float(os.getenv("LEADER_JOB_MAX_BACKOFF_SECONDS", "300"))
+
+# (task name, coroutine function); the function is called again to restart a failed job
+LeaderJob = Tuple[str, Callable[[], Awaitable[None]]]
+
+
+class LeaderElection:
+    """Exclusive lock file per deployment; run_forever() starts the leader-only jobs once it wins"""
+
+    def __init__(self, lock_path: str = LEADER_LOCK_PATH, poll_seconds: float = LEADER_POLL_SECONDS):
+        self.lock_path = Path(lock_path)
+        self.poll_seconds = poll_seconds
+        self.is_leader = False
+        self.leader_since: Optional[float] = None
+        self._lock_file = None
+        self.counters = {"attempts": 0, "terms": 0, "job_restarts": 0}
+
+    def try_acquire(self) -> bool:
+        """Take the lock if no other worker holds it; True when this process is the leader"""
+        if self.is_leader:
+            return True
+        self.counters["attempts"] += 1
+        if fcntl is None:
+            # No flock (Windows dev machines): single worker, so it leads
+            self._become_leader()
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # For operators: which pid holds the lock
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._lock_file = lock_file
+        self._become_leader()
+        return True
+
+    def _become_leader(self) -> None:
+        self.is_leader = True
+        self.leader_since = time.time()
+        self.counters["terms"] += 1
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+        self.leader_since = None
+
+    async def _supervise(self, name: str, job: Callable[[], Awaitable[None]]) -> None:
+        """Run job until it returns; restart it after a growing delay whenever it raises"""
+        backoff = self.poll_seconds
+        while True:
+            try:
+                await job()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                self.counters["job_restarts"] += 1
+                logger.exception("%s failed, restarting in %.0fs: %s", name, backoff, exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, LEADER_JOB_MAX_BACKOFF_SECONDS)
+
+    async def run_forever(self, leader_jobs: Callable[[], List[LeaderJob]]) -> None:
+        """Wait for leadership, then supervise leader_jobs() until cancelled (cancels them and releases)"""
+        if int(os.getenv("WEB_CONCURRENCY", "1") or "1") > 1:
+            logger.warning("WEB_CONCURRENCY > 1 is not supported: sessions and SSE events are per process, run --workers 1")
+        tasks: List[asyncio.Task] = []
+        try:
+            while not await asyncio.to_thread(self.try_acquire):
+                await asyncio.sleep(self.poll_seconds)
+            logger.info("Worker %d is the leader, starting background jobs", os.getpid())
+            tasks = [asyncio.create_task(self._supervise(name, job), name=name) for name, job in leader_jobs()]
+            await asyncio.gather(*tasks)
+            # Every job returned on its own (one-shot jobs); keep the lock so no other
+            # process starts a second set of jobs
+            await asyncio.Event().wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    logger.info("%s cancelled", task.get_name())
+            self.release()
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "leader_since": self.leader_since,
+            "lock_path": str(self.lock_path) if fcntl is not None else None,
+        }
+
+
+# Global instance (similar to change_events)
+leader_election = LeaderElection()
@@ -0,0 +1,424 @@
+"""
+Lecture Catalog for SwiftSync
+In-memory index of lectures_storage grouped by semester and subject, behind /api/files
+Entries are recomputed only for files whose stat or synced_items row changed; the JSON
+body and its ETag are rebuilt only when the grouped catalog actually changes.
+Kept current by the sync pipeline (refresh after each sync) and a polling directory watcher.
+Subjects guessed from filenames with enough confidence are written back to
+synced_items.subject (flagged subject_inferred) so each file is inferred once.
+The cursor of a catalog state is its content hash, so every worker (and a restarted
+process) with the same files agrees on it; each rebuild records the previous cursor
+with the names that changed since it, and clients holding a cursor fetch only the
+changes since their copy (/api/files?since=<cursor>).
+Also caches content hashes (ETag, CRC32) per file version for downloads and ZIP archives,
+in memory and in the file_digests table.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from db_pool import read_connection, write_connection
+from migrations import run_migrations
+from subject_index import SUBJECT_PERSIST_MIN_SCORE, subject_index
+from sync import DB_PATH, DOWNLOAD_DIR, _get_semester_from_subject
+
+logger = logging.getLogger(__name__)
+
+LECTURE_CATALOG_POLL_SECONDS = float(os.getenv("LECTURE_CATALOG_POLL_SECONDS", "10"))
+# Full rescan + synced_items reload even if the directory looks unchanged
+# (catches in-place rewrites and subject backfills made by other workers)
+LECTURE_CATALOG_RECONCILE_SECONDS = float(os.getenv("LECTURE_CATALOG_RECONCILE_SECONDS", "120"))
+# Catalog versions kept for delta requests; older cursors get the full catalog instead
+LECTURE_CATALOG_CHANGELOG_SIZE = int(os.getenv("LECTURE_CATALOG_CHANGELOG_SIZE", "1000"))
+
+GENERIC_SUBJECT_LABELS = {
+    "",
+    "other",
+    "all lectures",
+    "general lectures",
+    "unknown",
+    "unknown subject",
+    "بابەتی جیاواز",
+}
+
+
+def _normalize_subject_value(subject: str):
+    value = (subject or "").strip()
+    if not value:
+        return None
+    if value.lower() in GENERIC_SUBJECT_LABELS:
+        return None
+    return value
+
+
+def _infer_semester_from_filename(filename: str) -> str:
+    """Infer semester from filename when DB metadata is missing."""
+    name = filename.lower()
+    if "fall semester" in name or " fall " in f" {name} ":
+        return "Fall Semester"
+    if "spring semester" in name or " spring " in f" {name} ":
+        return "Spring Semester"
+    return ""
+
+
+def _classify_file(name: str, size: int, mtime: float, db_row: Optional[Tuple]) -> Tuple[str, str, Dict, float]:
+    """
+    (semester, subject, file_info, inference_score) for one file; same rules /api/files always used.
+    inference_score is 0.0 unless the subject was guessed from the filename.
+    """
+    db_subject, db_upload_date, db_semester = db_row or (None, None, None)
+
+    # Prefer a non-generic subject from DB, otherwise infer from filename.
+    subject = _normalize_subject_value(db_subject)
+    score = 0.0
+    if not subject:
+        subject, score = subject_index.infer(name)
+    if not subject:
+        subject = "Temporary"
+
+    # Prefer semester from DB, otherwise derive from subject (if known)
+    semester = db_semester
+    inferred_semester = _infer_semester_from_filename(name)
+    if inferred_semester:
+        semester = inferred_semester
+    if not semester:
+        if subject and _normalize_subject_value(subject):
+            try:
+                semester = _get_semester_from_subject(subject)
+            except Exception:
+                semester = "Spring Semester"
+        else:
+            semester = "Spring Semester"
+
+    # Use upload_date from database if available, otherwise fall back to file modified time
+    upload_date = db_upload_date
+    if not upload_date:
+        upload_date = datetime.fromtimestamp(mtime).isoformat()
+
+    file_info = {
+        "name": name,
+        "size_bytes": size,
+        "modified": upload_date,  # This is now the original upload date from the portal
+        "url": f"/files/{name}",
+    }
+    return semester, subject, file_info, score
+
+
+class _Entry:
+    __slots__ = ("signature", "db_row", "semester", "subject", "file_info")
+
+    def __init__(self, signature: Tuple, db_row: Optional[Tuple]):
+        self.signature = signature
+        self.db_row = db_row
+
+
+class LectureCatalog:
+    """Semester -> subject -> files index with a pre-serialized JSON body and ETag"""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._db_rows: Dict[str, Tuple] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._last_reconcile = 0.0
+        self._lock = threading.Lock()
+        self.version = 0
+        self.body = b"{}"
+        self.etag = self._etag_for(self.body)
+        # (previous cursor, file names changed since it) per rebuild, oldest first
+        self._changes: Deque[Tuple[str, Tuple[str, ...]]] = deque(maxlen=LECTURE_CATALOG_CHANGELOG_SIZE)
+        # file name -> ((size, mtime_ns), content ETag, CRC32) for /api/download and ZIP archives
+        self._file_etags: Dict[str, Tuple[Tuple, str, int]] = {}
+        self.counters = {"refreshes": 0, "classified": 0, "rebuilds": 0, "not_modified": 0, "served": 0, "deltas": 0, "resets": 0, "subjects_persisted": 0}
+
+    @staticmethod
+    def _etag_for(body: bytes) -> str:
+        # Content hash: workers with the same files agree on the ETag
+        return f'"{hashlib.sha256(body).hexdigest()[:24]}"'
+
+    def _load_db_rows(self) -> Dict[str, Tuple]:
+        if not DB_PATH.exists():
+            return {}
+        try:
+            with read_connection(DB_PATH) as conn:
+                cursor = conn.execute("SELECT filename, subject, upload_date, semester FROM synced_items WHERE filename IS NOT NULL")
+                return {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error("Error reading data from database: %s", e)
+            # Keep the last good rows rather than dropping every subject
+            return self._db_rows
+
+    def _scan(self) -> Dict[str, Tuple]:
+        """file name -> (size, mtime_ns) for every regular file in DOWNLOAD_DIR"""
+        files = {}
+        try:
+            with os.scandir(DOWNLOAD_DIR) as it:
+                for entry in it:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return files
+
+    def refresh(self, reload_db: bool = True) -> bool:
+        """Rescan the directory (and synced_items) and apply changes. Returns True if the catalog changed."""
+        with self._lock:
+            self.counters["refreshes"] += 1
+            if reload_db:
+                self._db_rows = self._load_db_rows()
+                self._last_reconcile = time.monotonic()
+            try:
+                self._dir_mtime_ns = DOWNLOAD_DIR.stat().st_mtime_ns
+            except FileNotFoundError:
+                self._dir_mtime_ns = None
+            files = self._scan()
+
+            removed = [name for name in self._entries if name not in files]
+            changed_names: List[str] = list(removed)
+            entries: Dict[str, _Entry] = {}
+            to_persist: List[Tuple[str, str]] = []
+            for name, signature in files.items():
+                db_row = self._db_rows.get(name)
+                entry = self._entries.get(name)
+                if entry is None or entry.signature != signature or entry.db_row != db_row:
+                    previous = entry
+                    entry = _Entry(signature, db_row)
+                    entry.semester, entry.subject, entry.file_info, score = _classify_file(
+                        name, signature[0], signature[1] / 1e9, db_row
+                    )
+                    self.counters["classified"] += 1
+                    if db_row is not None and score >= SUBJECT_PERSIST_MIN_SCORE:
+                        to_persist.append((name, entry.subject))
+                    if previous is None or (previous.semester, previous.subject, previous.file_info) != (
+                        entry.semester, entry.subject, entry.file_info
+                    ):
+                        changed_names.append(name)
+                entries[name] = entry
+            self._entries = entries
+            # list() snapshot: downloads add ETags from other threads
+            for name in list(self._file_etags):
+                if name not in entries:
+                    self._file_etags.pop(name, None)
+            if removed:
+                self._forget_digests(removed)
+            if to_persist:
+                self._persist_inferred_subjects(to_persist)
+
+            changed = bool(changed_names)
+            if changed or self.version == 0:
+                previous_cursor = self.cursor if self.version else None
+                self._rebuild()
+                # The first build is the baseline, not a list of changes
+                if previous_cursor is not None and self.cursor != previous_cursor:
+                    self._changes.append((previous_cursor, tuple(changed_names)))
+            return changed
+
+    def _persist_inferred_subjects(self, inferred: List[Tuple[str, str]]) -> None:
+        """Write confident filename guesses into rows whose subject is still empty/generic"""
+        updates = []
+        for name, subject in inferred:
+            old_subject, upload_date, semester = self._db_rows[name]
+            updates.append((subject, name, old_subject))
+        try:
+            run_migrations(DB_PATH)
+            with write_connection(DB_PATH) as conn:
+                # "subject IS ?" skips rows the sync updated since we read them
+                conn.executemany(
+                    "UPDATE synced_items SET subject = ?, subject_inferred = 1 WHERE filename = ? AND subject IS ?",
+                    updates,
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error("Error saving inferred subjects: %s", e)
+            return
+        for name, subject in inferred:
+            _, upload_date, semester = self._db_rows[name]
+            # The classification is unchanged (the DB subject is now the inferred one),
+            # so keep the entry as is instead of re-classifying on the next reload
+            db_row = (subject, upload_date, semester)
+            self._db_rows[name] = db_row
+            self._entries[name].db_row = db_row
+        self.counters["subjects_persisted"] += len(inferred)
+        logger.info("Saved %d inferred lecture subject(s) to synced_items", len(inferred))
+
+    def file_digest(self, path: Path, stat_result: os.stat_result) -> Tuple[str, int]:
+        """
+        (strong ETag, CRC32) of a lecture file's content per (size, mtime): from memory, then
+        the file_digests table (filled by any worker, kept across restarts), else one read
+        """
+        signature = (stat_result.st_size, stat_result.st_mtime_ns)
+        cached = self._file_etags.get(path.name)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        stored = self._load_digest(path.name, signature)
+        if stored is not None:
+            etag, crc = stored
+        else:
+            digest = hashlib.sha256()
+            crc = 0
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+                    crc = zlib.crc32(chunk, crc)
+            etag = f'"{digest.hexdigest()[:32]}"'
+            self._store_digest(path.name, signature, etag, crc)
+        self._file_etags[path.name] = (signature, etag, crc)
+        return etag, crc
+
+    def _load_digest(self, name: str, signature: Tuple) -> Optional[Tuple[str, int]]:
+        try:
+            run_migrations(DB_PATH)
+            with read_connection(DB_PATH) as conn:
+                row = conn.execute(
+                    "SELECT etag, crc FROM file_digests WHERE name = ? AND size = ? AND mtime_ns = ?",
+                    (name, *signature),
+                ).fetchone()
+        except Exception as e:
+            logger.error("Error reading file digest: %s", e)
+            return None
+        return (row[0], row[1]) if row else None
+
+    def _store_digest(self, name: str, signature: Tuple, etag: str, crc: int) -> None:
+        try:
+            with write_connection(DB_PATH) as conn:
+                conn.execute(
+                    """
+                    INSERT INTO file_digests (name, size, mtime_ns, etag, crc) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        size = excluded.size, mtime_ns = excluded.mtime_ns, etag = excluded.etag, crc = excluded.crc
+                    """,
+                    (name, *signature, etag, crc),
+                )
+        except Exception as e:
+            logger.error("Error saving file digest: %s", e)
+
+    def _forget_digests(self, names: List[str]) -> None:
+        try:
+            run_migrations(DB_PATH)
+            with write_connection(DB_PATH) as conn:
+                conn.executemany("DELETE FROM file_digests WHERE name = ?", [(name,) for name in names])
+        except Exception as e:
+            logger.error("Error removing file digests: %s", e)
+
+    def file_etag(self, path: Path, stat_result: os.stat_result) -> str:
+        """Strong ETag (sha256 of the content) of a lecture file"""
+        return self.file_digest(path, stat_result)[0]
+
+    def select(self, subject: Optional[str] = None, semester: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """(semester, subject, file name) of the files in a subject and/or semester, by file name"""
+        with self._lock:
+            return [
+                (entry.semester, entry.subject, name)
+                for name, entry in sorted(self._entries.items())
+                if (subject is None or entry.subject == subject) and (semester is None or entry.semester == semester)
+            ]
+
+    @property
+    def cursor(self) -> str:
+        return self.etag.strip('"')
+
+    def changes_since(self, since: str) -> Tuple[str, bytes]:
+        """
+        (cursor, JSON body) for /api/files?since=<cursor>:
+        {"cursor", "reset": false, "changes": [upsert/remove ops]} when the cursor is a catalog state
+        this process went through and is still in the change log, otherwise
+        {"cursor", "reset": true, "files": <full catalog>}.
+        """
+        with self._lock:
+            # Walk the links back from the current state to the client's one
+            changed_names: Dict[str, None] = {}
+            found = since == self.cursor
+            for previous_cursor, names in reversed(self._changes):
+                if found:
+                    break
+                changed_names.update(dict.fromkeys(names))
+                found = previous_cursor == since
+            if not found:
+                self.counters["resets"] += 1
+                # The stored body is already serialized; splice it in instead of re-encoding
+                return self.cursor, b'{"cursor":"%s","reset":true,"files":%s}' % (self.cursor.encode("ascii"), self.body)
+
+            # Latest state per changed file; a file changed twice is sent once
+            changes = []
+            for name in changed_names:
+                entry = self._entries.get(name)
+                if entry is None:
+                    changes.append({"op": "remove", "name": name})
+                else:
+                    changes.append({"op": "upsert", "semester": entry.semester, "subject": entry.subject, "file": entry.file_info})
+            self.counters["deltas"] += 1
+            payload = {"cursor": self.cursor, "reset": False, "changes": changes}
+        return payload["cursor"], json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _rebuild(self) -> None:
+        files_by_semester: Dict[str, Dict[str, List[Dict]]] = {}
+        # Same order as the old per-request directory walk
+        for name in sorted(self._entries):
+            entry = self._entries[name]
+            files_by_semester.setdefault(entry.semester, {}).setdefault(entry.subject, []).append(entry.file_info)
+
+        # Same encoding JSONResponse uses
+        body = json.dumps(files_by_semester, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+        if body == self.body and self.version:
+            return
+        self.body = body
+        self.etag = self._etag_for(body)
+        self.version += 1
+        self.counters["rebuilds"] += 1
+        logger.info(
+            "📊 Lecture catalog v%d: %d semesters with total %d files",
+            self.version,
+            len(files_by_semester),
+            len(self._entries),
+        )
+
+    def _needs_refresh(self) -> Tuple[bool, bool]:
+        """(scan, reload_db) for a watcher tick; a stat of the directory is the common case"""
+        if time.monotonic() - self._last_reconcile >= LECTURE_CATALOG_RECONCILE_SECONDS:
+            return True, True
+        try:
+            dir_mtime_ns = DOWNLOAD_DIR.stat().st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime_ns = None
+        # Added/removed/renamed files change the directory mtime; rows arrive with new files
+        if dir_mtime_ns != self._dir_mtime_ns:
+            return True, True
+        return False, False
+
+    async def run_forever(self) -> None:
+        """Directory watcher: picks up files added or removed outside the sync worker"""
+        logger.info("Lecture catalog watcher started. Polling every %s seconds", LECTURE_CATALOG_POLL_SECONDS)
+        while True:
+            await asyncio.sleep(LECTURE_CATALOG_POLL_SECONDS)
+            try:
+                scan, reload_db = self._needs_refresh()
+                if scan:
+                    await asyncio.to_thread(self.refresh, reload_db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Lecture catalog refresh failed: %s", exc)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "version": self.version,
+            "files": len(self._entries),
+            "body_bytes": len(self.body),
+            "cursor": self.cursor,
+            "changelog": len(self._changes),
+        }
+
+
+# Global instance (similar to change_events)
+lecture_catalog = LectureCatalog()
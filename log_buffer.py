@@ -0,0 +1,164 @@
+"""
+Log Write-Behind Buffer for SwiftSync
+Collects visitor and threat log rows in memory and writes them in bulk transactions
+so request handling never waits on a SQLite commit
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Optional
+
+import pytz
+
+import database as db
+from user_agents import device_for_log
+
+logger = logging.getLogger(__name__)
+
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "250"))
+# Flush early once this many rows are waiting
+LOG_FLUSH_BATCH_ROWS = int(os.getenv("LOG_FLUSH_BATCH_ROWS", "200"))
+# Hard cap on buffered rows; further rows are dropped (and counted) until the next flush
+LOG_BUFFER_MAX_ROWS = int(os.getenv("LOG_BUFFER_MAX_ROWS", "10000"))
+
+_TIMEZONE = pytz.timezone('Asia/Baghdad')
+
+
+class LogWriteBuffer:
+    """Bounded in-memory queue of visitor/threat rows flushed by a background task"""
+
+    def __init__(
+        self,
+        flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+        batch_rows: int = LOG_FLUSH_BATCH_ROWS,
+        max_rows: int = LOG_BUFFER_MAX_ROWS,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_rows = batch_rows
+        self.max_rows = max_rows
+        self._visitors: Deque[tuple] = deque()
+        self._threats: Deque[tuple] = deque()
+        self._lock = threading.Lock()
+        # Serializes flushes between the background task and shutdown
+        self._flush_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+        self.counters = {
+            "buffered": 0,
+            "written": 0,
+            "flushes": 0,
+            "early_flushes": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+
+    def pending(self) -> int:
+        return len(self._visitors) + len(self._threats)
+
+    def log_visitor(self, ip_address: str, action: str, user_agent: str = None, path: str = None, username: str = None) -> None:
+        """Same arguments as database.log_visitor; the row is written by the next flush"""
+        if not self._running:
+            db.log_visitor(ip_address, action, user_agent, path, username)
+            return
+        now = datetime.now(_TIMEZONE)
+        row = (ip_address, now.isoformat(), int(now.timestamp()), action, user_agent, path, username, device_for_log(user_agent))
+        self._enqueue(self._visitors, row)
+
+    def log_threat(self, ip_address: str, threat_type: str, details: str, action_taken: str = "DETECTED") -> None:
+        """Same arguments as database.log_threat_detection; the row is written by the next flush"""
+        if not self._running:
+            db.log_threat_detection(ip_address, threat_type, details, action_taken=action_taken)
+            return
+        now = datetime.now(_TIMEZONE)
+        row = (ip_address, threat_type, details, now.isoformat(), int(now.timestamp()), action_taken)
+        self._enqueue(self._threats, row)
+
+    def _enqueue(self, queue: Deque[tuple], row: tuple) -> None:
+        with self._lock:
+            if self.pending() >= self.max_rows:
+                self.counters["dropped"] += 1
+                return
+            queue.append(row)
+            self.counters["buffered"] += 1
+            pending = self.pending()
+        if pending >= self.batch_rows:
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is None or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self) -> int:
+        """Write everything buffered so far in one transaction per table. Blocking."""
+        with self._flush_lock:
+            with self._lock:
+                visitors = list(self._visitors)
+                threats = list(self._threats)
+                self._visitors.clear()
+                self._threats.clear()
+            try:
+                db.flush_block_hits()
+            except Exception as exc:  # noqa: BLE001
+                logger.error("Block hit counter flush failed: %s", exc)
+            if not visitors and not threats:
+                return 0
+            # Separate transactions: a failed threat insert must not count the visitor rows
+            # that did commit as lost, or hide them from "written"
+            written = self._write(db.log_visitors_bulk, visitors, "visitor")
+            written += self._write(db.log_threats_bulk, threats, "threat")
+            self.counters["written"] += written
+            self.counters["flushes"] += 1
+            return written
+
+    def _write(self, write_bulk, rows: list, kind: str) -> int:
+        if not rows:
+            return 0
+        try:
+            return write_bulk(rows)
+        except Exception as exc:  # noqa: BLE001
+            self.counters["failed"] += len(rows)
+            logger.error("Log buffer flush failed, %d %s rows lost: %s", len(rows), kind, exc)
+            return 0
+
+    async def run_forever(self) -> None:
+        """Background flusher, started from the app lifespan like the sync worker."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._running = True
+        logger.info(
+            "Log buffer started. Flush every %dms or %d rows, cap %d rows",
+            int(self.flush_interval * 1000),
+            self.batch_rows,
+            self.max_rows,
+        )
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                    self.counters["early_flushes"] += 1
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await asyncio.to_thread(self.flush)
+        finally:
+            # Stop buffering first so late rows go straight to the database, then drain
+            # off the event loop (other lifespan tasks are still shutting down on it)
+            self._running = False
+            await asyncio.to_thread(self.flush)
+
+
+# Global instance (similar to change_events)
+log_buffer = LogWriteBuffer()
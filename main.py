@@ -6,8 +6,6 @@ import json
 import logging
 import os
 import re
-import difflib
-import sqlite3
 import time
 import requests
 from datetime import datetime
@@ -18,18 +16,34 @@ from bs4 import BeautifulSoup
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Header, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import MutableHeaders
 import uvicorn
 
 from auth import AuthClient, AuthConfig, AuthError
-from sync import DOWNLOAD_DIR, SYNC_INTERVAL_SECONDS, sync_once, _was_notified, _mark_notified, _get_semester_from_subject
+from sync import DOWNLOAD_DIR, SYNC_INTERVAL_SECONDS, sync_once, _was_notified, _mark_notified
 from summarizer import summarize_single_lecture, summarize_all_lectures, SummarizationError
 from attendance import attendance_service
 from results import results_service
+from result_stats import ensure_result_stats, get_student_statistics
+from prefetcher import ResultsPrefetcher
+from events import change_events, EVENT_LECTURES, EVENT_RESULTS, EVENT_OFFICIAL_RESULTS, EVENT_ATTENDANCE, EVENTS_MAX_STREAMS_PER_STUDENT
 import database as db
+from db_pool import read_connection, write_connection
+from log_buffer import log_buffer
+from ip_trie import normalize_block_target, parse_ip
+from threat_rules import threat_engine
+from user_agents import ua_cache
+from lecture_catalog import lecture_catalog
+from subject_index import subject_index
+from rate_limiter import rate_limiter
+from leader_election import LeaderJob, leader_election
+from zip_stream import ZipLayout, ZipMember, ZipTooLarge, parse_single_range
+from page_cache import PageCache, etag_matches
+from static_bundles import BUNDLE_URL_PREFIX, IMMUTABLE_CACHE_CONTROL, externalize, prune_stale_bundles, service_worker_source
 from telegram_notifier import notify_new_lecture, notify_multiple_lectures, test_telegram_connection
 from telegram_config import telegram_status
 
@@ -42,15 +56,6 @@ IS_PRODUCTION = os.getenv("ENVIRONMENT", "").lower() == "production"
 _gemini_key = os.getenv("GEMINI_API_KEY")
 _openai_key = os.getenv("OPENAI_API_KEY")
 ADMIN_SECRET_KEY = (os.getenv("SECRET_ADMIN_KEY") or os.getenv("ADMIN_KEY") or "").strip()
-GENERIC_SUBJECT_LABELS = {
-    "",
-    "other",
-    "all lectures",
-    "general lectures",
-    "unknown",
-    "unknown subject",
-    "بابەتی جیاواز",
-}
 
 
 def _get_admin_keys() -> List[str]:
@@ -79,21 +84,64 @@ if _get_admin_keys():
     logger.info("[OK] Admin SOC key configured (hidden for security)")
 else:
     logger.warning("[WARN] No admin key found")
+
+
+def _leader_jobs() -> List[LeaderJob]:
+    """Jobs that must run in exactly one process: portal sync + notifications, results prefetch, log retention, results backfill"""
+    logger.info("Auto-sync worker enabled. Interval: %d seconds", SYNC_INTERVAL_SECONDS)
+    return [
+        ("Background sync worker", sync_worker),
+        ("Results prefetcher", results_prefetcher.run_forever),
+        ("Log retention worker", log_retention_worker),
+        ("Results maintenance", results_maintenance),
+    ]
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
-    # Startup
-    sync_task = asyncio.create_task(sync_worker(), name="swiftsync-sync-worker")
-    logger.info("Auto-sync worker enabled. Interval: %d seconds", SYNC_INTERVAL_SECONDS)
+    # Startup: serve HTTP, buffer logs, sync rate-limit counters and watch the catalog;
+    # the jobs in _leader_jobs run only once this process holds the leader lock
+    # (a single worker is supported, see leader_election)
+    leader_task = asyncio.create_task(leader_election.run_forever(_leader_jobs), name="swiftsync-leader-election")
+    log_flush_task = asyncio.create_task(log_buffer.run_forever(), name="swiftsync-log-buffer")
+    rate_limit_task = asyncio.create_task(rate_limiter.run_forever(), name="swiftsync-rate-limit-sync")
+    catalog_task = asyncio.create_task(lecture_catalog.run_forever(), name="swiftsync-lecture-catalog")
+    try:
+        await asyncio.to_thread(lecture_catalog.refresh)
+    except Exception as e:
+        logger.error(f"Lecture catalog build failed (will retry on first request): {e}")
+    try:
+        await dashboard_page.get()
+        stale_bundles = prune_stale_bundles()
+        if stale_bundles:
+            logger.info("Removed %d stale static bundles", stale_bundles)
+    except Exception as e:
+        logger.error(f"Dashboard pre-render failed (will retry on first request): {e}")
     
     yield
     
     # Shutdown (if needed)
-    sync_task.cancel()
+    leader_task.cancel()
+    log_flush_task.cancel()
+    rate_limit_task.cancel()
+    catalog_task.cancel()
     try:
-        await sync_task
+        await leader_task
     except asyncio.CancelledError:
-        logger.info("Background sync worker cancelled")
+        logger.info("Leader election stopped")
+    try:
+        await log_flush_task
+    except asyncio.CancelledError:
+        logger.info("Log buffer flushed and stopped")
+    try:
+        await rate_limit_task
+    except asyncio.CancelledError:
+        logger.info("Rate limit sync stopped")
+    try:
+        await catalog_task
+    except asyncio.CancelledError:
+        logger.info("Lecture catalog watcher cancelled")
     logger.info("Application shutting down")
 
 app = FastAPI(
@@ -104,8 +152,19 @@ app = FastAPI(
 )
 auth_client = AuthClient(AuthConfig())
 
+class _GZipExceptDownloads(GZipMiddleware):
+    """GZip for everything except lecture downloads (single files and ZIPs): PDFs barely
+    compress, and a gzip-encoded 200 cannot be resumed with byte ranges of the file"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(("/api/download/", "/api/download-zip")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # Add compression for faster data transfer (70% smaller responses)
-app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+app.add_middleware(_GZipExceptDownloads, minimum_size=1000, compresslevel=6)
 
 # Add CORS middleware with safe defaults (allow explicit origins only)
 _allowed_origins_env = os.getenv("ALLOWED_ORIGINS", "").strip()
@@ -151,6 +210,8 @@ app.mount("/static", StaticFiles(directory=static_dir, html=False), name="static
 # Cache official results snapshots to avoid hard failures when upstream is slow/unstable.
 OFFICIAL_RESULTS_CACHE_PATH = Path(os.getenv("OFFICIAL_RESULTS_CACHE_PATH", "data/official_results_cache.json"))
 OFFICIAL_RESULTS_CACHE_TTL_SECONDS = max(300, int(os.getenv("OFFICIAL_RESULTS_CACHE_TTL_SECONDS", "21600")))
+# Snapshots younger than this are served without contacting the portal (kept warm by the prefetcher).
+OFFICIAL_RESULTS_FRESH_SECONDS = int(os.getenv("OFFICIAL_RESULTS_FRESH_SECONDS", "600"))
 
 
 def _read_official_results_cache() -> dict:
@@ -214,6 +275,11 @@ def get_real_client_ip(request: Request) -> str:
     Get the real client IP address from request, handling all proxy headers.
     Checks multiple headers in order of reliability.
     """
+    # Already resolved by SecurityMiddleware for this request
+    resolved = request.scope.get("state", {}).get("client_ip")
+    if resolved:
+        return resolved
+
     direct_ip = request.client.host if request.client else "unknown"
 
     # Only trust forwarded headers when explicitly enabled.
@@ -269,7 +335,9 @@ TRUSTED_PROXY_IPS = {
 
 RATE_LIMIT_SYNC_PER_MINUTE = int(os.getenv("RATE_LIMIT_SYNC_PER_MINUTE", "6"))
 RATE_LIMIT_SUMMARY_PER_MINUTE = int(os.getenv("RATE_LIMIT_SUMMARY_PER_MINUTE", "30"))
-_rate_limiter_store = {}
+RATE_LIMIT_ZIP_PER_MINUTE = int(os.getenv("RATE_LIMIT_ZIP_PER_MINUTE", "20"))
+# Monitored-path requests per minute before a client is flagged as RATE_LIMIT_ABUSE
+RATE_LIMIT_ABUSE_PER_MINUTE = int(os.getenv("RATE_LIMIT_ABUSE_PER_MINUTE", "100"))
 AUTO_BLOCK_THREATS = os.getenv("AUTO_BLOCK_THREATS", "false").strip().lower() in {"1", "true", "yes"}
 AUTO_BLOCK_HIGH_CONFIDENCE_THREATS = {
     "SQL_INJECTION_ATTEMPT",
@@ -311,17 +379,18 @@ def _is_date_window_active(start_date: str, end_date: str) -> bool:
 
 def _get_homepage_banner_settings() -> dict:
     """Load homepage banner settings with safe fallback defaults."""
+    settings = db.get_system_settings()
     # Backward compatibility: if new Kurdish key is empty, use old single-key value.
-    configured_text_ku = (db.get_system_setting("homepage_banner_text_ku", "") or "").strip()
-    legacy_text = (db.get_system_setting("homepage_banner_text", "") or "").strip()
-    configured_text_en = (db.get_system_setting("homepage_banner_text_en", "") or "").strip()
+    configured_text_ku = (settings.get("homepage_banner_text_ku") or "").strip()
+    legacy_text = (settings.get("homepage_banner_text") or "").strip()
+    configured_text_en = (settings.get("homepage_banner_text_en") or "").strip()
 
     if not configured_text_ku and legacy_text:
         configured_text_ku = legacy_text
 
-    enabled_raw = (db.get_system_setting("homepage_banner_enabled", "true") or "true").strip().lower()
-    start_date = (db.get_system_setting("homepage_banner_start_date", "") or "").strip()
-    end_date = (db.get_system_setting("homepage_banner_end_date", "") or "").strip()
+    enabled_raw = (settings.get("homepage_banner_enabled") or "true").strip().lower()
+    start_date = (settings.get("homepage_banner_start_date") or "").strip()
+    end_date = (settings.get("homepage_banner_end_date") or "").strip()
 
     is_enabled = enabled_raw not in {"0", "false", "no", "off"}
     in_window = _is_date_window_active(start_date, end_date)
@@ -359,63 +428,51 @@ def _resolve_session_token(request: Request) -> str:
 
 
 def _is_rate_limited(client_ip: str, scope: str, max_requests: int, window_seconds: int = 60) -> bool:
-    """Simple in-memory sliding-window limiter to protect expensive endpoints."""
-    now = time.monotonic()
-    key = f"{client_ip}:{scope}"
-    timestamps = _rate_limiter_store.get(key, [])
-    valid_after = now - window_seconds
-    timestamps = [ts for ts in timestamps if ts >= valid_after]
-    limited = len(timestamps) >= max_requests
-    if not limited:
-        timestamps.append(now)
-    _rate_limiter_store[key] = timestamps
-    return limited
-
-
-# Security Middleware - IP Blocking
-@app.middleware("http")
-async def security_middleware(request: Request, call_next):
-    """
-    Security middleware to block blacklisted IPs and log visitors
-    Optimized for performance with minimal overhead
-    """
-    # Get real client IP (handle all proxy headers)
-    client_ip = get_real_client_ip(request)
-    
-    # Continue processing request
-    response = await call_next(request)
-    
-    # Add PWA and mobile-friendly headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "SAMEORIGIN"
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    """Sliding-window limiter (rate_limiter.py) to protect expensive endpoints."""
+    return rate_limiter.hit(f"{client_ip}:{scope}", max_requests, window_seconds)
+
+
+def _apply_security_headers(path: str, status_code: int, headers: MutableHeaders) -> None:
+    """Add PWA and mobile-friendly headers to a response"""
+    headers["X-Content-Type-Options"] = "nosniff"
+    headers["X-Frame-Options"] = "SAMEORIGIN"
+    # Responses that set their own caching policy (e.g. the ETag-validated dashboard) keep it
+    if "cache-control" not in headers:
+        headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     
     # Allow service worker and manifest to be cached
-    if request.url.path in ["/service-worker.js", "/manifest.json"]:
-        response.headers["Cache-Control"] = "public, max-age=0"
-    
-    return response
+    if path in ["/service-worker.js", "/manifest.json"]:
+        headers["Cache-Control"] = "public, max-age=0"
+    # Fingerprinted bundles never change under the same URL
+    elif path.startswith(BUNDLE_URL_PREFIX) and status_code == 200:
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
 
+def _auto_block(client_ip: str, threat_type: str) -> None:
+    """Blacklist the IP and the usernames seen on it (blocking DB writes + snapshot reloads)"""
+    db.block_ip(client_ip, reason=f"AUTO_BLOCK: {threat_type}")
 
-@app.middleware("http")
-async def visitor_tracking_middleware(request: Request, call_next):
+    # Also block any known identities seen on this IP to reduce VPN bypass.
+    for known_username in db.get_recent_usernames_by_ip(client_ip, limit=10):
+        db.block_identity("username", known_username, reason=f"Linked to {client_ip} ({threat_type})")
+
+
+async def _screen_request(request: Request, client_ip: str):
     """
-    Separate middleware for visitor tracking and security checks
+    Block checks, visitor logging and threat detection for one request.
+    Returns the response to send instead of calling the app, or None to continue.
     """
-    # Get real client IP (handle all proxy headers)
-    client_ip = get_real_client_ip(request)
-    
     # Allow admin portal access with correct key even if IP is blocked
     if request.url.path.startswith("/admin-portal"):
         admin_key = request.query_params.get("admin_key")
         if _is_valid_admin_key(admin_key):
             # Log the access and continue
-            db.log_visitor(client_ip, f"Admin Portal Access (Bypassed Block)", request.headers.get("user-agent"), request.url.path)
-            return await call_next(request)
+            log_buffer.log_visitor(client_ip, f"Admin Portal Access (Bypassed Block)", request.headers.get("user-agent"), request.url.path)
+            return None
     
-    # Fast IP block check (uses indexed database lookup)
-    if db.is_ip_blocked(client_ip):
-        block_details = db.get_ip_block_details(client_ip) or {}
+    # Fast IP block check (in-memory snapshot: exact IPs plus CIDR ranges)
+    block_details = db.match_ip_block(client_ip)
+    if block_details:
         block_reason = html_lib.escape((block_details.get("reason") or "Blocked by security policy."), quote=True)
         blocked_at = html_lib.escape((block_details.get("blocked_at") or "Unknown"), quote=True)
         detail_section = (
@@ -489,77 +546,53 @@ async def visitor_tracking_middleware(request: Request, call_next):
     monitored_paths = ["/", "/check-attendance", "/admin-portal"]
     if any(request.url.path.startswith(path) for path in monitored_paths):
         user_agent = request.headers.get("User-Agent", "Unknown")
-        db.log_visitor(client_ip, f"Visit: {request.url.path}", user_agent, request.url.path)
+        log_buffer.log_visitor(client_ip, f"Visit: {request.url.path}", user_agent, request.url.path)
         
         # Skip security checks for whitelisted IPs
         if db.is_ip_whitelisted(client_ip):
-            response = await call_next(request)
-            return response
+            return None
         
         # SOC Threat Detection System - Multi-layered security
         threat_detected = False
         threat_type = None
         threat_details = None
         
-        # 1. Rate Limit Detection (DDoS)
-        if db.detect_rate_limit_abuse(client_ip, time_window_minutes=1, max_requests=100):
+        # 1. Rate Limit Detection (DDoS) - in-memory/shared counter, no SQLite COUNT per request
+        if _is_rate_limited(client_ip, "requests", RATE_LIMIT_ABUSE_PER_MINUTE):
             threat_detected = True
             threat_type = "RATE_LIMIT_ABUSE"
-            threat_details = "Excessive requests detected (>100 req/min)"
+            threat_details = f"Excessive requests detected (>{RATE_LIMIT_ABUSE_PER_MINUTE} req/min)"
         
-        # 2. Suspicious User Agent Detection (Bot)
-        elif db.detect_suspicious_user_agent(user_agent):
-            threat_detected = True
-            threat_type = "SUSPICIOUS_USER_AGENT"
-            threat_details = f"Malicious bot detected: {user_agent[:100]}"
-        
-        # 3. SQL Injection Detection in URL
-        elif db.detect_sql_injection(str(request.url)):
-            threat_detected = True
-            threat_type = "SQL_INJECTION_ATTEMPT"
-            threat_details = f"SQL injection pattern in URL: {request.url.path}"
-        
-        # 4. XSS Attack Detection in Query Parameters
-        elif any(db.detect_xss_attack(str(value)) for value in request.query_params.values()):
-            threat_detected = True
-            threat_type = "XSS_ATTACK_ATTEMPT"
-            threat_details = "XSS pattern detected in query parameters"
-        
-        # 5. Path Traversal Detection
-        elif db.detect_path_traversal(request.url.path):
-            threat_detected = True
-            threat_type = "PATH_TRAVERSAL_ATTEMPT"
-            threat_details = f"Path traversal pattern in URL: {request.url.path}"
-        
-        # 6. Command Injection Detection in all parameters
-        elif any(db.detect_command_injection(str(value)) for value in request.query_params.values()):
-            threat_detected = True
-            threat_type = "COMMAND_INJECTION_ATTEMPT"
-            threat_details = "Command injection pattern detected"
-        
-        # 7. Header Injection Detection
-        elif any(db.detect_xss_attack(str(value)) for key, value in request.headers.items() 
-                 if key.lower() not in ['user-agent', 'accept', 'accept-encoding', 'accept-language', 'connection', 'host']):
-            threat_detected = True
-            threat_type = "HEADER_INJECTION_ATTEMPT"
-            threat_details = "Suspicious patterns in HTTP headers"
+        # 2-7. Bot user agent, SQL injection (URL), XSS (query), path traversal,
+        # command injection (query), header injection - one compiled pass per input
+        else:
+            threat_match = threat_engine.inspect_request(
+                url=str(request.url),
+                path=request.url.path,
+                query_values=list(request.query_params.values()),
+                headers=request.headers.items(),
+                user_agent=user_agent,
+            )
+            if threat_match:
+                threat_detected = True
+                threat_type = threat_match.threat_type
+                threat_details = threat_match.details
         
         # Auto-block if threat detected
         if threat_detected:
             should_auto_block = AUTO_BLOCK_THREATS and threat_type in AUTO_BLOCK_HIGH_CONFIDENCE_THREATS
             action_taken = "LOG_ONLY"
 
-            if should_auto_block:
-                reason = f"AUTO_BLOCK: {threat_type}"
-                db.block_ip(client_ip, reason=reason)
-
-                # Also block any known identities seen on this IP to reduce VPN bypass.
-                for known_username in db.get_recent_usernames_by_ip(client_ip, limit=10):
-                    db.block_identity("username", known_username, reason=f"Linked to {client_ip} ({threat_type})")
+            if should_auto_block and parse_ip(client_ip) is None:
+                logger.warning(f"Cannot auto-block unparseable client address: {client_ip!r}")
+                should_auto_block = False
 
+            if should_auto_block:
+                # Off the event loop: the writes wait on the SQLite writer lock
+                await asyncio.to_thread(_auto_block, client_ip, threat_type)
                 action_taken = "AUTO_BLOCKED"
 
-            db.log_threat_detection(client_ip, threat_type, threat_details, action_taken=action_taken)
+            log_buffer.log_threat(client_ip, threat_type, threat_details, action_taken=action_taken)
 
             if should_auto_block:
                 logger.warning(f"⚠️ THREAT DETECTED AND BLOCKED: {client_ip} - {threat_type}")
@@ -577,8 +610,96 @@ async def visitor_tracking_middleware(request: Request, call_next):
             logger.warning(f"⚠️ THREAT DETECTED (log-only): {client_ip} - {threat_type}")
     
     # Continue processing request
-    response = await call_next(request)
-    return response
+    return None
+
+
+# Security Middleware - IP blocking, threat detection, visitor logging and response headers
+class SecurityMiddleware:
+    """
+    Pure ASGI middleware: resolves the client IP once, answers blocked requests itself and
+    adds the security headers as the response starts. Unlike @app.middleware("http")
+    (BaseHTTPMiddleware) it adds no extra task or body stream per request, so file
+    downloads and GZip stream straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        client_ip = get_real_client_ip(request)
+        # Endpoints read it back through get_real_client_ip() instead of re-parsing headers
+        scope.setdefault("state", {})["client_ip"] = client_ip
+        path = request.url.path
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                _apply_security_headers(path, message["status"], MutableHeaders(scope=message))
+            await send(message)
+
+        early_response = await _screen_request(request, client_ip)
+        if early_response is not None:
+            await early_response(scope, receive, send_with_headers)
+            return
+        await self.app(scope, receive, send_with_headers)
+
+
+app.add_middleware(SecurityMiddleware)
+
+
+LOG_RETENTION_INTERVAL_SECONDS = int(os.getenv("LOG_RETENTION_INTERVAL_SECONDS", "3600"))
+
+
+async def results_maintenance() -> None:
+    """
+    One-off leader job: normalize results stored before the normalized columns
+    existed, then build result_stats if it is empty. Off the import path so
+    workers start without scanning the results table.
+    """
+    try:
+        await asyncio.to_thread(results_service.backfill_normalization)
+        await asyncio.to_thread(ensure_result_stats)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Results maintenance failed: %s", exc)
+
+
+async def log_retention_worker() -> None:
+    """
+    Background worker that rolls old visitor/threat logs into aggregate tables
+    and prunes them, so the database and admin queries stay bounded.
+    """
+    await asyncio.sleep(60)
+    logger.info(
+        "Log retention worker started. Raw logs kept %d days, interval %d seconds",
+        db.LOG_RETENTION_DAYS,
+        LOG_RETENTION_INTERVAL_SECONDS,
+    )
+    while True:
+        try:
+            summary = await asyncio.to_thread(db.rollup_and_prune_logs)
+            if any(summary.values()):
+                logger.info("Log retention: %s", summary)
+            expired_limits = await asyncio.to_thread(rate_limiter.prune)
+            if expired_limits:
+                logger.info("Rate limiter: pruned %d expired counters", expired_limits)
+        except asyncio.CancelledError:
+            logger.info("Log retention worker received cancellation signal")
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Log retention run failed: %s", exc)
+        await asyncio.sleep(LOG_RETENTION_INTERVAL_SECONDS)
+
+
+def _publish_synced_lectures(files: List[Path]) -> None:
+    """Tell connected clients that new lectures landed so they reload /api/files once."""
+    if files:
+        change_events.publish(EVENT_LECTURES, {"files": [f.name for f in files], "count": len(files)})
 
 
 async def sync_worker() -> None:
@@ -595,6 +716,8 @@ async def sync_worker() -> None:
         try:
             logger.info("Checking for new lectures...")
             added, files, new_item_ids, subject_map = await asyncio.to_thread(sync_once, auth_client, send_notifications=True)
+            await asyncio.to_thread(lecture_catalog.refresh)
+            _publish_synced_lectures(files)
             
             if new_item_ids:
                 logger.info("✅ Synced %s new file(s), sending notifications for %s NEW items", added, len(new_item_ids))
@@ -677,11 +800,13 @@ async def get_manifest():
 
 @app.get("/service-worker.js")
 async def get_service_worker():
-    """Serve service worker with correct MIME type"""
-    from fastapi.responses import FileResponse
+    """Serve service worker with correct MIME type; CORE_ASSETS gets the dashboard bundles"""
     sw_path = Path("service-worker.js")
     if sw_path.exists():
-        return FileResponse(sw_path, media_type="application/javascript")
+        # Bundle URLs are known once the dashboard has been rendered
+        await dashboard_page.get()
+        source = service_worker_source(sw_path.read_text(encoding="utf-8"), "dashboard")
+        return Response(content=source, media_type="application/javascript")
     return JSONResponse({"error": "Service worker not found"}, status_code=404)
 
 
@@ -697,6 +822,8 @@ async def manual_sync(request: Request) -> JSONResponse:
             }, status_code=429)
 
         added, files, new_item_ids, subject_map = await asyncio.to_thread(sync_once, auth_client, send_notifications=True)
+        await asyncio.to_thread(lecture_catalog.refresh)
+        _publish_synced_lectures(files)
         
         # Send Telegram notifications ONLY for items that haven't been notified yet
         notifications_sent = 0
@@ -828,157 +955,47 @@ async def upload_data(request: Request, package: bytes = None, admin_key: str =
         }, status_code=500)
 
 
-def _infer_subject_from_filename(filename: str):
-    """Best-effort subject guess from the lecture filename.
-
-    This is used when the sync database doesn't yet have a subject
-    (for example, if the portal HTML changed or a fallback path ran).
-    It tries to avoid putting files into the generic "Other" bucket
-    when we can reasonably match them to a known subject.
-    """
-    name = filename.lower()
-
-    subject_keywords = {
-        "Data Communication": ["data communication"],
-        "Database Design": ["database design", "db design"],
-        "Numerical Analysis and Probability": ["numerical analysis", "probability"],
-        "Object Oriented Programming": ["object oriented programming", "oop"],
-        "Software Design and Modelling with UML": ["software design", "uml"],
-        "Combinatorics and Graph Theory": ["combinatorics", "graph theory"],
-        "Database Principles": ["database principles"],
-        "Data Structures and Algorithms": ["data structures", "algorithms"],
-        "Mathematics III": ["mathematics iii", "math iii", "math 3"],
-        "Software Engineering Principles": ["software engineering"],
-        "Introduction to OOP": ["introduction to oop", "intro to oop"],
-    }
-
-    for subject, keywords in subject_keywords.items():
-        for kw in keywords:
-            if kw in name:
-                return subject
-
-    # Secondary heuristic: normalize and fuzzy-match against known subject labels.
-    normalized_name = re.sub(r'[^a-z0-9]+', ' ', name).strip()
-    if normalized_name:
-        all_known_subjects = list(subject_keywords.keys())
-        best_match = None
-        best_score = 0.0
-        for candidate in all_known_subjects:
-            candidate_norm = re.sub(r'[^a-z0-9]+', ' ', candidate.lower()).strip()
-            score = 0.0
-            if candidate_norm and normalized_name:
-                score = difflib.SequenceMatcher(None, normalized_name, candidate_norm).ratio()
-            if score > best_score:
-                best_score = score
-                best_match = candidate
-
-        if best_match and best_score >= 0.55:
-            return best_match
-
-    return None
-
-
-def _normalize_subject_value(subject: str):
-    value = (subject or "").strip()
-    if not value:
-        return None
-    if value.lower() in GENERIC_SUBJECT_LABELS:
-        return None
-    return value
-
-
-def _infer_semester_from_filename(filename: str) -> str:
-    """Infer semester from filename when DB metadata is missing."""
-    name = filename.lower()
-    if "fall semester" in name or " fall " in f" {name} ":
-        return "Fall Semester"
-    if "spring semester" in name or " spring " in f" {name} ":
-        return "Spring Semester"
-    return ""
-
-
 @app.get("/api/files")
-async def list_files() -> JSONResponse:
-    """List all files grouped by semester and subject"""
-    import sqlite3
-    from pathlib import Path
-
-    files_by_semester = {}
+async def list_files(request: Request, since: str = None) -> Response:
+    """
+    List all files grouped by semester and subject (served from the in-memory lecture catalog)
 
-    # Try to get subject, semester information and upload dates from database
-    db_path = Path(__file__).parent / "data" / "lecture_sync.db"
-    if db_path.exists():
-        try:
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.execute("SELECT filename, subject, upload_date, semester FROM synced_items WHERE filename IS NOT NULL")
-                db_info = {row[0]: {"subject": row[1], "upload_date": row[2], "semester": row[3]} for row in cursor.fetchall()}
-        except Exception as e:
-            logger.error("Error reading data from database: %s", e)
-            db_info = {}
+    ?since=<cursor> returns only the adds/updates/removes after that cursor plus a new cursor,
+    or the full catalog with "reset": true when the cursor is empty, unknown or too old.
+    """
+    if lecture_catalog.version == 0:
+        await asyncio.to_thread(lecture_catalog.refresh)
+
+    body, etag = lecture_catalog.body, lecture_catalog.etag
+    # A delta (or reset) for a ?since= URL is determined by the current catalog state; weak
+    # because workers that saw different intermediate states may answer delta vs reset
+    headers = {"ETag": etag if since is None else f"W/{etag}", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        lecture_catalog.counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    if since is not None:
+        # The catalog may have moved on since etag was read; label the body it actually holds
+        cursor, body = lecture_catalog.changes_since(since)
+        headers["ETag"] = f'W/"{cursor}"'
     else:
-        db_info = {}
-
-    # List all files
-    if DOWNLOAD_DIR.exists():
-        for path in sorted(DOWNLOAD_DIR.iterdir()):
-            if path.is_file():
-                stat = path.stat()
-                file_db_info = db_info.get(path.name, {})
-
-                # Prefer a non-generic subject from DB, otherwise infer from filename.
-                subject = _normalize_subject_value(file_db_info.get("subject"))
-                if not subject:
-                    subject = _infer_subject_from_filename(path.name)
-                if not subject:
-                    subject = "Temporary"
-
-                # Prefer semester from DB, otherwise derive from subject (if known)
-                semester = file_db_info.get("semester")
-                inferred_semester = _infer_semester_from_filename(path.name)
-                if inferred_semester:
-                    semester = inferred_semester
-                if not semester:
-                    if subject and _normalize_subject_value(subject):
-                        try:
-                            semester = _get_semester_from_subject(subject)
-                        except Exception:
-                            semester = "Spring Semester"
-                    else:
-                        semester = "Spring Semester"
-
-                # Use upload_date from database if available, otherwise fall back to file modified time
-                upload_date = file_db_info.get("upload_date")
-                if not upload_date:
-                    upload_date = datetime.fromtimestamp(stat.st_mtime).isoformat()
-
-                file_info = {
-                    "name": path.name,
-                    "size_bytes": stat.st_size,
-                    "modified": upload_date,  # This is now the original upload date from the portal
-                    "url": f"/files/{path.name}",
-                }
-
-                # Group by semester first, then by subject
-                if semester not in files_by_semester:
-                    files_by_semester[semester] = {}
-                if subject not in files_by_semester[semester]:
-                    files_by_semester[semester][subject] = []
-                files_by_semester[semester][subject].append(file_info)
-
-    logger.info(f"📊 API returning {len(files_by_semester)} semesters with total {sum(sum(len(files) for files in subjects.values()) for subjects in files_by_semester.values())} files")
-    return JSONResponse(files_by_semester)
+        lecture_catalog.counters["served"] += 1
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/download/{filename}")
 async def download_file(filename: str, request: Request, _: str = None):
     """
-    Download a file with forced attachment headers - prevents preview and caching
+    Download a file with forced attachment headers - prevents preview
     
     iOS Safari Fix: Forces download instead of preview
     - Uses application/octet-stream for PDFs to prevent Safari's inline viewer
     - Adds X-Content-Type-Options to prevent MIME sniffing
     - Multiple Content-Disposition formats for maximum compatibility
     
+    Resumable / revalidated downloads:
+    - Strong ETag (content hash); If-None-Match answers 304
+    - Range requests answer 206, and If-Range only resumes when the ETag still matches
+    
     Note: Safari may still open PDFs if user taps "Open in..." after download
     This is iOS behavior and cannot be prevented server-side.
     """
@@ -993,11 +1010,15 @@ async def download_file(filename: str, request: Request, _: str = None):
     if base_dir not in file_path.parents:
         raise HTTPException(status_code=400, detail="Invalid filename")
 
-    if not file_path.exists() or not file_path.is_file():
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        stat_result = None
+    if stat_result is None or not file_path.is_file():
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Get file size for Content-Length
-    file_size = os.path.getsize(file_path)
+    # Hashed once per file version, then served from memory
+    etag = await asyncio.to_thread(lecture_catalog.file_etag, file_path, stat_result)
     
     # URL encode filename for proper header
     encoded_filename = urllib.parse.quote(safe_filename)
@@ -1020,23 +1041,37 @@ async def download_file(filename: str, request: Request, _: str = None):
     else:
         content_type = 'application/octet-stream'
     
+    if is_ios:
+        # Force no caching - critical for iOS
+        cache_headers = {
+            'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0, private',
+            'Pragma': 'no-cache',
+            'Expires': '0',
+        }
+    else:
+        # Browser may keep the file but must revalidate (a 304 instead of the whole PDF)
+        cache_headers = {'Cache-Control': 'private, no-cache'}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Accept-Ranges': 'bytes', **cache_headers})
+    
+    # FileResponse serves Range (206/416) and checks If-Range against the ETag / Last-Modified below
     return FileResponse(
         path=file_path,
         filename=safe_filename,
         media_type=content_type,
+        stat_result=stat_result,
         headers={
             # Multiple Content-Disposition formats for maximum compatibility
             'Content-Disposition': f'attachment; filename="{safe_filename}"; filename*=UTF-8\'\'{encoded_filename}',
             'Content-Type': content_type,
-            'Content-Length': str(file_size),
+            'ETag': etag,
+            'Accept-Ranges': 'bytes',
             
             # Prevent MIME sniffing (iOS may try to detect PDF and show preview)
             'X-Content-Type-Options': 'nosniff',
             
-            # Force no caching - critical for iOS
-            'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0, private',
-            'Pragma': 'no-cache',
-            'Expires': '0',
+            **cache_headers,
             
             # iOS-specific: Prevent inline viewing and force download
             'Content-Transfer-Encoding': 'binary',
@@ -1046,6 +1081,98 @@ async def download_file(filename: str, request: Request, _: str = None):
     )
 
 
+def _build_zip_layout(selected: List[tuple], subject_folders: bool) -> ZipLayout:
+    """Archive layout for catalog rows; a semester archive puts each subject in its own folder"""
+    members = []
+    for semester, subject, name in selected:
+        path = DOWNLOAD_DIR / name
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            continue
+        _, crc = lecture_catalog.file_digest(path, stat_result)
+        arcname = f"{subject.replace('/', '-')}/{name}" if subject_folders else name
+        members.append(ZipMember(arcname, path, stat_result.st_size, stat_result.st_mtime, crc, stat_result.st_mtime_ns))
+    return ZipLayout(members)
+
+
+# Layout rebuilds when lecture files keep changing underneath a ZIP request
+ZIP_LAYOUT_ATTEMPTS = 3
+
+
+def _current_zip_layout(selected: List[tuple], subject_folders: bool) -> ZipLayout:
+    """A layout whose ETag still describes the files on disk when streaming starts"""
+    for _ in range(ZIP_LAYOUT_ATTEMPTS - 1):
+        layout = _build_zip_layout(selected, subject_folders)
+        if layout.is_current():
+            return layout
+    # Still changing (e.g. a sync rewriting files); streaming stops at a member that changed
+    return _build_zip_layout(selected, subject_folders)
+
+
+@app.get("/api/download-zip")
+async def download_zip(request: Request, subject: str = None, semester: str = None):
+    """
+    Stream every lecture of a subject and/or semester as one ZIP (?subject=...&semester=...)
+    
+    Files are stored uncompressed and the layout is fixed by the file list, sizes, dates and
+    CRCs, so the archive has a Content-Length and a strong ETag and resumes with Range/If-Range.
+    """
+    import urllib.parse
+    
+    client_ip = get_real_client_ip(request)
+    if _is_rate_limited(client_ip, "download-zip", RATE_LIMIT_ZIP_PER_MINUTE):
+        return JSONResponse({
+            "success": False,
+            "error": "Too many download requests. Please wait and try again."
+        }, status_code=429)
+    
+    subject = (subject or "").strip() or None
+    semester = (semester or "").strip() or None
+    if not subject and not semester:
+        raise HTTPException(status_code=400, detail="subject or semester is required")
+    
+    if lecture_catalog.version == 0:
+        await asyncio.to_thread(lecture_catalog.refresh)
+    selected = lecture_catalog.select(subject=subject, semester=semester)
+    if not selected:
+        raise HTTPException(status_code=404, detail="No lectures found")
+    
+    try:
+        # CRCs come from the file_digests cache; only new file versions are read
+        layout = await asyncio.to_thread(_current_zip_layout, selected, subject is None)
+    except ZipTooLarge as exc:
+        raise HTTPException(status_code=413, detail=f"Archive too large ({exc}); download the files separately")
+    
+    archive_name = " - ".join(part for part in (semester, subject) if part).replace("/", "-") + ".zip"
+    headers = {
+        "ETag": layout.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(archive_name)}",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if etag_matches(request.headers.get("if-none-match"), layout.etag):
+        return Response(status_code=304, headers=headers)
+    
+    start, end, status_code = 0, layout.size, 200
+    if_range = request.headers.get("if-range")
+    # If-Range: resume only when the client's partial copy is of this exact archive
+    if if_range is None or if_range.strip() == layout.etag:
+        try:
+            byte_range = parse_single_range(request.headers.get("range"), layout.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{layout.size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.size}"
+    headers["Content-Length"] = str(end - start)
+    
+    logger.info(f"📦 ZIP download: {archive_name} ({len(layout.segments) // 2} files, bytes {start}-{end - 1}/{layout.size})")
+    return StreamingResponse(layout.iter_bytes(start, end), status_code=status_code, media_type="application/zip", headers=headers)
+
+
 @app.post("/api/summarize")
 async def summarize_lecture(request: Request, filename: str) -> JSONResponse:
     """
@@ -1116,15 +1243,13 @@ async def summarize_subject(request: Request, subject: str) -> JSONResponse:
                 "error": "Too many summarize requests. Please wait and try again."
             }, status_code=429)
 
-        import sqlite3
-        
         # Get all files for this subject
         db_path = Path(__file__).parent / "data" / "lecture_sync.db"
         file_paths = []
         
         if db_path.exists():
             try:
-                with sqlite3.connect(db_path) as conn:
+                with read_connection(db_path) as conn:
                     cursor = conn.execute(
                         "SELECT filename FROM synced_items WHERE subject = ? AND filename IS NOT NULL",
                         (subject,)
@@ -1212,7 +1337,7 @@ async def attendance_login(request: Request) -> JSONResponse:
         # Blocked identities cannot authenticate even from a new IP/VPN.
         if db.is_identity_blocked("username", username):
             identity_block = db.get_identity_block_details("username", username) or {}
-            db.log_visitor(
+            log_buffer.log_visitor(
                 client_ip,
                 f"Blocked Login Attempt: {username}",
                 user_agent,
@@ -1232,9 +1357,9 @@ async def attendance_login(request: Request) -> JSONResponse:
             }, status_code=403)
 
         # If IP is already blocked, deny login immediately.
-        if db.is_ip_blocked(client_ip):
-            ip_block = db.get_ip_block_details(client_ip) or {}
-            db.log_visitor(
+        ip_block = db.match_ip_block(client_ip)
+        if ip_block:
+            log_buffer.log_visitor(
                 client_ip,
                 f"Blocked IP Login Attempt: {username}",
                 user_agent,
@@ -1257,7 +1382,7 @@ async def attendance_login(request: Request) -> JSONResponse:
         if result['success']:
             # Log successful attendance login with student info
             student_display = result.get('username', username)
-            db.log_visitor(
+            log_buffer.log_visitor(
                 client_ip, 
                 f"Attendance Login: {student_display}",
                 user_agent,
@@ -1300,7 +1425,7 @@ async def attendance_login(request: Request) -> JSONResponse:
         else:
             error_msg = result.get('error', 'Authentication failed')
             # Log failed login attempt
-            db.log_visitor(
+            log_buffer.log_visitor(
                 client_ip,
                 f"Failed Attendance Login: {username}",
                 user_agent,
@@ -1344,6 +1469,8 @@ async def get_attendance(request: Request) -> JSONResponse:
         logger.info("Attendance result: success=%s, error=%s", result.get('success'), result.get('error'))
         
         if result['success']:
+            # The requesting client already has this data; only update the baseline.
+            _record_attendance_fingerprint(result['student_id'], result['html'], publish=False)
             return JSONResponse({
                 "success": True,
                 "html": result['html'],
@@ -1458,59 +1585,11 @@ async def get_results(request: Request) -> JSONResponse:
         }, status_code=500)
 
 
-@app.get("/api/official-results/data")
-async def get_official_results(request: Request) -> JSONResponse:
-    """
-    Fetch official results from StudentResult endpoint for authenticated user
-    Uses official StudentResult/List API endpoint
-    Requires valid session token from attendance login
-    
-    Security: Only returns results for the authenticated student's ID
-    Android Fix: Uses HttpOnly cookie for session persistence
-    """
-    try:
-        session_token = _resolve_session_token(request)
-        
-        if not session_token or session_token.strip() == "":
-            return JSONResponse({
-                "success": False,
-                "error": "Session token required. Please login first."
-            }, status_code=401)
-        
-        client_ip = get_real_client_ip(request)
-        logger.info("Fetching official results for authenticated session from IP: %s", client_ip)
-        
-        # Validate session using attendance service's session manager
-        session = attendance_service.session_manager.get_session(session_token)
-        
-        if not session:
-            return JSONResponse({
-                "success": False,
-                "error": "Session expired or invalid. Please login again."
-            }, status_code=401)
-        
-        # Get student ID from session (this is the authenticated user's ID)
-        student_id = session.get('student_id', '')
-        cookies = session.get('cookies', {})
-        
-        if not student_id:
-            return JSONResponse({
-                "success": False,
-                "error": "Student ID not found in session."
-            }, status_code=400)
-        
-        # Sanitize student_id to prevent injection
-        student_id = str(student_id).strip()
-        if not student_id.isalnum() and not all(c.isalnum() or c in ['-', '_'] for c in student_id):
-            return JSONResponse({
-                "success": False,
-                "error": "Invalid student ID format."
-            }, status_code=400)
-        
-        logger.info("Fetching official results for student ID: %s", student_id)
+class OfficialResultsClient:
+    """Official results for one student from the portal's StudentResult/List endpoint"""
 
-        cached_official = _get_cached_official_results(student_id)
-        
+    async def fetch(self, student_id: str, cookies: dict) -> dict:
+        """Result dict (success + results/total_count, or error); request and parsing run in a thread"""
         # Fetch results from official endpoint
         official_endpoint = f"https://tempapp-su.awrosoft.com/University/StudentResult/List?studentId={student_id}"
         
@@ -2351,7 +2430,75 @@ async def get_official_results(request: Request) -> JSONResponse:
                 }
         
         # Fetch results in thread to avoid blocking
-        result = await asyncio.to_thread(fetch_official_results)
+        return await asyncio.to_thread(fetch_official_results)
+
+
+official_results_client = OfficialResultsClient()
+
+
+@app.get("/api/official-results/data")
+async def get_official_results(request: Request) -> JSONResponse:
+    """
+    Fetch official results from StudentResult endpoint for authenticated user
+    Uses official StudentResult/List API endpoint
+    Requires valid session token from attendance login
+    
+    Security: Only returns results for the authenticated student's ID
+    Android Fix: Uses HttpOnly cookie for session persistence
+    """
+    try:
+        session_token = _resolve_session_token(request)
+        
+        if not session_token or session_token.strip() == "":
+            return JSONResponse({
+                "success": False,
+                "error": "Session token required. Please login first."
+            }, status_code=401)
+        
+        client_ip = get_real_client_ip(request)
+        logger.info("Fetching official results for authenticated session from IP: %s", client_ip)
+        
+        # Validate session using attendance service's session manager
+        session = attendance_service.session_manager.get_session(session_token)
+        
+        if not session:
+            return JSONResponse({
+                "success": False,
+                "error": "Session expired or invalid. Please login again."
+            }, status_code=401)
+        
+        # Get student ID from session (this is the authenticated user's ID)
+        student_id = session.get('student_id', '')
+        cookies = session.get('cookies', {})
+        
+        if not student_id:
+            return JSONResponse({
+                "success": False,
+                "error": "Student ID not found in session."
+            }, status_code=400)
+        
+        # Sanitize student_id to prevent injection
+        student_id = str(student_id).strip()
+        if not student_id.isalnum() and not all(c.isalnum() or c in ['-', '_'] for c in student_id):
+            return JSONResponse({
+                "success": False,
+                "error": "Invalid student ID format."
+            }, status_code=400)
+        
+        logger.info("Fetching official results for student ID: %s", student_id)
+
+        cached_official = _get_cached_official_results(student_id)
+
+        # Serve straight from the local store when the prefetcher refreshed it recently.
+        if cached_official and (int(time.time()) - cached_official["timestamp"]) <= OFFICIAL_RESULTS_FRESH_SECONDS:
+            return JSONResponse({
+                "success": True,
+                "results": cached_official['results'],
+                "total_count": len(cached_official['results']),
+                "source": "cache"
+            })
+        
+        result = await official_results_client.fetch(student_id, cookies)
         
         if result['success']:
             _set_cached_official_results(student_id, result.get('results', []))
@@ -2399,6 +2546,53 @@ async def get_official_results(request: Request) -> JSONResponse:
         }, status_code=500)
 
 
+@app.get("/api/results/stats")
+async def get_results_stats(request: Request) -> JSONResponse:
+    """
+    Compact result statistics for the authenticated student in the target academic year
+    Overall, per-semester and per-subject count/mean/best/latest/trend
+    Served from incrementally maintained aggregates; does not contact the portal
+    """
+    try:
+        session_token = _resolve_session_token(request)
+        
+        if not session_token or session_token.strip() == "":
+            return JSONResponse({
+                "success": False,
+                "error": "Session token required. Please login first."
+            }, status_code=401)
+        
+        session = attendance_service.session_manager.get_session(session_token)
+        if not session:
+            return JSONResponse({
+                "success": False,
+                "error": "Session expired or invalid."
+            }, status_code=401)
+        
+        student_id = session.get('student_id', '')
+        if not student_id:
+            return JSONResponse({
+                "success": False,
+                "error": "Student ID not found in session."
+            }, status_code=400)
+        
+        # Same year as /api/results/data shows
+        stats = await asyncio.to_thread(
+            get_student_statistics, student_id, results_service.TARGET_ACADEMIC_YEAR_FULL
+        )
+        return JSONResponse({
+            "success": True,
+            **stats
+        })
+    
+    except Exception as exc:
+        logger.exception("Error fetching results stats: %s", str(exc))
+        return JSONResponse({
+            "success": False,
+            "error": f"Error fetching results stats: {str(exc)}"
+        }, status_code=500)
+
+
 @app.get("/api/results/debug")
 async def debug_results(request: Request) -> JSONResponse:
     """
@@ -2528,7 +2722,7 @@ async def refresh_results(request: Request) -> JSONResponse:
         logger.info(f"Cleared {cleared_count} old results for student {student_id}")
         
         # Now force fetch fresh from portal
-        result = await results_service.get_results(session_token, attendance_service.session_manager)
+        result = await results_service.get_results(session_token, attendance_service.session_manager, force_refresh=True)
         logger.info(f"Fresh fetch: success={result.get('success')}, new_saved={result.get('new_results_saved', 0)}, total={result.get('total_count', 0)}")
         
         if result['success']:
@@ -2569,6 +2763,133 @@ async def refresh_results(request: Request) -> JSONResponse:
         }, status_code=500)
 
 
+# ============================================
+# RESULTS PREFETCH
+# ============================================
+
+def _is_valid_student_id(student_id: str) -> bool:
+    value = str(student_id or "").strip()
+    return bool(value) and all(c.isalnum() or c in ['-', '_'] for c in value)
+
+
+async def _prefetch_notification_results(student_id: str, cookies: dict) -> int:
+    """Refresh notification results for one student and push an event when rows were added."""
+    saved = await results_service.refresh_student_results(student_id, cookies)
+    if saved:
+        change_events.publish(EVENT_RESULTS, {"new_results": saved}, student_id=student_id)
+    return saved
+
+
+async def _prefetch_official_results(student_id: str, cookies: dict) -> bool:
+    """Refresh the official results snapshot for one student (used by the prefetcher)."""
+    if not _is_valid_student_id(student_id):
+        return False
+    previous = _get_cached_official_results(student_id).get('results')
+    result = await official_results_client.fetch(student_id, cookies)
+    if result.get('success'):
+        results = result.get('results', [])
+        _set_cached_official_results(student_id, results)
+        if previous is not None and previous != results:
+            change_events.publish(EVENT_OFFICIAL_RESULTS, {"total_count": len(results)}, student_id=student_id)
+        return True
+    return False
+
+
+# student_id -> fingerprint of the last attendance page seen (see AttendanceService.attendance_fingerprint)
+_attendance_fingerprints = {}
+
+
+def _record_attendance_fingerprint(student_id: str, html_content: str, publish: bool = True) -> None:
+    """Remember the attendance fingerprint and push an event when it changed since last seen."""
+    fingerprint = attendance_service.attendance_fingerprint(html_content)
+    previous = _attendance_fingerprints.get(student_id)
+    _attendance_fingerprints[student_id] = fingerprint
+    if publish and previous is not None and previous != fingerprint:
+        change_events.publish(EVENT_ATTENDANCE, {"changed": True}, student_id=student_id)
+
+
+async def _prefetch_attendance(student_id: str, cookies: dict) -> None:
+    html_content = await attendance_service.fetch_attendance_html(student_id, cookies)
+    if html_content:
+        _record_attendance_fingerprint(student_id, html_content)
+
+
+def _is_student_results_fresh(student_id: str) -> bool:
+    """Both notification results and the official snapshot were refreshed recently."""
+    if not results_service.is_fresh(student_id, results_service.FRESH_RESULTS_SECONDS):
+        return False
+    cached_official = _get_cached_official_results(student_id)
+    return bool(cached_official) and (int(time.time()) - cached_official["timestamp"]) <= OFFICIAL_RESULTS_FRESH_SECONDS
+
+
+results_prefetcher = ResultsPrefetcher(
+    session_manager=attendance_service.session_manager,
+    refresh_notifications=_prefetch_notification_results,
+    refresh_official=_prefetch_official_results,
+    is_fresh=_is_student_results_fresh,
+    refresh_attendance=_prefetch_attendance,
+)
+
+
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "25"))
+
+
+@app.get("/api/events")
+async def change_events_stream(request: Request):
+    """
+    Server-sent events stream of changes for the authenticated student
+    Events: lectures (new synced lecture), results, official_results, attendance
+    Clients refetch the matching endpoint only when an event arrives instead of polling
+    """
+    session_token = _resolve_session_token(request)
+    if not session_token:
+        return JSONResponse({"success": False, "error": "Session token required"}, status_code=401)
+
+    session = attendance_service.session_manager.get_session(session_token)
+    if not session:
+        return JSONResponse({"success": False, "error": "Session expired or invalid. Please login again."}, status_code=401)
+
+    student_id = str(session.get('student_id', '') or '').strip()
+    if not student_id:
+        return JSONResponse({"success": False, "error": "Student ID not found in session."}, status_code=400)
+
+    if change_events.stream_count(student_id) >= EVENTS_MAX_STREAMS_PER_STUDENT:
+        return JSONResponse({"success": False, "error": "Too many open event streams."}, status_code=429)
+
+    subscription = change_events.subscribe(student_id, request.headers.get("Last-Event-ID", ""))
+    queue = subscription.queue
+
+    async def event_stream():
+        try:
+            yield "retry: 10000\n\n"
+            if subscription.reset:
+                yield change_events.format_reset(subscription.cursor)
+            else:
+                for event in subscription.replay:
+                    yield change_events.format_sse(event)
+                yield change_events.format_cursor(subscription.cursor)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["seq"] <= subscription.cursor_seq:
+                    # Published while subscribing: already sent in the replay (or predates the stream)
+                    continue
+                yield change_events.format_sse(event)
+        finally:
+            change_events.unsubscribe(student_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
 
 # ============================================
 # ADMIN SOC (Security Operations Center)
@@ -2630,10 +2951,11 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
     banner_end_date_escaped = html_lib.escape(banner_settings["end_date"], quote=True)
     banner_enabled_checked = "checked" if banner_settings["enabled"] else ""
 
-    def _render_device_info(user_agent: str) -> str:
+    def _render_device_info(visitor: dict) -> str:
+        user_agent = visitor["user_agent"]
         if not user_agent:
             return "<span style='color: var(--text-secondary);'>Unknown</span>"
-        device = db.detect_device_type(user_agent)
+        device = visitor["device"]
         ua_preview = user_agent if len(user_agent) <= 120 else f"{user_agent[:120]}..."
         return (
             "<div style=\"display: flex; flex-direction: column; gap: 4px;\">"
@@ -2652,7 +2974,7 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
             "</div>"
         )
     
-    return HTMLResponse(content=f"""
+    admin_html = f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -3604,7 +3926,7 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
                                     </span>
                                 </td>
                                 <td>
-                                    {_render_device_info(visitor['user_agent'])}
+                                    {_render_device_info(visitor)}
                                 </td>
                                 <td class="timestamp" style="font-family: 'SF Mono', monospace; font-size: 0.8rem;">
                                     <i class="fas fa-calendar-alt" style="color: var(--kurdish-yellow); margin-right: 4px;"></i>
@@ -3634,13 +3956,21 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
                     </div>
                     <h2>Blocked IPs</h2>
                 </div>
+                <div style="display: flex; gap: 0.5rem; margin-bottom: 1rem;">
+                    <input id="blockTargetInput" type="text" placeholder="IP or CIDR range, e.g. 203.0.113.0/24" style="flex: 1; border-radius: 8px; border: 1px solid var(--border); background: rgba(11, 19, 36, 0.65); color: var(--text-primary); padding: 0.65rem 0.75rem;" />
+                    <button class="btn btn-block" onclick="blockIP(document.getElementById('blockTargetInput').value.trim())">
+                        <i class="fas fa-ban"></i> Block
+                    </button>
+                </div>
                 <div class="table-wrapper">
                     <table>
                         <thead>
                             <tr>
                                 <th>IP Address</th>
+                                <th>Type</th>
                                 <th>Reason</th>
                                 <th>Blocked At</th>
+                                <th>Hits</th>
                                 <th>Actions</th>
                             </tr>
                         </thead>
@@ -3648,8 +3978,10 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
                             {"".join([f'''
                             <tr>
                                 <td><span class="ip-address">{ip['ip_address']}</span></td>
+                                <td>{'Range' if ip['is_range'] else 'IP'}</td>
                                 <td>{ip['reason']}</td>
                                 <td class="timestamp">{ip['blocked_at']}</td>
+                                <td title="Last hit: {ip['last_hit_at'] or 'never'}">{ip['hit_count']}</td>
                                 <td>
                                     <button class="btn btn-unblock" onclick="unblockIP('{ip['ip_address']}')">
                                         <i class="fas fa-check"></i> Unblock
@@ -3713,6 +4045,7 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
             const adminKey = new URLSearchParams(window.location.search).get('admin_key');
             
             async function blockIP(ip) {{
+                if (!ip) return;
                 if (!confirm(`Block IP: ${{ip}}?`)) return;
                 
                 try {{
@@ -3754,7 +4087,9 @@ async def admin_portal(admin_key: str = None) -> HTMLResponse:
         </script>
     </body>
     </html>
-    """)
+    """
+    # Styles go to a cached bundle; scripts stay inline because they embed the admin key
+    return HTMLResponse(content=externalize(admin_html, "admin", scripts=False))
 
 
 @app.post("/admin-portal/settings/banner")
@@ -3783,12 +4118,14 @@ async def update_homepage_banner_settings(request: Request, admin_key: str) -> J
             return JSONResponse({"success": False, "error": "Invalid end date format"}, status_code=400)
 
         # Keep legacy key synchronized for backwards compatibility.
-        db.set_system_setting("homepage_banner_text", banner_text_ku)
-        db.set_system_setting("homepage_banner_text_ku", banner_text_ku)
-        db.set_system_setting("homepage_banner_text_en", banner_text_en)
-        db.set_system_setting("homepage_banner_enabled", "true" if banner_enabled else "false")
-        db.set_system_setting("homepage_banner_start_date", start_date)
-        db.set_system_setting("homepage_banner_end_date", end_date)
+        db.set_system_settings({
+            "homepage_banner_text": banner_text_ku,
+            "homepage_banner_text_ku": banner_text_ku,
+            "homepage_banner_text_en": banner_text_en,
+            "homepage_banner_enabled": "true" if banner_enabled else "false",
+            "homepage_banner_start_date": start_date,
+            "homepage_banner_end_date": end_date,
+        })
 
         logger.info("Admin updated homepage banner settings")
         return JSONResponse({"success": True, "message": "Homepage banner settings updated"})
@@ -3799,15 +4136,20 @@ async def update_homepage_banner_settings(request: Request, admin_key: str) -> J
 
 @app.post("/admin-portal/block")
 async def block_ip_endpoint(admin_key: str, ip: str) -> JSONResponse:
-    """Block an IP address"""
+    """Block an IP address or a CIDR range (e.g. 203.0.113.0/24)"""
     if not _is_valid_admin_key(admin_key):
         return JSONResponse({"success": False, "error": "Unauthorized"}, status_code=401)
     
+    try:
+        ip, is_range = normalize_block_target(ip)
+    except ValueError:
+        return JSONResponse({"success": False, "error": "Enter an IP address or CIDR range (e.g. 203.0.113.0/24)"}, status_code=400)
+
     try:
         db.block_ip(ip, reason="Manual block by admin")
 
-        # Block known usernames recently observed from this IP as well.
-        linked_users = db.get_recent_usernames_by_ip(ip, limit=20)
+        # Block known usernames recently observed from this IP as well (single IPs only).
+        linked_users = [] if is_range else db.get_recent_usernames_by_ip(ip, limit=20)
         for linked_username in linked_users:
             db.block_identity("username", linked_username, reason=f"Manual IP block link: {ip}")
 
@@ -3836,6 +4178,27 @@ async def unblock_ip_endpoint(admin_key: str, ip: str) -> JSONResponse:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 
+@app.get("/admin-portal/runtime-stats")
+async def runtime_stats_endpoint(admin_key: str) -> JSONResponse:
+    """Counters of runtime components (log buffer, prefetcher, event stream, threat rules, UA cache, dashboard, lecture catalog, subject index, rate limiter, leader election)"""
+    if not _is_valid_admin_key(admin_key):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    return JSONResponse({
+        "success": True,
+        "log_buffer": {**log_buffer.counters, "pending": log_buffer.pending()},
+        "results_prefetcher": results_prefetcher.counters,
+        "change_events": {"dropped_events": change_events.dropped_events},
+        "threat_rules": threat_engine.stats(),
+        "user_agent_cache": ua_cache.stats(),
+        "dashboard_page": dashboard_page.counters,
+        "lecture_catalog": lecture_catalog.stats(),
+        "subject_index": subject_index.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "leader_election": leader_election.stats(),
+    })
+
+
 @app.post("/admin-portal/clear-activity")
 async def clear_activity_endpoint(admin_key: str) -> JSONResponse:
     """Clear all activity logs and unblock ALL IPs"""
@@ -3845,13 +4208,19 @@ async def clear_activity_endpoint(admin_key: str) -> JSONResponse:
     try:
         # Clear activity and unblock ALL IPs from database
         from database import DB_PATH
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM visitor_logs")
-        cursor.execute("DELETE FROM blacklist")  # This unblocks all IPs
-        cursor.execute("DELETE FROM threat_logs")  # Clear threat logs too
-        conn.commit()
-        conn.close()
+        # Write pending log rows first so they are cleared too
+        await asyncio.to_thread(log_buffer.flush)
+        with write_connection(DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM visitor_logs")
+            cursor.execute("DELETE FROM blacklist")  # This unblocks all IPs
+            cursor.execute("DELETE FROM threat_logs")  # Clear threat logs too
+            # Aggregates built from those logs
+            cursor.execute("DELETE FROM visitor_ip_totals")
+            cursor.execute("DELETE FROM visitor_hourly_rollup")
+            cursor.execute("DELETE FROM visitor_daily_rollup")
+            cursor.execute("DELETE FROM threat_daily_rollup")
+        db.invalidate_blocklist_cache()
         
         logger.warning("Admin cleared all activity logs, threat logs, and unblocked all IPs")
         return JSONResponse({"success": True, "message": "All IPs unblocked and logs cleared successfully"})
@@ -3962,14 +4331,15 @@ async def attendance_logout(request: Request) -> JSONResponse:
 # MAIN UI
 # ========================================
 
-@app.get("/")
-async def dashboard() -> HTMLResponse:
+def _render_dashboard_html() -> str:
+    """Full single-page dashboard; rendered by dashboard_page only when its inputs change"""
     logo_version = "2026-03-18"
     banner_settings = _get_homepage_banner_settings()
+    # Inline JSON (not JS) so the dashboard script bundle stays the same when the banner changes
     navbar_banner_texts_json = json.dumps(
         [banner_settings["display_text_ku"], banner_settings["display_text_en"]],
         ensure_ascii=False,
-    )
+    ).replace("<", "\\u003c")
     html = f"""
     <!DOCTYPE html>
     <html lang="en">
@@ -3977,6 +4347,7 @@ async def dashboard() -> HTMLResponse:
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no, viewport-fit=cover">
         <title>SwiftSync • 2025/2026</title>
+        <script id="navbarBannerTexts" type="application/json">{navbar_banner_texts_json}</script>
         
         <!-- PWA Meta Tags -->
         <meta name="description" content="SwiftSync - Student lecture management by SSCreative">
@@ -7091,9 +7462,48 @@ async def dashboard() -> HTMLResponse:
                 }}
             }}
 
+            // Server-sent change events replace polling: refetch only what changed.
+            var changeStream = null;
+
+            function startChangeStream() {{
+                if (changeStream || !attendanceSessionToken || typeof EventSource === 'undefined') return;
+                changeStream = new EventSource('/api/events', {{ withCredentials: true }});
+                changeStream.addEventListener('lectures', () => loadFiles());
+                changeStream.addEventListener('results', () => {{
+                    if (!inFlightResultAlerts) fetchResultAlerts(true);
+                }});
+                changeStream.addEventListener('official_results', () => {{
+                    if (!inFlightOfficialResults) fetchOfficialResults(true);
+                }});
+                changeStream.addEventListener('attendance', () => {{
+                    if (!inFlightAttendance) loadAttendanceData(true);
+                }});
+                // Server restarted or we fell too far behind to replay: refetch everything once.
+                changeStream.addEventListener('reset', () => {{
+                    loadFiles();
+                    if (!inFlightResultAlerts) fetchResultAlerts(true);
+                    if (!inFlightOfficialResults) fetchOfficialResults(true);
+                    if (!inFlightAttendance) loadAttendanceData(true);
+                }});
+                changeStream.onerror = () => {{
+                    // 401/429 close the stream for good; network drops reconnect automatically.
+                    if (changeStream && changeStream.readyState === EventSource.CLOSED) {{
+                        changeStream = null;
+                    }}
+                }};
+            }}
+
+            function stopChangeStream() {{
+                if (changeStream) {{
+                    changeStream.close();
+                    changeStream = null;
+                }}
+            }}
+
             function preloadPrivateData(options = {{}}) {{
                 if (!attendanceSessionToken) return;
                 ensurePrivateCacheOwner();
+                startChangeStream();
 
                 const skipAttendance = options.skipAttendance === true;
                 const forceRefresh = options.forceRefresh === true;
@@ -7119,6 +7529,7 @@ async def dashboard() -> HTMLResponse:
                 if (!attendanceSessionToken) {{
                     return {{ attendanceReady: false, resultAlertsReady: false, officialResultsReady: false }};
                 }}
+                startChangeStream();
 
                 const deferUiReveal = options.deferUiReveal !== false;
                 const forceRefresh = options.forceRefresh === true;
@@ -7175,7 +7586,7 @@ async def dashboard() -> HTMLResponse:
             // ===================================
             
             // Kurdish Text Typewriter Animation
-            const kurdishTexts = {navbar_banner_texts_json};
+            const kurdishTexts = JSON.parse(document.getElementById('navbarBannerTexts').textContent);
             
             let currentTextIndex = 0;
             let currentCharIndex = 0;
@@ -7367,6 +7778,10 @@ async def dashboard() -> HTMLResponse:
                                         ${{subject}}
                                         <span class="file-count">${{files.length}} file${{files.length > 1 ? 's' : ''}}</span>
                                     </div>
+                                    <a href="/api/download-zip?semester=${{encodeURIComponent(semester)}}&subject=${{encodeURIComponent(subject)}}" class="download-btn" title="Download all as ZIP" onclick="event.stopPropagation();" style="margin-left: auto; margin-right: 0.5rem; text-decoration: none;">
+                                        <i class="fas fa-file-archive"></i>
+                                        <span>ZIP</span>
+                                    </a>
                                     <div class="collapse-btn">
                                         <i class="fas fa-chevron-down"></i>
                                     </div>
@@ -7594,8 +8009,62 @@ async def dashboard() -> HTMLResponse:
                 // Lectures is already active by default in HTML
             }});
             
+            // Local copy of the lecture list plus its change cursor; loadFiles() fetches only the changes since
+            const FILES_CACHE_KEY = 'swiftsync_files_catalog';
+
+            function readCachedCatalog() {{
+                try {{
+                    const cached = JSON.parse(localStorage.getItem(FILES_CACHE_KEY) || 'null');
+                    return cached && cached.cursor && cached.files ? cached : null;
+                }} catch (e) {{
+                    return null;
+                }}
+            }}
+
+            function writeCachedCatalog(catalog) {{
+                try {{
+                    localStorage.setItem(FILES_CACHE_KEY, JSON.stringify(catalog));
+                }} catch (e) {{
+                    // Storage full or disabled - the next load simply gets the full list again
+                }}
+            }}
+
+            // Apply /api/files?since= changes (upsert/remove by file name) to a semester -> subject -> files tree
+            function applyFileChanges(files, changes) {{
+                const locations = new Map();
+                for (const [semester, subjects] of Object.entries(files)) {{
+                    for (const [subject, list] of Object.entries(subjects)) {{
+                        for (const file of list) locations.set(file.name, [semester, subject]);
+                    }}
+                }}
+                for (const change of changes) {{
+                    const name = change.op === 'remove' ? change.name : change.file.name;
+                    const previous = locations.get(name);
+                    if (previous) {{
+                        const [semester, subject] = previous;
+                        const remaining = files[semester][subject].filter(file => file.name !== name);
+                        if (remaining.length) {{
+                            files[semester][subject] = remaining;
+                        }} else {{
+                            delete files[semester][subject];
+                            if (Object.keys(files[semester]).length === 0) delete files[semester];
+                        }}
+                        locations.delete(name);
+                    }}
+                    if (change.op === 'upsert') {{
+                        const subjects = files[change.semester] || (files[change.semester] = {{}});
+                        const list = subjects[change.subject] || (subjects[change.subject] = []);
+                        list.push(change.file);
+                        list.sort((a, b) => (a.name < b.name ? -1 : a.name > b.name ? 1 : 0));
+                        locations.set(name, [change.semester, change.subject]);
+                    }}
+                }}
+                return files;
+            }}
+
             // Load files on page load
             async function loadFiles() {{
+                const cached = readCachedCatalog();
                 try {{
                     console.log('📡 Fetching lectures from API...');
                     
@@ -7604,7 +8073,7 @@ async def dashboard() -> HTMLResponse:
                         console.log('📴 Offline - attempting to load cached data');
                     }}
                     
-                    const response = await fetch('/api/files');
+                    const response = await fetch('/api/files?since=' + encodeURIComponent(cached ? cached.cursor : ''));
                     console.log('✅ API response received:', response.status);
                     
                     // Handle offline or network errors gracefully
@@ -7612,11 +8081,19 @@ async def dashboard() -> HTMLResponse:
                         throw new Error(`HTTP ${{response.status}}: ${{response.statusText}}`);
                     }}
                     
-                    const data = await response.json();
-                    console.log('📊 Data loaded:', Object.keys(data).length, 'semesters');
+                    const delta = await response.json();
+                    const data = delta.reset || !cached ? delta.files : applyFileChanges(cached.files, delta.changes);
+                    writeCachedCatalog({{ cursor: delta.cursor, files: data }});
+                    console.log('📊 Data loaded:', Object.keys(data).length, 'semesters', delta.reset ? '(full list)' : `(${{delta.changes.length}} changes)`);
                     renderFiles(data);
                 }} catch (error) {{
                     console.error('❌ Error loading files:', error);
+
+                    // Offline or server error: keep showing the last list we had
+                    if (cached) {{
+                        renderFiles(cached.files);
+                        return;
+                    }}
                     
                     const isOffline = !navigator.onLine;
                     const stateTitle = isOffline ? 'No Internet Connection' : 'No Lectures Yet';
@@ -8575,8 +9052,9 @@ async def dashboard() -> HTMLResponse:
 
                 closeLogoutConfirmModal();
 
-                // Stop auto-refresh
+                // Stop auto-refresh and change events
                 stopAttendanceAutoRefresh();
+                stopChangeStream();
 
                 // Purge persisted private caches for this student (must happen before we clear identity)
                 purgePersistedPrivateCaches(getPrivateOwnerKey());
@@ -9509,7 +9987,20 @@ async def dashboard() -> HTMLResponse:
     </body>
     </html>
     """
-    return HTMLResponse(content=html)
+    return externalize(html, "dashboard")
+
+
+def _dashboard_cache_key() -> tuple:
+    # Banner text depends on the settings and on today's date (start/end window)
+    return (db.get_system_settings_version(), datetime.now().date())
+
+
+dashboard_page = PageCache(_render_dashboard_html, _dashboard_cache_key)
+
+
+@app.get("/")
+async def dashboard(request: Request) -> Response:
+    return await dashboard_page.response(request)
 
 
 if __name__ == "__main__":
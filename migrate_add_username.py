@@ -1,37 +1,19 @@
 """
 Database migration: Add username column to visitor_logs table
-Run this before deploying to update existing databases
+Now part of migrations.py (security_tables) and applied automatically at startup;
+running this script just applies any pending migrations
 """
-import sqlite3
 from pathlib import Path
 
+from migrations import run_migrations
+
 DB_PATH = Path("data") / "lecture_sync.db"
 
 def migrate_add_username_column():
     """Add username column to visitor_logs if it doesn't exist"""
     print("🔄 Starting database migration...")
-    
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        # Check if username column already exists
-        cursor.execute("PRAGMA table_info(visitor_logs)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'username' not in columns:
-            print("✅ Adding 'username' column to visitor_logs table...")
-            cursor.execute("""
-                ALTER TABLE visitor_logs ADD COLUMN username TEXT
-            """)
-            conn.commit()
-            print("✅ Migration completed successfully!")
-        else:
-            print("✅ Username column already exists, no migration needed.")
-    
-    print("\n📊 Database updated successfully!")
-    print("   - Real IP addresses will now be captured")
-    print("   - Student/usernames will be logged")
-    print("   - Admin portal will show student info\n")
+    applied = run_migrations(DB_PATH)
+    print(f"✅ Migration completed successfully! ({len(applied)} migration(s) applied)")
 
 if __name__ == "__main__":
     migrate_add_username_column()
@@ -0,0 +1,462 @@
+"""
+Schema Migrations for SwiftSync
+Ordered, idempotent schema changes for data/lecture_sync.db, tracked in schema_version
+
+Adding a migration: append (next_version, "short_name", function) to MIGRATIONS.
+Never edit or reorder an applied migration - databases in the field already
+recorded it. Each function must be safe on a database that already has the change
+(older deployments created tables without recording versions).
+Filling existing rows goes in BACKFILLS, not in the migration function: it runs
+in batches of MIGRATION_BATCH_SIZE rows, one short transaction each, and the
+version is recorded when it finishes.
+
+Usage:
+    python migrations.py            # apply pending migrations, print status
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import pytz
+
+from db_pool import write_connection
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent / "data" / "lecture_sync.db"
+# Rows per backfill transaction: keeps each write lock far below SQLITE_BUSY_TIMEOUT_MS
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "2000"))
+# How long startup waits for a database locked by another worker before giving up
+MIGRATION_WAIT_SECONDS = float(os.getenv("MIGRATION_WAIT_SECONDS", "120"))
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> None:
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _001_synced_items(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS synced_items (
+            id TEXT PRIMARY KEY,
+            downloaded_at TEXT DEFAULT (datetime('now')),
+            upload_date TEXT,
+            subject TEXT,
+            filename TEXT,
+            last_notified TEXT,
+            semester TEXT
+        )
+    """)
+    # Columns added over time by migrate_db.py, migrate_upload_dates.py and the old per-sync ALTERs
+    for column in ("upload_date", "subject", "filename", "last_notified", "semester"):
+        _add_column(conn, "synced_items", column, "TEXT")
+
+
+def _002_security_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS visitor_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            action_performed TEXT NOT NULL,
+            user_agent TEXT,
+            path TEXT,
+            username TEXT
+        )
+    """)
+    # Databases from before migrate_add_username.py
+    _add_column(conn, "visitor_logs", "username", "TEXT")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blacklist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT UNIQUE NOT NULL,
+            reason TEXT,
+            blocked_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS threat_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL,
+            threat_type TEXT NOT NULL,
+            details TEXT,
+            detected_at TEXT NOT NULL,
+            action_taken TEXT
+        )
+    """)
+    # Username/device fingerprint blocks
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS identity_blacklist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            identity_type TEXT NOT NULL,
+            identity_value TEXT NOT NULL,
+            reason TEXT,
+            blocked_at TEXT NOT NULL,
+            UNIQUE(identity_type, identity_value)
+        )
+    """)
+    # Small key-value store for admin-managed flags/text
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS system_settings (
+            setting_key TEXT PRIMARY KEY,
+            setting_value TEXT,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blacklist_ip ON blacklist(ip_address)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitor_logs_ip ON visitor_logs(ip_address)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_identity_blacklist_type_value
+        ON identity_blacklist(identity_type, identity_value)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_system_settings_updated_at ON system_settings(updated_at)")
+
+
+def _003_results(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            notification_id TEXT UNIQUE NOT NULL,
+            subject TEXT,
+            exam_type TEXT,
+            score TEXT,
+            grade TEXT,
+            semester TEXT,
+            status TEXT,
+            raw_text TEXT NOT NULL,
+            raw_text_packed BLOB,
+            exam_date TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_results_student ON results(student_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_results_notification ON results(notification_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at DESC)")
+
+
+def _004_results_normalized_columns(conn: sqlite3.Connection) -> None:
+    # Filled at insert time so reads need no per-row parsing (older rows: results_maintenance leader job)
+    for column in ("academic_year", "semester_display", "dedupe_key"):
+        _add_column(conn, "results", column, "TEXT")
+    # Compressed notification text lives in its own BLOB column; raw_text stays TEXT
+    _add_column(conn, "results", "raw_text_packed", "BLOB")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_results_student_year_key
+        ON results(student_id, academic_year, dedupe_key, created_at)
+    """)
+
+
+def _005_result_stats(conn: sqlite3.Connection) -> None:
+    # Running aggregates per student and academic year (the results page shows one year):
+    # one row for overall, per semester and per subject, scores on one 0-100 scale
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS result_stats (
+            student_id TEXT NOT NULL,
+            academic_year TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            scope_key TEXT NOT NULL,
+            result_count INTEGER NOT NULL DEFAULT 0,
+            scored_count INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            best_score REAL,
+            latest_score REAL,
+            latest_date TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (student_id, academic_year, scope, scope_key)
+        )
+    """)
+
+
+def _006_visitor_logs_epoch(conn: sqlite3.Connection) -> None:
+    # Integer epoch (UTC seconds) so time windows are index range scans
+    _add_column(conn, "visitor_logs", "ts_epoch", "INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitor_logs_ip_epoch ON visitor_logs(ip_address, ts_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitor_logs_epoch ON visitor_logs(ts_epoch)")
+
+
+def _006_backfill(conn: sqlite3.Connection, after: int, limit: int) -> Optional[int]:
+    last_id = conn.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM visitor_logs WHERE id > ? AND ts_epoch IS NULL ORDER BY id LIMIT ?)",
+        (after, limit),
+    ).fetchone()[0]
+    if last_id is None:
+        return None
+    # strftime('%s') honours the +03:00 offset stored in the ISO timestamp
+    conn.execute(
+        """
+        UPDATE visitor_logs
+        SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER)
+        WHERE id > ? AND id <= ? AND ts_epoch IS NULL
+        """,
+        (after, last_id),
+    )
+    return last_id
+
+
+def _007_visitor_rollups(conn: sqlite3.Connection) -> None:
+    # Running per-IP totals so admin stats never scan visitor_logs
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS visitor_ip_totals (
+            ip_address TEXT PRIMARY KEY,
+            requests INTEGER NOT NULL DEFAULT 0,
+            first_seen_epoch INTEGER,
+            last_seen_epoch INTEGER
+        )
+    """)
+    # One aggregate statement rather than a BACKFILL: restarted batches would count rows twice
+    if not conn.execute("SELECT EXISTS(SELECT 1 FROM visitor_ip_totals)").fetchone()[0]:
+        conn.execute("""
+            INSERT INTO visitor_ip_totals (ip_address, requests, first_seen_epoch, last_seen_epoch)
+            SELECT ip_address, COUNT(*), MIN(ts_epoch), MAX(ts_epoch)
+            FROM visitor_logs
+            GROUP BY ip_address
+        """)
+    # Visitor rows older than LOG_RETENTION_DAYS are rolled up here
+    for rollup_table in ("visitor_hourly_rollup", "visitor_daily_rollup"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup_table} (
+                bucket_epoch INTEGER NOT NULL,
+                ip_address TEXT NOT NULL,
+                path TEXT NOT NULL,
+                device_type TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                PRIMARY KEY (bucket_epoch, ip_address, path, device_type)
+            )
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS threat_daily_rollup (
+            bucket_epoch INTEGER NOT NULL,
+            ip_address TEXT NOT NULL,
+            threat_type TEXT NOT NULL,
+            action_taken TEXT NOT NULL,
+            detections INTEGER NOT NULL,
+            PRIMARY KEY (bucket_epoch, ip_address, threat_type, action_taken)
+        )
+    """)
+
+
+def _008_blacklist_hits(conn: sqlite3.Connection) -> None:
+    # Blacklist entries may be CIDR ranges; count how often each entry blocks a request
+    _add_column(conn, "blacklist", "hit_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "blacklist", "last_hit_at", "TEXT")
+
+
+def _009_visitor_logs_device(conn: sqlite3.Connection) -> None:
+    # Classified UA ("Mobile|Android 14|Chrome|fa-mobile-alt") written at log time
+    _add_column(conn, "visitor_logs", "device", "TEXT")
+
+
+def _009_backfill(conn: sqlite3.Connection, after: int, limit: int) -> Optional[int]:
+    from user_agents import device_for_log
+
+    rows = conn.execute(
+        """
+        SELECT id, user_agent FROM visitor_logs
+        WHERE id > ? AND device IS NULL AND user_agent IS NOT NULL
+        ORDER BY id LIMIT ?
+        """,
+        (after, limit),
+    ).fetchall()
+    if not rows:
+        return None
+    conn.executemany(
+        "UPDATE visitor_logs SET device = ? WHERE id = ?",
+        [(device_for_log(user_agent), row_id) for row_id, user_agent in rows],
+    )
+    return rows[-1][0]
+
+
+def _010_synced_items_subject_inferred(conn: sqlite3.Connection) -> None:
+    # 1 = subject was guessed from the filename (lecture_catalog); the portal's subject may replace it
+    _add_column(conn, "synced_items", "subject_inferred", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _011_rate_limits(conn: sqlite3.Connection) -> None:
+    # Sliding-window counters shared by all workers (rate_limiter, RATE_LIMIT_BACKEND=sqlite)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            window_start INTEGER NOT NULL,
+            previous_count INTEGER NOT NULL DEFAULT 0,
+            current_count INTEGER NOT NULL DEFAULT 0,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_expires ON rate_limits(expires_at)")
+
+
+def _012_threat_logs_epoch(conn: sqlite3.Connection) -> None:
+    # Same as visitor_logs (migration 6): retention filters on an indexed integer
+    _add_column(conn, "threat_logs", "ts_epoch", "INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threat_logs_epoch ON threat_logs(ts_epoch)")
+
+
+def _012_backfill(conn: sqlite3.Connection, after: int, limit: int) -> Optional[int]:
+    last_id = conn.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM threat_logs WHERE id > ? AND ts_epoch IS NULL ORDER BY id LIMIT ?)",
+        (after, limit),
+    ).fetchone()[0]
+    if last_id is None:
+        return None
+    conn.execute(
+        """
+        UPDATE threat_logs
+        SET ts_epoch = CAST(strftime('%s', detected_at) AS INTEGER)
+        WHERE id > ? AND id <= ? AND ts_epoch IS NULL
+        """,
+        (after, last_id),
+    )
+    return last_id
+
+
+def _013_file_digests(conn: sqlite3.Connection) -> None:
+    # Content ETag and CRC32 per lecture file version, shared by workers and kept across
+    # restarts so building a ZIP layout reads only files never hashed before
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_digests (
+            name TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            etag TEXT NOT NULL,
+            crc INTEGER NOT NULL
+        )
+    """)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "synced_items", _001_synced_items),
+    (2, "security_tables", _002_security_tables),
+    (3, "results", _003_results),
+    (4, "results_normalized_columns", _004_results_normalized_columns),
+    (5, "result_stats", _005_result_stats),
+    (6, "visitor_logs_epoch", _006_visitor_logs_epoch),
+    (7, "visitor_rollups", _007_visitor_rollups),
+    (8, "blacklist_hits", _008_blacklist_hits),
+    (9, "visitor_logs_device", _009_visitor_logs_device),
+    (10, "synced_items_subject_inferred", _010_synced_items_subject_inferred),
+    (11, "rate_limits", _011_rate_limits),
+    (12, "threat_logs_epoch", _012_threat_logs_epoch),
+    (13, "file_digests", _013_file_digests),
+]
+
+# version -> batch function run after that migration: (conn, after_id, limit) -> last id
+# handled, or None when no rows are left. Batches are keyset-paginated by id, so rows
+# that stay NULL are passed over instead of being selected again.
+BACKFILLS: Dict[int, Callable[[sqlite3.Connection, int, int], Optional[int]]] = {
+    6: _006_backfill,
+    9: _009_backfill,
+    12: _012_backfill,
+}
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Resolved database path -> version known to be applied by this process
+_migrated: Dict[str, int] = {}
+_migrate_lock = threading.Lock()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def _record_version(conn: sqlite3.Connection, version: int, name: str) -> None:
+    conn.execute(
+        "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+        (version, name, datetime.now(pytz.timezone('Asia/Baghdad')).isoformat()),
+    )
+
+
+def _apply_migration(db_path: Union[str, Path], version: int, name: str, migrate: Callable) -> bool:
+    """Apply one migration (and its backfill) unless already recorded; True when this call recorded it"""
+    backfill = BACKFILLS.get(version)
+    with write_connection(db_path) as conn:
+        # IMMEDIATE takes SQLite's write lock up front, so concurrent workers
+        # starting together apply each migration exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        if get_schema_version(conn) >= version:
+            return False
+        migrate(conn)
+        if backfill is None:
+            _record_version(conn, version, name)
+            return True
+
+    # Schema change is committed; existing rows are filled in short transactions. A worker
+    # that starts meanwhile re-runs the (idempotent) migration and helps with the batches.
+    after = 0
+    while True:
+        with write_connection(db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if get_schema_version(conn) >= version:
+                return False
+            last_id = backfill(conn, after, MIGRATION_BATCH_SIZE)
+            if last_id is None:
+                _record_version(conn, version, name)
+                return True
+        after = last_id
+
+
+def _is_locked(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+def run_migrations(db_path: Union[str, Path] = DEFAULT_DB_PATH) -> List[str]:
+    """
+    Apply pending migrations in order. Returns the names applied now.
+    After the first call per process this is a dict lookup.
+    While another process holds the database, retries for MIGRATION_WAIT_SECONDS;
+    any other error (or running out of time) raises, so the caller never proceeds
+    on an old schema.
+    """
+    key = str(Path(db_path).resolve())
+    if _migrated.get(key) == LATEST_VERSION:
+        return []
+
+    applied = []
+    with _migrate_lock:
+        if _migrated.get(key) == LATEST_VERSION:
+            return []
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + MIGRATION_WAIT_SECONDS
+        for version, name, migrate in MIGRATIONS:
+            while True:
+                try:
+                    if _apply_migration(db_path, version, name, migrate):
+                        applied.append(name)
+                    break
+                except sqlite3.OperationalError as exc:
+                    if not _is_locked(exc) or time.monotonic() >= deadline:
+                        raise
+                    print(f"[WAIT] Database busy while applying migration {version} ({name}), retrying")
+                    time.sleep(1)
+        _migrated[key] = LATEST_VERSION
+    return applied
+
+
+def main():
+    db_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    applied = run_migrations(db_path)
+    for name in applied:
+        print(f"✓ Applied {name}")
+    print(f"Schema version: {LATEST_VERSION} ({len(applied)} migration(s) applied)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Pre-rendered Page Cache for SwiftSync
+Keeps a rendered page as bytes plus gzip (and brotli, if installed) variants and a
+strong ETag. The page is rebuilt only when its key changes (e.g. the system
+settings version), so a request is a conditional check and a memory copy.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+from typing import Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class RenderedPage:
+    """One immutable rendering: identity, gzip and br bodies share one ETag"""
+
+    __slots__ = ("key", "etag", "bodies")
+
+    def __init__(self, key: Hashable, body: bytes):
+        self.key = key
+        # Content hash: every worker renders the same bytes, so ETags agree across workers
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:24]}"'
+        self.bodies: Dict[str, bytes] = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in (header or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check; weak validators (W/"...", added by some proxies) also match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+class PageCache:
+    """Serves render() output from memory, re-rendering in a thread when key() changes"""
+
+    def __init__(
+        self,
+        render: Callable[[], str],
+        key: Callable[[], Hashable],
+        media_type: str = "text/html; charset=utf-8",
+        cache_control: str = "no-cache",
+    ):
+        self._render = render
+        self._key = key
+        self.media_type = media_type
+        # no-cache: browsers may store the page but must revalidate (cheap 304) before use
+        self.cache_control = cache_control
+        self._page: Optional[RenderedPage] = None
+        self._lock = asyncio.Lock()
+        self.counters = {"renders": 0, "not_modified": 0, "identity": 0, "gzip": 0, "br": 0}
+
+    def _build(self, key: Hashable) -> RenderedPage:
+        page = RenderedPage(key, self._render().encode("utf-8"))
+        self.counters["renders"] += 1
+        logger.info(
+            "Pre-rendered page: %d bytes, gzip %d, br %s",
+            len(page.bodies["identity"]),
+            len(page.bodies["gzip"]),
+            len(page.bodies["br"]) if "br" in page.bodies else "n/a",
+        )
+        return page
+
+    async def get(self) -> RenderedPage:
+        key = self._key()
+        page = self._page
+        if page is not None and page.key == key:
+            return page
+        async with self._lock:
+            page = self._page
+            if page is None or page.key != key:
+                # Compression at max level takes a while; keep it off the event loop
+                page = await asyncio.to_thread(self._build, key)
+                self._page = page
+        return page
+
+    async def response(self, request: Request) -> Response:
+        page = await self.get()
+        headers = {"ETag": page.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), page.etag):
+            self.counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((coding for coding in ("br", "gzip") if coding in accepted and coding in page.bodies), "identity")
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        self.counters[encoding] += 1
+        return Response(content=page.bodies[encoding], media_type=self.media_type, headers=headers)
@@ -0,0 +1,131 @@
+"""
+Results Prefetcher Module for SwiftSync
+Keeps results of recently active students warm in the local store
+Walks active sessions in the background so the results tab is a local read
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_INTERVAL_SECONDS = int(os.getenv("RESULTS_PREFETCH_INTERVAL_SECONDS", "300"))
+PREFETCH_ACTIVE_WITHIN_MINUTES = int(os.getenv("RESULTS_PREFETCH_ACTIVE_MINUTES", "120"))
+PREFETCH_MAX_CONCURRENCY = max(1, int(os.getenv("RESULTS_PREFETCH_CONCURRENCY", "2")))
+# Global budget of student refreshes per minute against the portal (each refresh is a few portal requests).
+PREFETCH_MAX_PER_MINUTE = max(1, int(os.getenv("RESULTS_PREFETCH_MAX_PER_MINUTE", "12")))
+
+
+class ResultsPrefetcher:
+    """Background refresher for results (and optionally attendance) of active students"""
+
+    def __init__(
+        self,
+        session_manager,
+        refresh_notifications: Callable[[str, Dict], Awaitable[int]],
+        refresh_official: Callable[[str, Dict], Awaitable[bool]],
+        is_fresh: Callable[[str], bool],
+        refresh_attendance: Optional[Callable[[str, Dict], Awaitable[Any]]] = None,
+        interval_seconds: int = PREFETCH_INTERVAL_SECONDS,
+        active_within_minutes: int = PREFETCH_ACTIVE_WITHIN_MINUTES,
+        max_concurrency: int = PREFETCH_MAX_CONCURRENCY,
+        max_per_minute: int = PREFETCH_MAX_PER_MINUTE,
+    ):
+        self.session_manager = session_manager
+        self.refresh_notifications = refresh_notifications
+        self.refresh_official = refresh_official
+        self.is_fresh = is_fresh
+        self.refresh_attendance = refresh_attendance
+        self.interval_seconds = interval_seconds
+        self.active_within_minutes = active_within_minutes
+        self.max_concurrency = max_concurrency
+        self.min_spacing_seconds = 60.0 / max_per_minute
+        self._budget_lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self.counters = {
+            "cycles": 0,
+            "refreshed": 0,
+            "skipped_fresh": 0,
+            "failed": 0,
+            "new_results": 0,
+        }
+
+    def _collect_students(self) -> List[Dict[str, Any]]:
+        """One job per student: the most recently used session wins when a student has several."""
+        by_student: Dict[str, Dict[str, Any]] = {}
+        active = self.session_manager.get_active_sessions(self.active_within_minutes)
+        for session in active.values():
+            student_id = str(session.get("student_id", "") or "").strip()
+            if not student_id or not session.get("cookies"):
+                continue
+            current = by_student.get(student_id)
+            if current is None or session.get("last_accessed") > current.get("last_accessed"):
+                by_student[student_id] = session
+        return list(by_student.values())
+
+    async def _wait_for_budget(self) -> None:
+        """Space job starts evenly so the portal never sees more than max_per_minute refreshes."""
+        async with self._budget_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_spacing_seconds
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _prefetch_student(self, session: Dict[str, Any], semaphore: asyncio.Semaphore) -> None:
+        student_id = session["student_id"]
+        cookies = session["cookies"]
+        async with semaphore:
+            await self._wait_for_budget()
+            try:
+                saved = await self.refresh_notifications(student_id, cookies)
+                await self.refresh_official(student_id, cookies)
+                if self.refresh_attendance is not None:
+                    await self.refresh_attendance(student_id, cookies)
+                self.counters["refreshed"] += 1
+                self.counters["new_results"] += saved or 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                self.counters["failed"] += 1
+                logger.warning("Results prefetch failed for student %s: %s", student_id, exc)
+
+    async def run_once(self) -> int:
+        """Refresh every active student whose stored results are stale. Returns number of jobs run."""
+        self.counters["cycles"] += 1
+        jobs = []
+        for session in self._collect_students():
+            if self.is_fresh(session["student_id"]):
+                self.counters["skipped_fresh"] += 1
+                continue
+            jobs.append(session)
+
+        if not jobs:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.gather(*(self._prefetch_student(session, semaphore) for session in jobs))
+        logger.info("Results prefetch cycle finished: %d student(s) refreshed", len(jobs))
+        return len(jobs)
+
+    async def run_forever(self) -> None:
+        """Background loop, started from the app lifespan like the sync worker."""
+        await asyncio.sleep(15)
+        logger.info(
+            "Results prefetcher started. Interval: %ds, concurrency: %d, budget: %.0f/min",
+            self.interval_seconds,
+            self.max_concurrency,
+            60.0 / self.min_spacing_seconds,
+        )
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                logger.info("Results prefetcher received cancellation signal")
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Results prefetch cycle failed: %s", exc)
+            await asyncio.sleep(self.interval_seconds)
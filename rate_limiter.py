@@ -0,0 +1,207 @@
+"""
+Rate Limiter for SwiftSync
+One limiter for the per-endpoint limits (sync-now, summaries, ZIPs) and the middleware's
+request-flood check. Each key (e.g. "203.0.113.7:sync-now") keeps a sliding-window counter:
+the current and previous fixed-window counts, weighted by how far the current window has
+progressed. That makes a check O(1) with constant memory per key. Rejected requests are
+counted too, so a client that keeps hammering stays limited instead of being let through
+again at the next window edge.
+
+Every check is answered from the per-process counters (an LRU capped at
+RATE_LIMIT_MAX_KEYS; idle keys expire). Backends (RATE_LIMIT_BACKEND):
+    memory  counters are per worker
+    sqlite  a background task in each worker pushes its new hits to the rate_limits table
+            every RATE_LIMIT_SYNC_MS and pulls back the all-worker totals for those keys, so
+            limits hold across uvicorn workers within about one sync interval; requests
+            never wait on SQLite
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from db_pool import write_connection
+from migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+RATE_LIMIT_SYNC_MS = int(os.getenv("RATE_LIMIT_SYNC_MS", "500"))
+
+
+def _slide(start: int, previous: int, current: int, now: float, window: int) -> Tuple[int, int, int, float]:
+    """Move a counter to the window containing now; returns (start, previous, current, estimated count)"""
+    window_start = int(now // window) * window
+    if start != window_start:
+        previous = current if start == window_start - window else 0
+        current = 0
+        start = window_start
+    weight = 1.0 - (now - window_start) / window
+    return start, previous, current, previous * weight + current
+
+
+class RateLimiter:
+    """Sliding-window counters per key, optionally shared between workers through SQLite"""
+
+    def __init__(
+        self,
+        backend: str = RATE_LIMIT_BACKEND,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        db_path=None,
+        sync_interval_ms: int = RATE_LIMIT_SYNC_MS,
+    ):
+        if backend not in ("memory", "sqlite"):
+            logger.warning("Unknown RATE_LIMIT_BACKEND %r, using memory", backend)
+            backend = "memory"
+        self.backend = backend
+        self.max_keys = max_keys
+        self.sync_interval = sync_interval_ms / 1000
+        self._db_path = db_path
+        # key -> [window_start, previous, current, window_seconds, hits not yet pushed to the table]
+        self._counters: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"checks": 0, "limited": 0, "evicted": 0, "expired": 0, "syncs": 0, "shared_errors": 0}
+
+    def _db(self):
+        if self._db_path is None:
+            from database import DB_PATH
+
+            self._db_path = DB_PATH
+        return self._db_path
+
+    def hit(self, key: str, limit: int, window_seconds: int = 60) -> bool:
+        """Count one request for key; True means it is over limit per window_seconds"""
+        now = time.time()
+        with self._lock:
+            self.counters["checks"] += 1
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = [0, 0, 0, window_seconds, 0]
+                self._counters[key] = counter
+            else:
+                self._counters.move_to_end(key)
+            counter[0], counter[1], counter[2], estimated = _slide(counter[0], counter[1], counter[2], now, window_seconds)
+            limited = estimated + 1 > limit
+            counter[2] += 1
+            counter[4] += 1
+            if limited:
+                self.counters["limited"] += 1
+            self._evict(now)
+        return limited
+
+    def _evict(self, now: float) -> None:
+        # Least recently used first: idle keys (nothing left in either window) go, then the
+        # oldest keys while over the cap. Amortized O(1): only the front is examined.
+        while self._counters:
+            key, (start, _, _, window, _) = next(iter(self._counters.items()))
+            if start + 2 * window <= now:
+                self.counters["expired"] += 1
+            elif len(self._counters) > self.max_keys:
+                self.counters["evicted"] += 1
+            else:
+                break
+            del self._counters[key]
+
+    def sync_shared(self) -> int:
+        """
+        Push hits counted since the last sync to rate_limits and adopt the shared totals
+        (this worker's hits plus everyone else's). Blocking; returns keys synced.
+        """
+        now = time.time()
+        with self._lock:
+            pending = [(key, counter[0], counter[3], counter[4]) for key, counter in self._counters.items() if counter[4]]
+            for key, _, _, _ in pending:
+                self._counters[key][4] = 0
+        if not pending:
+            return 0
+
+        totals: Dict[str, Tuple[int, int, int]] = {}
+        try:
+            db_path = self._db()
+            run_migrations(db_path)
+            with write_connection(db_path) as conn:
+                # IMMEDIATE: read-modify-write must not interleave with another worker's sync
+                conn.execute("BEGIN IMMEDIATE")
+                for key, counted_in, window, hits in pending:
+                    row = conn.execute(
+                        "SELECT window_start, previous_count, current_count FROM rate_limits WHERE key = ?", (key,)
+                    ).fetchone()
+                    start, previous, current, _ = _slide(*(row or (0, 0, 0)), now, window)
+                    if counted_in == start:
+                        current += hits
+                    elif counted_in == start - window:
+                        previous += hits
+                    conn.execute(
+                        """
+                        INSERT INTO rate_limits (key, window_start, previous_count, current_count, expires_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET
+                            window_start = excluded.window_start,
+                            previous_count = excluded.previous_count,
+                            current_count = excluded.current_count,
+                            expires_at = excluded.expires_at
+                        """,
+                        (key, start, previous, current, start + 2 * window),
+                    )
+                    totals[key] = (start, previous, current)
+        except Exception as exc:  # noqa: BLE001
+            # Keep the hits for the next attempt; checks go on with the local counts
+            with self._lock:
+                self.counters["shared_errors"] += 1
+                for key, _, _, hits in pending:
+                    counter = self._counters.get(key)
+                    if counter is not None:
+                        counter[4] += hits
+            logger.error("Shared rate limit sync failed, using local counters: %s", exc)
+            return 0
+
+        with self._lock:
+            self.counters["syncs"] += 1
+            for key, (start, previous, current) in totals.items():
+                counter = self._counters.get(key)
+                if counter is None:
+                    continue
+                # Hits that arrived during the sync stay pending and on top of the totals
+                arrived = counter[4] if counter[0] == start else 0
+                counter[0], counter[1], counter[2] = start, previous, current + arrived
+        return len(totals)
+
+    async def run_forever(self) -> None:
+        """Background sync for the sqlite backend, started from the app lifespan in every worker"""
+        if self.backend != "sqlite":
+            return
+        logger.info("Rate limiter: syncing shared counters every %dms", int(self.sync_interval * 1000))
+        try:
+            while True:
+                await asyncio.sleep(self.sync_interval)
+                await asyncio.to_thread(self.sync_shared)
+        finally:
+            await asyncio.to_thread(self.sync_shared)
+
+    def prune(self) -> int:
+        """Drop expired counters (shared table rows or local keys); returns how many"""
+        now = time.time()
+        if self.backend == "sqlite":
+            db_path = self._db()
+            run_migrations(db_path)
+            with write_connection(db_path) as conn:
+                return conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (int(now),)).rowcount
+        with self._lock:
+            expired = [key for key, (start, _, _, window, _) in self._counters.items() if start + 2 * window <= now]
+            for key in expired:
+                del self._counters[key]
+            self.counters["expired"] += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self.counters, "backend": self.backend, "keys": len(self._counters)}
+
+
+# Global instance (similar to change_events)
+rate_limiter = RateLimiter()
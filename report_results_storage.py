@@ -0,0 +1,150 @@
+"""
+Report results table size with plain vs compact raw_text storage
+Generates the same synthetic dataset twice (default 1,000,000 rows) in a temp directory
+and prints the database sizes after VACUUM.
+
+Usage:
+    python report_results_storage.py              # 1M rows
+    python report_results_storage.py 200000       # custom row count
+    python report_results_storage.py --compact-existing   # re-encode data/lecture_sync.db in place
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import database
+from database import encode_raw_text, decode_raw_text, compact_results_raw_text
+
+SUBJECTS = [
+    "Computer Architecture", "Database Systems", "Operating Systems", "Computer Networks",
+    "Discrete Mathematics", "Object Oriented Programming", "Software Engineering", "Web Development",
+]
+EXAM_TYPES = ["quiz1", "quiz2", "quiz3", "midterm", "final", "assignment", "lab report"]
+SEMESTERS = ["Software_F_25-26", "Software_S_25-26", "Software_F_24-25", "Software_S_24-25"]
+EXTRA_NOTES = [
+    "Please check the portal for details.",
+    "نتيجة الامتحان متوفرة الآن",
+    "نەتیجەی تاقیکردنەوە بڵاوکرایەوە",
+    "Contact the department if you have an objection within 3 days.",
+]
+
+CREATE_SQL = """
+    CREATE TABLE results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id TEXT NOT NULL,
+        notification_id TEXT UNIQUE NOT NULL,
+        subject TEXT,
+        exam_type TEXT,
+        score TEXT,
+        grade TEXT,
+        semester TEXT,
+        status TEXT,
+        raw_text TEXT NOT NULL,
+        raw_text_packed BLOB,
+        exam_date TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+"""
+
+
+def generate_rows(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        row = {
+            "student_id": f"B0{2000000 + i // 60}",
+            "notification_id": f"B0{2000000 + i // 60}:{i}",
+            "subject": rng.choice(SUBJECTS),
+            "exam_type": rng.choice(EXAM_TYPES),
+            "score": f"{rng.randint(0, 100) / 10:g}",
+            "semester": rng.choice(SEMESTERS),
+            "exam_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00",
+        }
+        row["raw_text"] = "Your result of {exam_type} of {subject} - {semester} class is {score}".format(**row)
+        # About one in ten notifications carries extra text and does not match the template
+        if rng.random() < 0.1:
+            row["raw_text"] += " " + rng.choice(EXTRA_NOTES)
+        yield row
+
+
+def build_db(path: Path, count: int, compact: bool) -> float:
+    started = time.perf_counter()
+    with sqlite3.connect(path) as conn:
+        conn.execute(CREATE_SQL)
+        batch = []
+        for row in generate_rows(count):
+            raw_text, packed = encode_raw_text(row["raw_text"]) if compact else (row["raw_text"], None)
+            batch.append((
+                row["student_id"], row["notification_id"], row["subject"], row["exam_type"],
+                row["score"], None, row["semester"], "passed", raw_text, packed, row["exam_date"],
+                row["exam_date"], row["exam_date"],
+            ))
+            if len(batch) >= 10000:
+                conn.executemany("INSERT INTO results (student_id, notification_id, subject, exam_type, score, grade, semester, status, raw_text, raw_text_packed, exam_date, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO results (student_id, notification_id, subject, exam_type, score, grade, semester, status, raw_text, raw_text_packed, exam_date, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+    return time.perf_counter() - started
+
+
+def verify_round_trip(path: Path, sample: int = 20000) -> int:
+    """Decode a sample of compact rows and compare with the regenerated originals"""
+    originals = {row["notification_id"]: row["raw_text"] for row in generate_rows(sample)}
+    mismatches = 0
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    for row in conn.execute("SELECT * FROM results ORDER BY id LIMIT ?", (sample,)):
+        item = dict(row)
+        if decode_raw_text(item["raw_text"], item["raw_text_packed"]) != originals[item["notification_id"]]:
+            mismatches += 1
+    conn.close()
+    return mismatches
+
+
+def main():
+    if "--compact-existing" in sys.argv:
+        before = os.path.getsize(database.DB_PATH)
+        compacted = compact_results_raw_text()
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute("VACUUM")
+        conn.close()
+        after = os.path.getsize(database.DB_PATH)
+        print(f"Compacted {compacted} rows: {before / 1024:.1f} KB -> {after / 1024:.1f} KB")
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = Path(tmp) / "results_plain.db"
+        compact_path = Path(tmp) / "results_compact.db"
+
+        print(f"Generating {count:,} result rows...")
+        plain_seconds = build_db(plain_path, count, compact=False)
+        compact_seconds = build_db(compact_path, count, compact=True)
+
+        plain_size = os.path.getsize(plain_path)
+        compact_size = os.path.getsize(compact_path)
+        conn = sqlite3.connect(compact_path)
+        kinds = dict(conn.execute("""
+            SELECT CASE WHEN raw_text_packed IS NULL THEN 'plain' ELSE 'zlib' END, COUNT(*)
+            FROM results GROUP BY 1
+        """).fetchall())
+        conn.close()
+
+        print("=" * 60)
+        print(f"Plain raw_text:   {plain_size / 1024 / 1024:8.1f} MB  (built in {plain_seconds:.1f}s)")
+        print(f"Compact raw_text: {compact_size / 1024 / 1024:8.1f} MB  (built in {compact_seconds:.1f}s)")
+        print(f"Saved:            {(plain_size - compact_size) / 1024 / 1024:8.1f} MB ({100 * (1 - compact_size / plain_size):.1f}%)")
+        print(f"Encodings:        {kinds}")
+        print(f"Round-trip mismatches in sample: {verify_round_trip(compact_path, min(count, 20000))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Result Statistics Module for SwiftSync
+Compact per-student summary built from the incremental result_stats aggregates
+Aggregates are maintained by database.save_result, so reading them never rescans results
+"""
+
+from typing import Any, Dict, Optional
+
+from database import (
+    STATS_SCOPE_OVERALL,
+    STATS_SCOPE_SEMESTER,
+    STATS_SCOPE_SUBJECT,
+    get_result_stats,
+    rebuild_result_stats,
+    result_stats_missing,
+)
+
+# Latest score must differ from the earlier mean by more than this to count as a trend
+TREND_TOLERANCE = 0.05
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def _trend(row: Dict[str, Any]) -> str:
+    """Compare the most recent score with the mean of the earlier ones."""
+    scored = row.get("scored_count") or 0
+    latest = row.get("latest_score")
+    if scored < 2 or latest is None:
+        return "flat"
+    earlier_mean = (row["score_sum"] - latest) / (scored - 1)
+    if earlier_mean == 0:
+        return "up" if latest > 0 else "flat"
+    change = (latest - earlier_mean) / abs(earlier_mean)
+    if change > TREND_TOLERANCE:
+        return "up"
+    if change < -TREND_TOLERANCE:
+        return "down"
+    return "flat"
+
+
+def _summarize(row: Dict[str, Any]) -> Dict[str, Any]:
+    scored = row.get("scored_count") or 0
+    return {
+        "count": row.get("result_count") or 0,
+        "mean": _round(row["score_sum"] / scored) if scored else None,
+        "best": _round(row.get("best_score")),
+        "latest": _round(row.get("latest_score")),
+        "trend": _trend(row),
+    }
+
+
+def ensure_result_stats() -> int:
+    """Build aggregates once for databases created before result_stats existed."""
+    if not result_stats_missing():
+        return 0
+    counted = rebuild_result_stats()
+    print(f"[OK] Built result statistics from {counted} stored results")
+    return counted
+
+
+def get_student_statistics(student_id: str, academic_year: str) -> Dict[str, Any]:
+    """
+    Overall, per-semester and per-subject statistics for a student in one academic year
+    (scores on a 0-100 scale):
+    {overall: {count, mean, best, latest, trend}, semesters: {...}, subjects: {...}}
+    """
+    overall = _summarize({"result_count": 0, "scored_count": 0, "score_sum": 0.0})
+    semesters: Dict[str, Dict[str, Any]] = {}
+    subjects: Dict[str, Dict[str, Any]] = {}
+
+    for row in get_result_stats(student_id, academic_year):
+        if row["scope"] == STATS_SCOPE_OVERALL:
+            overall = _summarize(row)
+        elif row["scope"] == STATS_SCOPE_SEMESTER:
+            semesters[row["scope_key"]] = _summarize(row)
+        elif row["scope"] == STATS_SCOPE_SUBJECT:
+            subjects[row["scope_key"]] = _summarize(row)
+
+    return {
+        "overall": overall,
+        "semesters": dict(sorted(semesters.items())),
+        "subjects": dict(sorted(subjects.items())),
+    }
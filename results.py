@@ -11,10 +11,17 @@ import requests
 from bs4 import BeautifulSoup
 from typing import Optional, Dict, Any, List
 import re
+import time
 from datetime import datetime
 
 # Import database functions for result storage
-from database import save_result, get_student_results, result_exists
+from database import (
+    save_result,
+    result_exists,
+    get_normalized_student_results,
+    get_results_missing_normalization,
+    update_result_normalization,
+)
 
 
 class ResultsService:
@@ -46,8 +53,12 @@ class ResultsService:
         'degree', 'پلە', 'دەرەجە'
     ]
     
+    # Results refreshed from the portal within this window are served from the database
+    FRESH_RESULTS_SECONDS = int(os.getenv("RESULTS_FRESH_SECONDS", "600"))
+    
     def __init__(self):
-        pass
+        # student_id -> monotonic time of the last successful portal refresh
+        self._last_refreshed: Dict[str, float] = {}
 
     def _normalize_result_key(self, item: Dict[str, Any]) -> str:
         """Build a stable key used to collapse duplicate rows returned to the UI."""
@@ -60,18 +71,6 @@ class ResultsService:
         date_norm = date_raw[:10] if len(date_raw) >= 10 else date_raw
         return f"{semester_display}|{subject}|{exam_type}|{score}|{date_norm}"
 
-    def _dedupe_result_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Remove repeated rows while preserving first occurrence order."""
-        seen = set()
-        deduped = []
-        for item in items:
-            key = self._normalize_result_key(item)
-            if key in seen:
-                continue
-            seen.add(key)
-            deduped.append(item)
-        return deduped
-
     def _belongs_to_target_year(self, semester: str, raw_text: str) -> bool:
         """Keep only notifications tied to the configured academic year."""
         combined = f"{semester or ''} {raw_text or ''}".lower()
@@ -80,20 +79,85 @@ class ResultsService:
             or self.TARGET_ACADEMIC_YEAR_SHORT.lower() in combined
         )
 
-    def _to_semester_display(self, semester: str, raw_text: str) -> Optional[str]:
-        """Map raw semester codes/text to a canonical display label."""
+    def _academic_year_of(self, semester: str, raw_text: str) -> Optional[str]:
+        """Academic year a notification belongs to, as YYYY-YYYY."""
+        if self._belongs_to_target_year(semester, raw_text):
+            return self.TARGET_ACADEMIC_YEAR_FULL
+        combined = f"{semester or ''} {raw_text or ''}"
+        full_match = re.search(r'\b(20\d{2})\s*[-/]\s*(20\d{2})\b', combined)
+        if full_match:
+            return f"{full_match.group(1)}-{full_match.group(2)}"
+        short_match = re.search(r'(?<!\d)(\d{2})-(\d{2})(?!\d)', combined)
+        if short_match:
+            return f"20{short_match.group(1)}-20{short_match.group(2)}"
+        return None
+
+    def _semester_term(self, semester: str, raw_text: str) -> Optional[str]:
+        """Detect Fall/Spring from raw semester codes/text."""
         combined = f"{semester or ''} {raw_text or ''}".lower()
 
         # Support portal codes like Software_F_25-26, Software_F25-26, Software_S_25-26, Software_S25-26
-        is_fall = bool(re.search(r'(?:[_\-]f[_\-]?\d{2}-\d{2}|\bfall\b|\b1st\s+semester\b|\bfirst\s+semester\b)', combined))
-        is_spring = bool(re.search(r'(?:[_\-]s[_\-]?\d{2}-\d{2}|\bspring\b|\b2nd\s+semester\b|\bsecond\s+semester\b)', combined))
+        if re.search(r'(?:[_\-]f[_\-]?\d{2}-\d{2}|\bfall\b|\b1st\s+semester\b|\bfirst\s+semester\b)', combined):
+            return "Fall"
+        if re.search(r'(?:[_\-]s[_\-]?\d{2}-\d{2}|\bspring\b|\b2nd\s+semester\b|\bsecond\s+semester\b)', combined):
+            return "Spring"
+        return None
 
-        if is_fall:
-            return f"{self.TARGET_ACADEMIC_YEAR_FULL} Fall Semester"
-        if is_spring:
-            return f"{self.TARGET_ACADEMIC_YEAR_FULL} Spring Semester"
+    def _to_semester_display(self, semester: str, raw_text: str) -> Optional[str]:
+        """Map raw semester codes/text to a canonical display label."""
+        term = self._semester_term(semester, raw_text)
+        if term:
+            return f"{self.TARGET_ACADEMIC_YEAR_FULL} {term} Semester"
         return None
 
+    def _normalize_for_storage(self, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compute the normalized columns stored with each result row
+        (academic_year, semester_display, dedupe_key) so reads are a plain SQL query.
+        """
+        semester = parsed.get('semester', '')
+        raw_text = parsed.get('raw_text', '')
+        academic_year = self._academic_year_of(semester, raw_text)
+        term = self._semester_term(semester, raw_text)
+        semester_display = f"{academic_year} {term} Semester" if academic_year and term else None
+        dedupe_key = self._normalize_result_key({
+            'semester_display': semester_display,
+            'subject': parsed.get('subject'),
+            'exam_type': parsed.get('exam_type'),
+            'score': parsed.get('score'),
+            'date': parsed.get('exam_date'),
+        })
+        return {
+            **parsed,
+            'academic_year': academic_year,
+            'semester_display': semester_display,
+            'dedupe_key': dedupe_key,
+        }
+
+    def backfill_normalization(self) -> int:
+        """Fill normalized columns for rows saved before they existed (run once by the leader at startup)."""
+        total = 0
+        while True:
+            rows = get_results_missing_normalization(limit=1000)
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                normalized = self._normalize_for_storage(row)
+                updates.append((
+                    normalized['academic_year'],
+                    normalized['semester_display'],
+                    normalized['dedupe_key'],
+                    row['id'],
+                ))
+            updated = update_result_normalization(updates)
+            total += updated
+            if updated <= 0:
+                break
+        if total:
+            print(f"[OK] Normalized {total} stored results")
+        return total
+
     def _student_notification_id(self, student_id: str, notification_id: str) -> str:
         """Namespace notification ID per student to avoid cross-student collisions."""
         sid = (student_id or "").strip()
@@ -363,7 +427,7 @@ class ResultsService:
                                 'status': 'passed',
                                 'exam_date': datetime.now().isoformat()
                             }
-                            if save_result(student_id, scoped_id, parsed):
+                            if save_result(student_id, scoped_id, self._normalize_for_storage(parsed)):
                                 saved_count += 1
                                 print(f"DEBUG: Saved official Fall result: {subject}")
             
@@ -372,7 +436,163 @@ class ResultsService:
             print(f"DEBUG: Error saving official results: {e}")
             return 0
     
-    async def get_results(self, session_token: str, session_manager) -> Dict[str, Any]:
+    def is_fresh(self, student_id: str, max_age_seconds: int) -> bool:
+        """Return True when this student's results were refreshed from the portal recently."""
+        refreshed_at = self._last_refreshed.get(student_id)
+        if refreshed_at is None or max_age_seconds <= 0:
+            return False
+        return (time.monotonic() - refreshed_at) <= max_age_seconds
+
+    def get_stored_result_items(self, student_id: str) -> List[Dict[str, Any]]:
+        """Return stored results for the student formatted for the frontend."""
+        # Year filter, semester mapping and dedupe are precomputed at insert time
+        result_items = get_normalized_student_results(student_id, self.TARGET_ACADEMIC_YEAR_FULL, limit=500)
+        print(f"DEBUG: Found {len(result_items)} stored results in database")
+        return result_items
+
+    async def refresh_student_results(self, student_id: str, cookies: Dict) -> int:
+        """
+        Fetch all notification pages from the portal and save new result rows
+        Returns count of newly saved results
+        """
+        new_results_saved = 0
+
+        # First, get total page count from dedicated endpoint.
+        pages_count_endpoint = f"{self.BASE_URL}/Notification/GetPagesCount"
+        print(f"DEBUG: Fetching page count from: {pages_count_endpoint}")
+        
+        try:
+            def fetch_page_count():
+                response = requests.get(
+                    pages_count_endpoint,
+                    cookies=cookies,
+                    timeout=self.REQUEST_TIMEOUT,
+                    headers={
+                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+                        "Accept": "application/json, text/html, */*",
+                    }
+                )
+                return response
+            
+            page_count_response = await asyncio.to_thread(fetch_page_count)
+            total_pages = 1
+            
+            if page_count_response.status_code == 200:
+                try:
+                    count_data = page_count_response.json()
+                    if isinstance(count_data, dict):
+                        total_pages = int(
+                            count_data.get(
+                                'pageCount',
+                                count_data.get('totalPages', count_data.get('pages', count_data.get('count', 1)))
+                            )
+                        )
+                    else:
+                        total_pages = int(count_data)
+                    if total_pages < 1:
+                        total_pages = 1
+                    print(f"DEBUG: Total pages from GetPagesCount: {total_pages}")
+                except:
+                    print(f"DEBUG: Could not parse page count, using default 1")
+        except Exception as e:
+            total_pages = 1
+            print(f"DEBUG: Could not fetch page count: {e}, using default 1")
+        
+        # Now fetch ALL pages of notifications with pagination
+        all_notifications = []
+        page_number = 1
+        page_size = 50
+        
+        while page_number <= total_pages:
+            # Add pagination parameters to endpoint
+            paginated_endpoint = f"{self.NOTIFICATIONS_ENDPOINT}?PageNumber={page_number}&PageSize={page_size}"
+            print(f"DEBUG: Fetching page {page_number}/{total_pages} from: {paginated_endpoint}")
+            
+            notifications = await self._fetch_notifications(paginated_endpoint, cookies)
+            
+            # If no notifications returned, we've reached the end
+            if not notifications or len(notifications) == 0:
+                print(f"DEBUG: No more notifications on page {page_number}, stopping pagination")
+                break
+            
+            print(f"DEBUG: Page {page_number} returned {len(notifications)} notifications")
+            
+            # Log first few notification texts to see what we're getting
+            for idx, notif in enumerate(notifications[:3]):
+                text = notif.get('text', '')
+                desc = notif.get('description', '')
+                print(f"  Notification {idx+1}: text='{text[:60]}...' desc='{desc[:60]}...'")
+            
+            all_notifications.extend(notifications)
+            
+            page_number += 1
+        
+        fetched_pages = page_number - 1 if page_number > 1 else 1
+        print(f"DEBUG: Total notifications fetched across {fetched_pages} pages: {len(all_notifications)}")
+        print(f"DEBUG: Analyzing notifications for result keywords...")
+
+        
+        # Process all fetched notifications
+        if all_notifications:
+            print(f"DEBUG: Processing {len(all_notifications)} notifications")
+            result_count = 0
+            non_result_count = 0
+            
+            # Filter and save result-related notifications
+            for notification in all_notifications:
+                text = notification.get('text', '')
+                description = notification.get('description', '')
+                notification_id = str(notification.get('id', ''))
+                date = notification.get('date', '')
+                
+                if not notification_id or not text:
+                    continue
+                
+                # Check if result-related (check both text and description)
+                check_text = f"{text} {description}"
+                print(f"DEBUG: Checking notification {notification_id}: '{text[:50]}...'")
+                
+                if self._is_result_notification(check_text):
+                    result_count += 1
+                    print(f"  ✓ IS result-related (keyword match)")
+                    
+                    # Check if already saved for THIS student (avoid duplicates per student)
+                    scoped_notification_id = self._student_notification_id(student_id, notification_id)
+                    if not result_exists(scoped_notification_id, student_id):
+                        print(f"  → New for student {student_id}, parsing and saving...")
+                        # Parse the notification using description field
+                        parsed = self._parse_notification_text(text, description)
+                        parsed['raw_text'] = check_text
+                        parsed['exam_date'] = date
+                        
+                        # Detect semester
+                        is_fall = bool(re.search(r'(?:[_\-]f[_\-]?\d{2}-\d{2}|\bfall\b|\b1st\s+semester\b|\bfirst\s+semester\b)', check_text.lower()))
+                        is_spring = bool(re.search(r'(?:[_\-]s[_\-]?\d{2}-\d{2}|\bspring\b|\b2nd\s+semester\b|\bsecond\s+semester\b)', check_text.lower()))
+                        sem_label = 'FALL' if is_fall else ('SPRING' if is_spring else 'UNKNOWN')
+                        print(f"    Semester detected: {sem_label}")
+
+                        # Save all result notifications; year/semester are normalized here and filtered in SQL at read time.
+                        if save_result(student_id, scoped_notification_id, self._normalize_for_storage(parsed)):
+                            new_results_saved += 1
+                            print(f"  ✓ Saved result {new_results_saved}: {parsed.get('subject', 'Unknown')} - {parsed.get('exam_type', 'Unknown')} [{sem_label}]")
+                        else:
+                            print(f"  ✗ Failed to save notification {notification_id}")
+                    else:
+                        print(f"  → Already exists for student {student_id}")
+                else:
+                    non_result_count += 1
+                    print(f"  ✗ NOT result-related (no keyword match)")
+            
+            print(f"DEBUG: Processed summary: {result_count} result-related, {non_result_count} non-result")
+        else:
+            print(f"DEBUG: No notifications received from API")
+
+        # Only count as fresh when the portal actually answered; expired cookies return nothing.
+        if all_notifications:
+            self._last_refreshed[student_id] = time.monotonic()
+        return new_results_saved
+
+    async def get_results(self, session_token: str, session_manager, force_refresh: bool = False) -> Dict[str, Any]:
         """
         Fetch results from notification API and save to database
         Returns stored results from database for persistence
@@ -380,6 +600,7 @@ class ResultsService:
         Args:
             session_token: Valid session token from attendance login
             session_manager: SessionManager instance from attendance.py
+            force_refresh: Always hit the portal, even if the prefetcher refreshed recently
         
         Returns:
             {
@@ -404,170 +625,14 @@ class ResultsService:
         new_results_saved = 0
         
         try:
-            # First, get total page count from dedicated endpoint.
-            pages_count_endpoint = f"{self.BASE_URL}/Notification/GetPagesCount"
-            print(f"DEBUG: Fetching page count from: {pages_count_endpoint}")
-            
-            try:
-                def fetch_page_count():
-                    response = requests.get(
-                        pages_count_endpoint,
-                        cookies=cookies,
-                        timeout=self.REQUEST_TIMEOUT,
-                        headers={
-                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                            "Accept": "application/json, text/html, */*",
-                        }
-                    )
-                    return response
-                
-                page_count_response = await asyncio.to_thread(fetch_page_count)
-                total_pages = 1
-                
-                if page_count_response.status_code == 200:
-                    try:
-                        count_data = page_count_response.json()
-                        if isinstance(count_data, dict):
-                            total_pages = int(
-                                count_data.get(
-                                    'pageCount',
-                                    count_data.get('totalPages', count_data.get('pages', count_data.get('count', 1)))
-                                )
-                            )
-                        else:
-                            total_pages = int(count_data)
-                        if total_pages < 1:
-                            total_pages = 1
-                        print(f"DEBUG: Total pages from GetPagesCount: {total_pages}")
-                    except:
-                        print(f"DEBUG: Could not parse page count, using default 1")
-            except Exception as e:
-                total_pages = 1
-                print(f"DEBUG: Could not fetch page count: {e}, using default 1")
-            
-            # Now fetch ALL pages of notifications with pagination
-            all_notifications = []
-            page_number = 1
-            page_size = 50
-            
-            while page_number <= total_pages:
-                # Add pagination parameters to endpoint
-                paginated_endpoint = f"{self.NOTIFICATIONS_ENDPOINT}?PageNumber={page_number}&PageSize={page_size}"
-                print(f"DEBUG: Fetching page {page_number}/{total_pages} from: {paginated_endpoint}")
-                
-                notifications = await self._fetch_notifications(paginated_endpoint, cookies)
-                
-                # If no notifications returned, we've reached the end
-                if not notifications or len(notifications) == 0:
-                    print(f"DEBUG: No more notifications on page {page_number}, stopping pagination")
-                    break
-                
-                print(f"DEBUG: Page {page_number} returned {len(notifications)} notifications")
-                
-                # Log first few notification texts to see what we're getting
-                for idx, notif in enumerate(notifications[:3]):
-                    text = notif.get('text', '')
-                    desc = notif.get('description', '')
-                    print(f"  Notification {idx+1}: text='{text[:60]}...' desc='{desc[:60]}...'")
-                
-                all_notifications.extend(notifications)
-                
-                page_number += 1
-            
-            fetched_pages = page_number - 1 if page_number > 1 else 1
-            print(f"DEBUG: Total notifications fetched across {fetched_pages} pages: {len(all_notifications)}")
-            print(f"DEBUG: Analyzing notifications for result keywords...")
-
-            
-            # Process all fetched notifications
-            if all_notifications:
-                print(f"DEBUG: Processing {len(all_notifications)} notifications")
-                result_count = 0
-                non_result_count = 0
-                
-                # Filter and save result-related notifications
-                for notification in all_notifications:
-                    text = notification.get('text', '')
-                    description = notification.get('description', '')
-                    notification_id = str(notification.get('id', ''))
-                    date = notification.get('date', '')
-                    
-                    if not notification_id or not text:
-                        continue
-                    
-                    # Check if result-related (check both text and description)
-                    check_text = f"{text} {description}"
-                    print(f"DEBUG: Checking notification {notification_id}: '{text[:50]}...'")
-                    
-                    if self._is_result_notification(check_text):
-                        result_count += 1
-                        print(f"  ✓ IS result-related (keyword match)")
-                        
-                        # Check if already saved for THIS student (avoid duplicates per student)
-                        scoped_notification_id = self._student_notification_id(student_id, notification_id)
-                        if not result_exists(scoped_notification_id, student_id):
-                            print(f"  → New for student {student_id}, parsing and saving...")
-                            # Parse the notification using description field
-                            parsed = self._parse_notification_text(text, description)
-                            parsed['raw_text'] = check_text
-                            parsed['exam_date'] = date
-                            
-                            # Detect semester
-                            is_fall = bool(re.search(r'(?:[_\-]f[_\-]?\d{2}-\d{2}|\bfall\b|\b1st\s+semester\b|\bfirst\s+semester\b)', check_text.lower()))
-                            is_spring = bool(re.search(r'(?:[_\-]s[_\-]?\d{2}-\d{2}|\bspring\b|\b2nd\s+semester\b|\bsecond\s+semester\b)', check_text.lower()))
-                            sem_label = 'FALL' if is_fall else ('SPRING' if is_spring else 'UNKNOWN')
-                            print(f"    Semester detected: {sem_label}")
-
-                            # Save all result notifications; year/semester filtering is applied at read time.
-                            if save_result(student_id, scoped_notification_id, parsed):
-                                new_results_saved += 1
-                                print(f"  ✓ Saved result {new_results_saved}: {parsed.get('subject', 'Unknown')} - {parsed.get('exam_type', 'Unknown')} [{sem_label}]")
-                            else:
-                                print(f"  ✗ Failed to save notification {notification_id}")
-                        else:
-                            print(f"  → Already exists for student {student_id}")
-                    else:
-                        non_result_count += 1
-                        print(f"  ✗ NOT result-related (no keyword match)")
-                
-                print(f"DEBUG: Processed summary: {result_count} result-related, {non_result_count} non-result")
+            if not force_refresh and self.is_fresh(student_id, self.FRESH_RESULTS_SECONDS):
+                print(f"DEBUG: Results for student {student_id} refreshed recently, serving stored results")
             else:
-                print(f"DEBUG: No notifications received from API")
+                new_results_saved = await self.refresh_student_results(student_id, cookies)
             
             # Fetch results from database (this is our persistent source)
             print(f"DEBUG: Fetching stored results for student {student_id}")
-            stored_results = get_student_results(student_id, limit=500)
-            print(f"DEBUG: Found {len(stored_results)} stored results in database")
-            
-            # Format results for frontend
-            result_items = []
-            for stored in stored_results:
-                raw_text = stored.get('raw_text', '')
-                semester_raw = stored.get('semester', '')
-
-                # Data-safety guard: only return current academic year for the authenticated student
-                if not self._belongs_to_target_year(semester_raw, raw_text):
-                    continue
-
-                semester_display = self._to_semester_display(semester_raw, raw_text)
-                if not semester_display:
-                    continue
-
-                result_item = {
-                    'id': str(stored.get('notification_id', '')).split(':', 1)[-1],
-                    'date': stored.get('exam_date', stored.get('created_at', '')),
-                    'raw_text': raw_text,
-                    'subject': stored.get('subject'),
-                    'exam_type': stored.get('exam_type'),
-                    'score': stored.get('score'),
-                    'grade': stored.get('grade'),
-                    'semester': semester_raw,
-                    'semester_display': semester_display,
-                    'status': stored.get('status'),
-                }
-                result_items.append(result_item)
-            
-            deduped_items = self._dedupe_result_items(result_items)
+            deduped_items = self.get_stored_result_items(student_id)
             return {
                 'success': True,
                 'results': deduped_items,
@@ -578,34 +643,7 @@ class ResultsService:
         except Exception as e:
             # If API fetch fails, still try to return stored results
             try:
-                stored_results = get_student_results(student_id, limit=500)
-                result_items = []
-                for stored in stored_results:
-                    raw_text = stored.get('raw_text', '')
-                    semester_raw = stored.get('semester', '')
-
-                    if not self._belongs_to_target_year(semester_raw, raw_text):
-                        continue
-
-                    semester_display = self._to_semester_display(semester_raw, raw_text)
-                    if not semester_display:
-                        continue
-
-                    result_item = {
-                        'id': str(stored.get('notification_id', '')).split(':', 1)[-1],
-                        'date': stored.get('exam_date', stored.get('created_at', '')),
-                        'raw_text': raw_text,
-                        'subject': stored.get('subject'),
-                        'exam_type': stored.get('exam_type'),
-                        'score': stored.get('score'),
-                        'grade': stored.get('grade'),
-                        'semester': semester_raw,
-                        'semester_display': semester_display,
-                        'status': stored.get('status'),
-                    }
-                    result_items.append(result_item)
-                
-                deduped_items = self._dedupe_result_items(result_items)
+                deduped_items = self.get_stored_result_items(student_id)
                 return {
                     'success': True,
                     'results': deduped_items,
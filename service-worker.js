@@ -73,6 +73,11 @@ self.addEventListener('fetch', (event) => {
     return;
   }
 
+  // Server-sent events stream - let the browser handle it directly (long-lived response)
+  if (url.pathname === '/api/events') {
+    return;
+  }
+
   // API requests - network only, no cache (preserve cookies)
   if (url.pathname.startsWith('/api/')) {
     event.respondWith(
@@ -0,0 +1,151 @@
+"""
+Static Bundles for SwiftSync
+Moves the inline <style>/<script> blocks of rendered pages into content-hashed files
+under static/bundles/ (served with Cache-Control: immutable) and swaps in
+<link>/<script src> tags, so repeat visits transfer only the HTML shell.
+The per-page asset manifest also feeds the service worker's CORE_ASSETS, and is
+persisted next to the bundles so pruning keeps what any process last rendered.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_DIR = Path("static") / "bundles"
+BUNDLE_URL_PREFIX = "/static/bundles/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Bundles no page references any more are deleted at startup once older than this
+# (the clock starts when a page stops referencing them)
+BUNDLE_RETENTION_DAYS = 7
+MANIFEST_SUFFIX = ".manifest.json"
+
+# Only attribute-less blocks; anything with type/nonce/src etc. is left inline
+_INLINE_BLOCK = re.compile(r"<(style|script)>(.*?)</\1>", re.S)
+
+# page -> bundle URLs in document order
+manifest: Dict[str, List[str]] = {}
+# content hash -> URL, so re-rendering an unchanged page writes nothing
+_written: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    """Write via a uniquely named temp file and rename, so no reader sees a partial file"""
+    BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=BUNDLE_DIR, suffix=".tmp", delete=False) as tmp:
+        tmp.write(content)
+    try:
+        os.replace(tmp.name, path)
+    except OSError:
+        os.unlink(tmp.name)
+        # Bundles are content-addressed: another worker writing the same name wrote the same bytes
+        if not path.exists():
+            raise
+
+
+def _bundle_url(page: str, index: int, kind: str, content: str) -> str:
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    url = _written.get(digest)
+    if url is not None:
+        return url
+    filename = f"{page}-{index}.{digest}.{'css' if kind == 'style' else 'js'}"
+    path = BUNDLE_DIR / filename
+    if not path.exists():
+        _write_atomic(path, content)
+    url = BUNDLE_URL_PREFIX + filename
+    _written[digest] = url
+    return url
+
+
+def _read_page_manifest(page: str) -> List[str]:
+    try:
+        return json.loads((BUNDLE_DIR / f"{page}{MANIFEST_SUFFIX}").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+
+
+def _persist_page_manifest(page: str, urls: List[str]) -> None:
+    """Record the page's bundle files on disk; files it stops using start their retention now"""
+    filenames = [url.rsplit("/", 1)[-1] for url in urls]
+    previous = _read_page_manifest(page)
+    if previous == filenames:
+        return
+    _write_atomic(BUNDLE_DIR / f"{page}{MANIFEST_SUFFIX}", json.dumps(filenames))
+    for name in set(previous) - set(filenames):
+        try:
+            os.utime(BUNDLE_DIR / name)
+        except OSError:
+            pass
+
+
+def externalize(html: str, page: str, scripts: bool = True) -> str:
+    """
+    Replace inline blocks in html with references to fingerprinted bundle files.
+    scripts=False keeps <script> blocks inline (pages that embed per-request values in JS).
+    """
+    urls: List[str] = []
+    index = 0
+
+    def replace(match: "re.Match") -> str:
+        nonlocal index
+        kind, content = match.group(1), match.group(2)
+        if kind == "script" and not scripts:
+            return match.group(0)
+        index += 1
+        url = _bundle_url(page, index, kind, content)
+        urls.append(url)
+        if kind == "style":
+            return f'<link rel="stylesheet" href="{url}">'
+        return f'<script src="{url}"></script>'
+
+    with _lock:
+        output = _INLINE_BLOCK.sub(replace, html)
+        if manifest.get(page) != urls:
+            manifest[page] = urls
+            try:
+                _persist_page_manifest(page, urls)
+            except OSError as exc:
+                logger.warning("Could not persist bundle manifest for %s: %s", page, exc)
+    return output
+
+
+def service_worker_source(template: str, page: str) -> str:
+    """Service worker script with the page's bundle URLs prepended to CORE_ASSETS"""
+    urls = manifest.get(page, [])
+    if not urls:
+        return template
+    entries = "".join(f"\n  {json.dumps(url)}," for url in urls)
+    return template.replace("const CORE_ASSETS = [", "const CORE_ASSETS = [" + entries, 1)
+
+
+def prune_stale_bundles() -> int:
+    """
+    Delete old bundle files that no page references (left by earlier deploys). Pages
+    not rendered by this process yet are covered by their persisted manifests.
+    """
+    if not BUNDLE_DIR.exists():
+        return 0
+    current = {url.rsplit("/", 1)[-1] for url in _written.values()}
+    for manifest_path in BUNDLE_DIR.glob(f"*{MANIFEST_SUFFIX}"):
+        current.update(_read_page_manifest(manifest_path.name[: -len(MANIFEST_SUFFIX)]))
+    cutoff = time.time() - BUNDLE_RETENTION_DAYS * 86400
+    removed = 0
+    for path in BUNDLE_DIR.iterdir():
+        if path.name in current or path.name.endswith(MANIFEST_SUFFIX):
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError as exc:
+            logger.warning("Could not remove stale bundle %s: %s", path, exc)
+    return removed
@@ -0,0 +1,148 @@
+"""
+Subject Inference Index for SwiftSync
+Guesses a lecture's subject from its filename when synced_items has no usable subject.
+Keywords are compiled into one regex and each subject's normalized name into a
+character-count map; the maps give an exact upper bound on each difflib score, so
+SequenceMatcher only runs for subjects that can still win. Results are memoized per
+filename; confident guesses are persisted into synced_items.subject by the lecture catalog.
+"""
+
+import difflib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+SUBJECT_INDEX_MEMO_SIZE = int(os.getenv("SUBJECT_INDEX_MEMO_SIZE", "4096"))
+# Fuzzy matches at or above this score are written to synced_items; keyword matches always are
+SUBJECT_PERSIST_MIN_SCORE = float(os.getenv("SUBJECT_PERSIST_MIN_SCORE", "0.8"))
+# Minimum SequenceMatcher ratio for a fuzzy match to count at all
+FUZZY_MIN_SCORE = 0.55
+
+# Subject -> filename keywords; earlier subjects win when several keywords appear
+SUBJECT_KEYWORDS: Dict[str, List[str]] = {
+    "Data Communication": ["data communication"],
+    "Database Design": ["database design", "db design"],
+    "Numerical Analysis and Probability": ["numerical analysis", "probability"],
+    "Object Oriented Programming": ["object oriented programming", "oop"],
+    "Software Design and Modelling with UML": ["software design", "uml"],
+    "Combinatorics and Graph Theory": ["combinatorics", "graph theory"],
+    "Database Principles": ["database principles"],
+    "Data Structures and Algorithms": ["data structures", "algorithms"],
+    "Mathematics III": ["mathematics iii", "math iii", "math 3"],
+    "Software Engineering Principles": ["software engineering"],
+    "Introduction to OOP": ["introduction to oop", "intro to oop"],
+}
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def _normalize(text: str) -> str:
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+class SubjectIndex:
+    """Keyword regex + per-subject character maps; infer() gives the same answer as the old linear scan"""
+
+    def __init__(self, subject_keywords: Dict[str, List[str]] = SUBJECT_KEYWORDS, memo_size: int = SUBJECT_INDEX_MEMO_SIZE):
+        self._priority = {subject: rank for rank, subject in enumerate(subject_keywords)}
+        self._keyword_subject = {}
+        for subject, keywords in subject_keywords.items():
+            for kw in keywords:
+                self._keyword_subject.setdefault(kw, subject)
+        # Lookahead finds every (overlapping) keyword occurrence; at one position the
+        # higher-priority subject's keyword is tried first
+        ordered = sorted(self._keyword_subject, key=lambda kw: self._priority[self._keyword_subject[kw]])
+        self._keyword_pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in ordered) + "))")
+
+        self._candidates: List[Tuple[str, str, Counter]] = []
+        for subject in subject_keywords:
+            norm = _normalize(subject)
+            if norm:
+                self._candidates.append((subject, norm, Counter(norm)))
+
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memo_hits": 0, "keyword": 0, "fuzzy": 0, "no_match": 0, "ratio_calls": 0, "pruned": 0}
+
+    def _keyword_match(self, name: str) -> Optional[str]:
+        best = None
+        for match in self._keyword_pattern.finditer(name):
+            subject = self._keyword_subject[match.group(1)]
+            if best is None or self._priority[subject] < self._priority[best]:
+                best = subject
+                if self._priority[best] == 0:
+                    break
+        return best
+
+    def _fuzzy_match(self, name: str) -> Tuple[Optional[str], float]:
+        normalized_name = _normalize(name)
+        if not normalized_name:
+            return None, 0.0
+        name_counts = Counter(normalized_name)
+        la = len(normalized_name)
+
+        # ratio() <= quick_ratio(): the shared-character count bounds each candidate's score.
+        # Visiting candidates best-bound first lets the loop stop at the first bound that can
+        # no longer win, instead of running SequenceMatcher against every subject.
+        bounded = []
+        for rank, (subject, candidate_norm, candidate_counts) in enumerate(self._candidates):
+            common = sum(min(count, name_counts[ch]) for ch, count in candidate_counts.items())
+            bound = 2.0 * common / (la + len(candidate_norm))
+            if bound >= FUZZY_MIN_SCORE:
+                bounded.append((-bound, rank, subject, candidate_norm))
+            else:
+                self.counters["pruned"] += 1
+        bounded.sort()
+
+        best_match = None
+        best_score = 0.0
+        best_rank = len(self._candidates)
+        for position, (negative_bound, rank, subject, candidate_norm) in enumerate(bounded):
+            # Ties go to the earlier subject, as in the original in-order scan
+            if -negative_bound < best_score or (-negative_bound == best_score and rank > best_rank):
+                self.counters["pruned"] += len(bounded) - position
+                break
+            self.counters["ratio_calls"] += 1
+            score = difflib.SequenceMatcher(None, normalized_name, candidate_norm).ratio()
+            if score > best_score or (score == best_score and rank < best_rank):
+                best_score = score
+                best_match = subject
+                best_rank = rank
+        if best_match and best_score >= FUZZY_MIN_SCORE:
+            return best_match, best_score
+        return None, 0.0
+
+    def infer(self, filename: str) -> Tuple[Optional[str], float]:
+        """(subject, confidence) for a filename; keyword matches score 1.0, (None, 0.0) when nothing fits"""
+        with self._lock:
+            cached = self._memo.get(filename)
+            if cached is not None:
+                self._memo.move_to_end(filename)
+                self.counters["memo_hits"] += 1
+                return cached
+
+        name = filename.lower()
+        subject = self._keyword_match(name)
+        if subject is not None:
+            result = (subject, 1.0)
+            kind = "keyword"
+        else:
+            result = self._fuzzy_match(name)
+            kind = "fuzzy" if result[0] else "no_match"
+
+        with self._lock:
+            self.counters[kind] += 1
+            self._memo[filename] = result
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "memo_entries": len(self._memo)}
+
+
+# Global instance (similar to change_events)
+subject_index = SubjectIndex()
@@ -2,7 +2,6 @@ import json
 import logging
 import os
 import re
-import sqlite3
 import pytz
 from datetime import datetime
 from pathlib import Path
@@ -13,6 +12,8 @@ from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 from auth import AuthClient, AuthConfig, AuthError
+from db_pool import read_connection, write_connection
+from migrations import run_migrations
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -77,33 +78,8 @@ def _get_semester_from_subject(subject: str) -> str:
 
 def _init_db() -> None:
     _ensure_dirs()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS synced_items (
-                id TEXT PRIMARY KEY,
-                downloaded_at TEXT DEFAULT (datetime('now')),
-                upload_date TEXT,
-                subject TEXT,
-                filename TEXT,
-                last_notified TEXT,
-                semester TEXT
-            )
-            """
-        )
-        # Add last_notified column if it doesn't exist (migration)
-        try:
-            conn.execute("ALTER TABLE synced_items ADD COLUMN last_notified TEXT")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        # Add semester column if it doesn't exist (migration)
-        try:
-            conn.execute("ALTER TABLE synced_items ADD COLUMN semester TEXT")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        conn.commit()
+    # No-op after the first call in this process
+    run_migrations(DB_PATH)
 
 
 def _seen(item_id: str) -> bool:
@@ -112,14 +88,14 @@ def _seen(item_id: str) -> bool:
     This prevents duplicate downloads and duplicate Telegram notifications
     when Render free tier wakes up from sleep.
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cur = conn.execute("SELECT 1 FROM synced_items WHERE id = ?", (item_id,))
         return cur.fetchone() is not None
 
 
 def _mark_seen(item_id: str, subject: str = None, filename: str = None, upload_date: str = None) -> None:
     semester = _get_semester_from_subject(subject) if subject else 'Spring Semester'
-    with sqlite3.connect(DB_PATH) as conn:
+    with write_connection(DB_PATH) as conn:
         conn.execute(
             "INSERT OR IGNORE INTO synced_items (id, subject, filename, upload_date, semester) VALUES (?, ?, ?, ?, ?)", 
             (item_id, subject, filename, upload_date, semester)
@@ -133,24 +109,26 @@ def _is_generic_subject(subject: str) -> bool:
 
 
 def _backfill_subject_for_seen_item(item_id: str, subject: str) -> None:
-    """Update subject metadata for previously-seen items that were saved as generic/empty."""
+    """Update subject metadata for previously-seen items saved as generic/empty or guessed from the filename."""
     clean_subject = (subject or "").strip()
     if not clean_subject or _is_generic_subject(clean_subject):
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.execute("SELECT subject FROM synced_items WHERE id = ?", (item_id,))
+    with write_connection(DB_PATH) as conn:
+        cur = conn.execute("SELECT subject, subject_inferred FROM synced_items WHERE id = ?", (item_id,))
         row = cur.fetchone()
         if not row:
             return
 
         existing_subject = (row[0] or "").strip()
         if existing_subject and not _is_generic_subject(existing_subject):
-            return
+            # A filename guess gives way to the portal's subject, which is otherwise left alone
+            if not row[1] or existing_subject == clean_subject:
+                return
 
         semester = _get_semester_from_subject(clean_subject)
         conn.execute(
-            "UPDATE synced_items SET subject = ?, semester = ? WHERE id = ?",
+            "UPDATE synced_items SET subject = ?, semester = ?, subject_inferred = 0 WHERE id = ?",
             (clean_subject, semester, item_id),
         )
         conn.commit()
@@ -162,7 +140,7 @@ def _was_notified(item_id: str) -> bool:
     Check if Telegram notification was already sent for this lecture.
     Prevents duplicate notifications when Render wakes from sleep.
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with read_connection(DB_PATH) as conn:
         cur = conn.execute("SELECT last_notified FROM synced_items WHERE id = ?", (item_id,))
         result = cur.fetchone()
         was_notified = result is not None and result[0] is not None
@@ -177,7 +155,7 @@ def _mark_notified(item_id: str) -> None:
     """
     Mark that a Telegram notification was sent for this lecture.
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with write_connection(DB_PATH) as conn:
         conn.execute(
             "UPDATE synced_items SET last_notified = datetime('now') WHERE id = ?",
             (item_id,)
@@ -0,0 +1,61 @@
+"""
+Leader Election Tests
+One lock holder at a time, and leader jobs that raise are restarted instead of
+ending leadership
+
+Usage:
+    python -m pytest -q test_leader_election.py
+    python test_leader_election.py
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from leader_election import LeaderElection
+
+
+def _lock_path() -> Path:
+    return Path(tempfile.mkdtemp()) / "leader.lock"
+
+
+def test_only_one_holder_until_released():
+    lock_path = _lock_path()
+    first, second = LeaderElection(lock_path, 0.01), LeaderElection(lock_path, 0.01)
+    assert first.try_acquire() and not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_failing_job_is_restarted_and_leadership_kept():
+    election = LeaderElection(_lock_path(), 0.01)
+    runs = {"flaky": 0, "once": 0}
+
+    async def flaky():
+        runs["flaky"] += 1
+        if runs["flaky"] < 3:
+            raise RuntimeError("portal down")
+        await asyncio.sleep(3600)
+
+    async def once():
+        runs["once"] += 1
+
+    async def scenario():
+        leader = asyncio.create_task(election.run_forever(lambda: [("flaky", flaky), ("once", once)]))
+        while runs["flaky"] < 3:
+            await asyncio.sleep(0.01)
+        assert election.is_leader and not leader.done()
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+    assert runs == {"flaky": 3, "once": 1}
+    assert election.counters["job_restarts"] == 2
+    assert not election.is_leader
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
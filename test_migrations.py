@@ -0,0 +1,130 @@
+"""
+Schema Migration Tests
+Fresh databases, upgrades with backfills, and startup while another worker holds the lock
+
+Usage:
+    python -m pytest -q test_migrations.py
+    python test_migrations.py
+"""
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import db_pool
+import migrations
+from migrations import LATEST_VERSION, MIGRATIONS, run_migrations
+
+
+def _temp_db() -> Path:
+    return Path(tempfile.mkdtemp()) / "lecture_sync.db"
+
+
+def _schema_version(db_path: Path) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+
+
+def _database_at_version(db_path: Path, version: int) -> None:
+    """A database as an older release left it: migrations up to version applied"""
+    with sqlite3.connect(db_path) as conn:
+        migrations.get_schema_version(conn)
+        for number, name, migrate in MIGRATIONS:
+            if number > version:
+                break
+            migrate(conn)
+            migrations._record_version(conn, number, name)
+
+
+def _version_of(name: str) -> int:
+    return next(number for number, migration_name, _ in MIGRATIONS if migration_name == name)
+
+
+def test_fresh_database_gets_every_migration_once():
+    db_path = _temp_db()
+    applied = run_migrations(db_path)
+    assert applied == [name for _, name, _ in MIGRATIONS]
+    assert _schema_version(db_path) == LATEST_VERSION
+    assert run_migrations(db_path) == []
+
+
+def test_backfills_run_in_batches_and_skip_unfillable_rows(monkeypatch):
+    db_path = _temp_db()
+    _database_at_version(db_path, 5)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO visitor_logs (ip_address, timestamp, action_performed, user_agent, path) VALUES (?, ?, 'visit', ?, '/')",
+            [("10.0.0.1", "2025-01-01T12:00:00+03:00", "Mozilla/5.0 (Linux; Android 14) Chrome/126.0")] * 25
+            + [("10.0.0.2", "not a timestamp", None)],
+        )
+    monkeypatch.setattr(migrations, "MIGRATION_BATCH_SIZE", 4)
+
+    run_migrations(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT ip_address, ts_epoch, device FROM visitor_logs ORDER BY id").fetchall()
+    assert all(epoch == 1735722000 and device for ip, epoch, device in rows if ip == "10.0.0.1")
+    # Unparseable timestamp / missing UA stay NULL and do not stall the batches
+    assert rows[-1] == ("10.0.0.2", None, None)
+    assert _schema_version(db_path) == LATEST_VERSION
+
+
+def test_threat_retention_uses_backfilled_epochs_and_drops_undated_rows(monkeypatch):
+    import database
+
+    db_path = _temp_db()
+    _database_at_version(db_path, _version_of("threat_logs_epoch") - 1)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO threat_logs (ip_address, threat_type, details, detected_at, action_taken) VALUES (?, 'XSS', '', ?, 'BLOCKED')",
+            [("10.0.0.1", "2025-01-01T12:00:00+03:00"), ("10.0.0.2", "garbled"), ("10.0.0.3", "2025-06-01T12:00:00+03:00")],
+        )
+    run_migrations(db_path)
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+
+    summary = database.rollup_and_prune_logs(now_epoch=1735722000 + database.THREAT_LOG_RETENTION_DAYS * 86400 + 86400)
+
+    assert summary["threat_rows_rolled"] == 1
+    assert summary["undated_rows_dropped"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT ip_address FROM threat_logs").fetchall() == [("10.0.0.3",)]
+        assert conn.execute("SELECT ip_address, detections FROM threat_daily_rollup").fetchall() == [("10.0.0.1", 1)]
+
+
+def test_waits_for_a_locked_database_then_migrates(monkeypatch):
+    db_path = _temp_db()
+    monkeypatch.setattr(db_pool, "SQLITE_BUSY_TIMEOUT_MS", 100)
+    monkeypatch.setattr(migrations, "MIGRATION_WAIT_SECONDS", 30)
+    blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    threading.Timer(1.5, blocker.rollback).start()
+
+    started = time.monotonic()
+    run_migrations(db_path)
+    assert time.monotonic() - started >= 1.0
+    assert _schema_version(db_path) == LATEST_VERSION
+    blocker.close()
+
+
+def test_gives_up_when_the_lock_is_never_released(monkeypatch):
+    db_path = _temp_db()
+    monkeypatch.setattr(db_pool, "SQLITE_BUSY_TIMEOUT_MS", 100)
+    monkeypatch.setattr(migrations, "MIGRATION_WAIT_SECONDS", 0.5)
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        run_migrations(db_path)
+    except sqlite3.OperationalError as exc:
+        assert migrations._is_locked(exc)
+    else:
+        raise AssertionError("run_migrations returned on a locked database")
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+
+if __name__ == "__main__":
+    import pytest
+
+    raise SystemExit(pytest.main(["-q", __file__]))
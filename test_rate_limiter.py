@@ -0,0 +1,96 @@
+"""
+Rate Limiter Tests
+Sliding-window limits, rejected hits staying counted, LRU bounds, and counters shared
+between workers through SQLite
+
+Usage:
+    python -m pytest -q test_rate_limiter.py
+    python test_rate_limiter.py
+"""
+import tempfile
+from pathlib import Path
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() for the limiter; starts at a window boundary"""
+    now = [1_700_000_040.0]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: now[0])
+    return now
+
+
+def _hits(limiter: RateLimiter, key: str, count: int, limit: int = 5) -> list:
+    return [limiter.hit(key, limit) for _ in range(count)]
+
+
+def test_limit_applies_per_key_within_the_window(clock):
+    limiter = RateLimiter("memory")
+    assert _hits(limiter, "203.0.113.7:sync-now", 6) == [False] * 5 + [True]
+    assert limiter.hit("203.0.113.8:sync-now", 5) is False
+
+
+def test_previous_window_is_weighted_by_elapsed_time(clock):
+    limiter = RateLimiter("memory")
+    _hits(limiter, "ip:zip", 4)
+    clock[0] += 60 + 45  # 3/4 into the next window: 4 * 0.25 = 1 still counts
+    assert _hits(limiter, "ip:zip", 5) == [False] * 4 + [True]
+
+
+def test_rejected_hits_keep_a_hammering_client_limited(clock):
+    limiter = RateLimiter("memory")
+    _hits(limiter, "ip:requests", 50)
+    clock[0] += 60 + 30  # half of the 50 (rejected included) still weigh in
+    assert limiter.hit("ip:requests", 5) is True
+    assert limiter.stats()["limited"] == 46
+
+
+def test_keys_are_bounded_and_idle_keys_expire(clock):
+    limiter = RateLimiter("memory", max_keys=3)
+    for index in range(5):
+        limiter.hit(f"10.0.0.{index}:requests", 5)
+    assert limiter.stats()["keys"] == 3 and limiter.stats()["evicted"] == 2
+    clock[0] += 120
+    limiter.hit("10.0.0.9:requests", 5)
+    assert limiter.stats()["keys"] == 1
+
+
+def test_workers_share_counts_through_sqlite(clock):
+    db_path = Path(tempfile.mkdtemp()) / "lecture_sync.db"
+    worker_a = RateLimiter("sqlite", db_path=db_path)
+    worker_b = RateLimiter("sqlite", db_path=db_path)
+    _hits(worker_a, "ip:sync-now", 3)
+    _hits(worker_b, "ip:sync-now", 1)
+    assert worker_a.sync_shared() == 1 and worker_b.sync_shared() == 1
+
+    # b now knows about a's 3 hits: 4 counted, so one more is allowed, then limited
+    assert _hits(worker_b, "ip:sync-now", 2) == [False, True]
+    worker_b.sync_shared()
+    # a pulls the totals for the keys it pushes: 3 + 3 from b + 1 more
+    worker_a.hit("ip:sync-now", 5)
+    worker_a.sync_shared()
+    assert worker_a.hit("ip:sync-now", 5) is True
+
+
+def test_failed_sync_keeps_hits_for_the_next_one(clock):
+    not_a_directory = Path(tempfile.mkdtemp()) / "file"
+    not_a_directory.write_text("")
+    limiter = RateLimiter("sqlite", db_path=not_a_directory / "lecture_sync.db")
+    _hits(limiter, "ip:zip", 2)
+    assert limiter.sync_shared() == 0
+    assert limiter.stats()["shared_errors"] == 1
+
+    limiter._db_path = Path(tempfile.mkdtemp()) / "lecture_sync.db"
+    assert limiter.sync_shared() == 1
+    other = RateLimiter("sqlite", db_path=limiter._db_path)
+    other.hit("ip:zip", 5)
+    other.sync_shared()
+    assert _hits(other, "ip:zip", 3, limit=4) == [False, True, True]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
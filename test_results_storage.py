@@ -0,0 +1,66 @@
+"""
+Results raw_text Storage Tests
+Codec round trips, what save_result writes to each column, and compaction of
+rows stored as plain text
+
+Usage:
+    python -m pytest -q test_results_storage.py
+    python test_results_storage.py
+"""
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import database
+from database import decode_raw_text, encode_raw_text
+from migrations import run_migrations
+
+NOTIFICATION = "Your result of quiz2 of Computer Architecture - Software_F_25-26 class is 8.5"
+
+
+def _temp_db(monkeypatch) -> Path:
+    db_path = Path(tempfile.mkdtemp()) / "lecture_sync.db"
+    run_migrations(db_path)
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    return db_path
+
+
+def test_round_trips_plain_and_packed_text():
+    for text in ("", "ok", NOTIFICATION, NOTIFICATION + " نەتیجەی تاقیکردنەوە بڵاوکرایەوە " * 3):
+        stored_text, packed = encode_raw_text(text)
+        assert decode_raw_text(stored_text, packed) == text
+        if packed is not None:
+            assert stored_text == "" and len(packed) < len(text.encode("utf-8"))
+
+
+def test_short_text_is_not_packed():
+    assert encode_raw_text("ok") == ("ok", None)
+
+
+def test_save_result_keeps_raw_text_a_text_column(monkeypatch):
+    db_path = _temp_db(monkeypatch)
+    parsed = {"subject": "Computer Architecture", "exam_type": "quiz2", "score": "8.5",
+              "semester": "Software_F_25-26", "raw_text": NOTIFICATION + " Please check the portal for details."}
+    assert database.save_result("S1", "S1:1", parsed)
+
+    with sqlite3.connect(db_path) as conn:
+        kinds = conn.execute("SELECT typeof(raw_text), typeof(raw_text_packed) FROM results").fetchone()
+    assert kinds == ("text", "blob")
+    assert database.get_student_results("S1")[0]["raw_text"] == parsed["raw_text"]
+
+
+def test_compaction_packs_legacy_plain_rows(monkeypatch):
+    db_path = _temp_db(monkeypatch)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO results (student_id, notification_id, raw_text, created_at, updated_at) VALUES ('S1', ?, ?, '', '')",
+            [(f"S1:{i}", NOTIFICATION) for i in range(7)] + [("S1:short", "ok")],
+        )
+    assert database.compact_results_raw_text(batch_size=3) == 7
+    assert sorted(row["raw_text"] for row in database.get_student_results("S1")) == sorted(["ok"] + [NOTIFICATION] * 7)
+
+
+if __name__ == "__main__":
+    import pytest
+
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -8,7 +8,6 @@ from database import (
     detect_suspicious_user_agent,
     detect_path_traversal,
     detect_command_injection,
-    detect_rate_limit_abuse
 )
 
 print("🔒 Security Detection Tests")
@@ -0,0 +1,83 @@
+"""
+Static Bundle Tests
+Concurrent bundle writes and pruning that keeps bundles of pages this process has
+not rendered yet
+
+Usage:
+    python -m pytest -q test_static_bundles.py
+    python test_static_bundles.py
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import static_bundles
+
+PAGE = "<html><style>body{color:red}</style><script>console.log(1)</script></html>"
+
+
+@pytest.fixture
+def bundle_dir(monkeypatch):
+    path = Path(tempfile.mkdtemp()) / "bundles"
+    monkeypatch.setattr(static_bundles, "BUNDLE_DIR", path)
+    monkeypatch.setattr(static_bundles, "manifest", {})
+    monkeypatch.setattr(static_bundles, "_written", {})
+    return path
+
+
+def _age(path: Path, days: int) -> None:
+    old = time.time() - days * 86400
+    os.utime(path, (old, old))
+
+
+def test_workers_writing_the_same_bundle_both_succeed(bundle_dir):
+    errors = []
+
+    def render():
+        try:
+            static_bundles._write_atomic(bundle_dir / "dashboard-1.abc.css", "body{color:red}")
+        except OSError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sorted(path.name for path in bundle_dir.iterdir()) == ["dashboard-1.abc.css"]
+
+
+def test_prune_keeps_bundles_of_pages_rendered_by_another_process(bundle_dir, monkeypatch):
+    static_bundles.externalize(PAGE, "admin")
+    admin_files = sorted(path.name for path in bundle_dir.iterdir() if path.suffix in (".css", ".js"))
+    leftover = bundle_dir / "dashboard-1.0000000000000000.css"
+    leftover.write_text("old deploy")
+    for path in bundle_dir.iterdir():
+        _age(path, static_bundles.BUNDLE_RETENTION_DAYS + 1)
+
+    # A fresh process that has rendered nothing yet
+    monkeypatch.setattr(static_bundles, "manifest", {})
+    monkeypatch.setattr(static_bundles, "_written", {})
+    assert static_bundles.prune_stale_bundles() == 1
+    assert not leftover.exists()
+    assert all((bundle_dir / name).exists() for name in admin_files)
+
+
+def test_bundles_a_page_stops_using_get_the_full_retention(bundle_dir):
+    static_bundles.externalize(PAGE, "admin")
+    old_files = [path for path in bundle_dir.iterdir() if path.suffix in (".css", ".js")]
+    for path in old_files:
+        _age(path, 30)
+
+    static_bundles.externalize(PAGE.replace("red", "blue"), "admin")
+    assert static_bundles.prune_stale_bundles() == 0
+    assert all(path.exists() for path in old_files)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
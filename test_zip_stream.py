@@ -0,0 +1,107 @@
+"""
+Streaming ZIP Tests
+Archive validity, byte ranges against the full archive, Range header parsing,
+member change detection and the shared CRC cache
+
+Usage:
+    python -m pytest -q test_zip_stream.py
+    python test_zip_stream.py
+"""
+import io
+import os
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+
+import pytest
+
+import lecture_catalog
+from zip_stream import ZipLayout, ZipMember, parse_single_range
+
+
+def _lecture_files(count: int = 3) -> list:
+    folder = Path(tempfile.mkdtemp())
+    paths = []
+    for index in range(count):
+        path = folder / f"lecture {index} - دەرس.pdf"
+        path.write_bytes(os.urandom(100_000 + index * 7_777))
+        paths.append(path)
+    return paths
+
+
+def _member(path: Path, arcname: str = None) -> ZipMember:
+    stat_result = os.stat(path)
+    return ZipMember(
+        arcname or path.name, path, stat_result.st_size, stat_result.st_mtime,
+        zlib.crc32(path.read_bytes()), stat_result.st_mtime_ns,
+    )
+
+
+def test_archive_opens_and_members_verify():
+    paths = _lecture_files()
+    layout = ZipLayout([_member(path, f"Subject/{path.name}") for path in paths])
+    archive = b"".join(layout.iter_bytes())
+
+    assert len(archive) == layout.size
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [f"Subject/{path.name}" for path in paths]
+        assert zf.read(f"Subject/{paths[1].name}") == paths[1].read_bytes()
+
+
+def test_any_byte_range_is_a_slice_of_the_full_archive():
+    layout = ZipLayout([_member(path) for path in _lecture_files()])
+    archive = b"".join(layout.iter_bytes())
+    # Inside headers, across member boundaries, inside the central directory, the last byte
+    for start, end in [(0, 10), (25, 100_050), (100_000, 200_000), (layout.size - 300, layout.size), (layout.size - 1, layout.size)]:
+        assert b"".join(layout.iter_bytes(start, end)) == archive[start:end]
+
+
+def test_parse_single_range():
+    assert parse_single_range(None, 1000) is None
+    assert parse_single_range("bytes=0-99", 1000) == (0, 100)
+    assert parse_single_range("bytes=900-", 1000) == (900, 1000)
+    assert parse_single_range("bytes=-100", 1000) == (900, 1000)
+    assert parse_single_range("bytes=990-5000", 1000) == (990, 1000)
+    # Multi-range and malformed headers fall back to the whole archive
+    assert parse_single_range("bytes=0-1,5-6", 1000) is None
+    assert parse_single_range("bytes=a-b", 1000) is None
+    with pytest.raises(ValueError):
+        parse_single_range("bytes=1000-", 1000)
+
+
+def test_same_size_rewrite_is_detected_before_its_bytes_are_sent():
+    paths = _lecture_files(2)
+    layout = ZipLayout([_member(path) for path in paths])
+    assert layout.is_current()
+
+    replacement = os.urandom(paths[1].stat().st_size)
+    paths[1].write_bytes(replacement)
+    os.utime(paths[1], ns=(0, paths[1].stat().st_mtime_ns + 1_000_000))
+    assert not layout.is_current()
+
+    sent = b""
+    with pytest.raises(IOError):
+        for chunk in layout.iter_bytes():
+            sent += chunk
+    # Everything up to the changed member went out, none of its new content did
+    assert replacement[:1000] not in sent
+    assert paths[0].read_bytes() in sent
+
+
+def test_crc_cache_survives_a_new_catalog_instance(monkeypatch):
+    monkeypatch.setattr(lecture_catalog, "DB_PATH", Path(tempfile.mkdtemp()) / "lecture_sync.db")
+    path = _lecture_files(1)[0]
+    stat_result = os.stat(path)
+
+    etag, crc = lecture_catalog.LectureCatalog().file_digest(path, stat_result)
+    assert crc == zlib.crc32(path.read_bytes())
+
+    # A restarted (or other) worker gets the stored digest without reading the file
+    monkeypatch.setattr(lecture_catalog, "open", lambda *args, **kwargs: pytest.fail("file was read again"), raising=False)
+    assert lecture_catalog.LectureCatalog().file_digest(path, stat_result) == (etag, crc)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,144 @@
+"""
+User-Agent Classification for SwiftSync
+Device type / OS / browser detection behind a bounded LRU cache keyed by a UA hash
+The same few dozen UA strings make up almost all traffic, so each is parsed once;
+visitor_logs.device stores the result at log time so readers never re-parse.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+UA_CACHE_SIZE = int(os.getenv("UA_CACHE_SIZE", "2048"))
+
+_ANDROID_VERSION = re.compile(r'android\s+([\d.]+)')
+_IOS_VERSION = re.compile(r'os\s+([\d_]+)')
+
+UNKNOWN_DEVICE = {"device": "Unknown", "os": "Unknown", "browser": "Unknown", "icon": "fa-question"}
+
+# Field order of the persisted visitor_logs.device value
+_DEVICE_FIELDS = ("device", "os", "browser", "icon")
+
+
+def _classify(ua_lower: str) -> Dict[str, str]:
+    # Detect Device Type
+    if any(token in ua_lower for token in ['bot', 'crawler', 'spider', 'scrapy', 'curl', 'wget', 'python-requests', 'postman']):
+        device = "Bot/Script"
+        icon = "fa-robot"
+    elif 'mobile' in ua_lower or 'android' in ua_lower or 'iphone' in ua_lower:
+        device = "Mobile"
+        icon = "fa-mobile-alt"
+    elif 'tablet' in ua_lower or 'ipad' in ua_lower:
+        device = "Tablet"
+        icon = "fa-tablet-alt"
+    else:
+        device = "Desktop"
+        icon = "fa-desktop"
+
+    # Detect Operating System
+    if 'windows nt 10' in ua_lower or 'windows nt 11' in ua_lower:
+        os_name = "Windows 11"
+    elif 'windows nt 6.3' in ua_lower:
+        os_name = "Windows 8.1"
+    elif 'windows nt 6.2' in ua_lower:
+        os_name = "Windows 8"
+    elif 'windows nt 6.1' in ua_lower:
+        os_name = "Windows 7"
+    elif 'windows' in ua_lower:
+        os_name = "Windows"
+    elif 'android' in ua_lower:
+        match = _ANDROID_VERSION.search(ua_lower)
+        version = match.group(1) if match else ''
+        os_name = f"Android {version}" if version else "Android"
+        icon = "fa-mobile-alt"
+    elif 'iphone' in ua_lower or 'ipad' in ua_lower:
+        match = _IOS_VERSION.search(ua_lower)
+        version = match.group(1).replace('_', '.') if match else ''
+        os_name = f"iOS {version}" if version else "iOS"
+        icon = "fa-apple"
+    elif 'mac os x' in ua_lower or 'macos' in ua_lower or 'macintosh' in ua_lower:
+        os_name = "macOS"
+        icon = "fa-apple"
+    elif 'linux' in ua_lower:
+        os_name = "Linux"
+    elif 'cros' in ua_lower:
+        os_name = "Chrome OS"
+    else:
+        os_name = "Unknown OS"
+
+    # Detect Browser
+    if 'edg/' in ua_lower or 'edge' in ua_lower:
+        browser = "Edge"
+    elif 'chrome' in ua_lower and 'safari' in ua_lower:
+        browser = "Chrome"
+    elif 'firefox' in ua_lower:
+        browser = "Firefox"
+    elif 'safari' in ua_lower and 'chrome' not in ua_lower:
+        browser = "Safari"
+    elif 'opera' in ua_lower or 'opr/' in ua_lower:
+        browser = "Opera"
+    elif 'msie' in ua_lower or 'trident' in ua_lower:
+        browser = "Internet Explorer"
+    else:
+        browser = "Unknown Browser"
+
+    return {"device": device, "os": os_name, "browser": browser, "icon": icon}
+
+
+class UserAgentCache:
+    """Bounded LRU of UA hash -> classification"""
+
+    def __init__(self, max_entries: int = UA_CACHE_SIZE):
+        self.max_entries = max_entries
+        # 16-byte digests keep memory flat no matter how long the UA strings are
+        self._entries: "OrderedDict[bytes, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, user_agent: str) -> Dict[str, str]:
+        """Classification of a raw UA string (a fresh dict the caller may modify)"""
+        if not user_agent:
+            return dict(UNKNOWN_DEVICE)
+        key = hashlib.blake2b(user_agent.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(result)
+            self.misses += 1
+        result = _classify(user_agent.lower())
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def encode_device(info: Dict[str, str]) -> str:
+    """Classification -> visitor_logs.device value ("Mobile|Android 14|Chrome|fa-mobile-alt")"""
+    return "|".join(info[field].replace("|", "/") for field in _DEVICE_FIELDS)
+
+
+def decode_device(value: Optional[str]) -> Optional[Dict[str, str]]:
+    """visitor_logs.device value -> classification, or None for rows logged before the column"""
+    parts = (value or "").split("|")
+    if len(parts) != len(_DEVICE_FIELDS):
+        return None
+    return dict(zip(_DEVICE_FIELDS, parts))
+
+
+def device_for_log(user_agent: Optional[str]) -> Optional[str]:
+    """Value to store in visitor_logs.device for a raw UA (NULL when no UA was sent)"""
+    return encode_device(ua_cache.classify(user_agent)) if user_agent else None
+
+
+# Global instance (similar to change_events)
+ua_cache = UserAgentCache()
@@ -0,0 +1,156 @@
+"""
+Streaming ZIP Archives for SwiftSync
+Builds a ZIP of lecture files on the fly: members are STORED (PDF/PPTX are already
+compressed) and every CRC and size is known up front, so the whole byte layout is
+computed before streaming. That gives an exact Content-Length, a strong ETag and
+byte-range resumption without temp files or buffering the archive. Each member is
+checked against the (size, mtime) its CRC was computed for before it is streamed.
+Classic ZIP only (no ZIP64): at most 65,535 members and 4 GiB per archive.
+"""
+
+import hashlib
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+_VERSION = 20
+_UTF8_FLAG = 0x0800
+_STORED = 0
+_MAX_CLASSIC = 0xFFFFFFFF
+
+
+class ZipTooLarge(ValueError):
+    """Archive would need ZIP64 (too many members or too many bytes)"""
+
+
+class ZipMember(NamedTuple):
+    arcname: str
+    path: Path
+    size: int
+    mtime: float
+    crc: int
+    # st_mtime_ns the CRC belongs to; None skips the change check
+    mtime_ns: Optional[int] = None
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    # UTC so every worker (whatever its TZ) produces identical bytes
+    t = time.gmtime(max(mtime, 315532800))  # DOS dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+# A segment is either literal header bytes or (path, length, mtime_ns) of a member's data
+_Segment = Union[bytes, Tuple[Path, int, Optional[int]]]
+
+
+class ZipLayout:
+    """Byte layout of a STORED archive: total size, ETag, and a reader for any byte range"""
+
+    def __init__(self, members: List[ZipMember]):
+        if len(members) > 0xFFFF:
+            raise ZipTooLarge(f"{len(members)} files")
+        self.segments: List[_Segment] = []
+        central = bytearray()
+        offset = 0
+        for member in members:
+            name = member.arcname.encode("utf-8")
+            dos_time, dos_date = _dos_datetime(member.mtime)
+            local = _LOCAL_HEADER.pack(
+                0x04034B50, _VERSION, _UTF8_FLAG, _STORED, dos_time, dos_date,
+                member.crc, member.size, member.size, len(name), 0,
+            ) + name
+            central += _CENTRAL_HEADER.pack(
+                0x02014B50, _VERSION, _VERSION, _UTF8_FLAG, _STORED, dos_time, dos_date,
+                member.crc, member.size, member.size, len(name), 0, 0, 0, 0, 0, offset,
+            ) + name
+            self.segments.append(local)
+            self.segments.append((member.path, member.size, member.mtime_ns))
+            offset += len(local) + member.size
+            if offset > _MAX_CLASSIC:
+                raise ZipTooLarge(f"{offset} bytes")
+        central += _END_OF_CENTRAL_DIR.pack(0x06054B50, 0, 0, len(members), len(members), len(central), offset, 0)
+        self.segments.append(bytes(central))
+        self.size = offset + len(central)
+        # The central directory covers every name, CRC, size, date and offset in the archive
+        self.etag = f'"{hashlib.sha256(central).hexdigest()[:32]}"'
+
+    def is_current(self) -> bool:
+        """True when every member file still has the size and mtime the layout was built from"""
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                continue
+            path, size, mtime_ns = segment
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                return False
+            if not _matches(stat_result, size, mtime_ns):
+                return False
+        return True
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Archive bytes [start, end); reads member files in CHUNK_SIZE pieces"""
+        end = self.size if end is None else end
+        position = 0
+        for segment in self.segments:
+            length = len(segment) if isinstance(segment, bytes) else segment[1]
+            segment_start, segment_end = position, position + length
+            position = segment_end
+            if segment_end <= start:
+                continue
+            if segment_start >= end:
+                break
+            lo, hi = max(start, segment_start) - segment_start, min(end, segment_end) - segment_start
+            if isinstance(segment, bytes):
+                yield segment[lo:hi]
+                continue
+            with open(segment[0], "rb") as file:
+                # Replaced since the layout was built: stop before sending bytes that do not
+                # match the CRC already in the archive (a resume with If-Range gets the new one)
+                if not _matches(os.fstat(file.fileno()), segment[1], segment[2]):
+                    raise IOError(f"{segment[0]} changed since the archive layout was built")
+                file.seek(lo)
+                remaining = hi - lo
+                while remaining > 0:
+                    chunk = file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        # File shrank since the layout was built; the ETag no longer matches anyway
+                        raise IOError(f"{segment[0]} changed while streaming")
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+def _matches(stat_result: os.stat_result, size: int, mtime_ns: Optional[int]) -> bool:
+    return stat_result.st_size == size and (mtime_ns is None or stat_result.st_mtime_ns == mtime_ns)
+
+
+def parse_single_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) for a single "bytes=" range, end exclusive.
+    None means serve the whole archive (no, malformed or multi-range header);
+    raises ValueError when the range lies outside the archive (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, separator, last = header[len("bytes="):].strip().partition("-")
+    if not separator or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        return max(size - suffix, 0), size
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if last and end <= start:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size)